@@ -209,7 +209,6 @@ class PlotData(object):
         return res
 
     def _plot_children(self, axis, plotflag, kwds):
-        axis.hold('on')
         tmp = []
         child_args = kwds.pop('plot_args_children',
                               tuple(self.plot_args_children))
@@ -371,7 +370,7 @@ class Plotter_1d(object):
         x = wdata.args
         data = transformdata_1d(x, wdata.data, plotflag)
         dataCI = getattr(wdata, 'dataCI', ())
-        if dataCI:
+        if np.size(dataCI):
             dataCI = transformdata_1d(x, dataCI, plotflag)
         h1 = plot1d(axis, x, data, dataCI, plotflag, *args, **kwds)
         return h1
@@ -413,7 +412,6 @@ def plot1d(axis, args, data, dataCI, plotflag, *varargin, **kwds):
         plotfun = getattr(axis, fun)
         h.extend(plotfun(args, data, *varargin, **kwds))
         if np.any(dataCI) and plottype < 3:
-            axis.hold(True)
             h.extend(plotfun(args, dataCI, 'r--'))
     elif plottype == 4:
         h = axis.errorbar(args, data,
@@ -1,12 +1,18 @@
 from __future__ import absolute_import
 from numpy import (r_, minimum, maximum, atleast_1d, atleast_2d, mod, ones,
-                   floor, random, eye, nonzero, where, repeat, sqrt, exp, inf,
-                   diag, zeros, sin, arcsin, nan)
+                   floor, random, eye, nonzero, repeat, sqrt, exp, inf,
+                   diag, zeros)
 from numpy import triu
 from scipy.special import ndtr as cdfnorm, ndtri as invnorm
 from scipy.special import erfc
+from scipy import special, linalg
 import warnings
 import numpy as np
+from wafo.misc import check_random_state
+from wafo.numba_misc import (_prbnormnd_lattice, _rind_lattice,
+                             _prbnormndpc_gauss,
+                             _cdfnorm2d, _cdfnorm2d_parallel,
+                             _prbnorm2d_ufunc, _prbnorm2d_parallel)
 
 try:
     from wafo import mvn  # @UnresolvedImport
@@ -217,23 +223,39 @@ class Rind(object):
             number of times to use the regression equation to restrict
             integration area. Nc1c2 = 1,2 is recommended. (default 2)
             (note: works only for method >0)
+        engine : 'fortran' or 'numba', optional
+            'fortran' uses the compiled rindmod, which keeps the parameters in
+            global variables and therefore is not re-entrant. 'numba'
+            conditions on Xc by regression and integrates [Xt, Xd] with
+            randomly shifted lattice rules for all methods. It keeps the
+            parameters in the instance and releases the GIL, and is used by
+            default if rindmod is not available.
+        num_workers : scalar integer, optional
+            number of threads used by the numba engine (default 1).
+            None means the number of processors.
         """
         self.method = 3
         self.xcscale = 0
         self.abseps = 0
-        self.releps = 1e-3,
+        self.releps = 1e-3
         self.coveps = 1e-10
         self.maxpts = 40000
         self.minpts = 0
         self.seed = None
-        self.nit = 1000,
+        self.nit = 1000
         self.xcutoff = None
         self.xsplit = 1.5
         self.quadno = 2
         self.speed = None
         self.nc1c2 = 2
+        self.engine = None
+        self.num_workers = 1
 
         self.__dict__.update(**kwds)
+        if self.engine is None:
+            self.engine = 'numba' if rindmod is None else 'fortran'
+        if self.engine not in ('fortran', 'numba'):
+            raise ValueError("engine must be 'fortran' or 'numba'")
         self.initialize(self.speed)
         self.set_constants()
 
@@ -308,7 +330,7 @@ class Rind(object):
             # self.abseps  = max(self.abseps- truncError,0);
             # self.releps  = max(self.releps- truncError,0);
 
-        if self.method > 0:
+        if self.method > 0 and self.engine == 'fortran':
             names = ['method', 'xcscale', 'abseps', 'releps', 'coveps',
                      'maxpts', 'minpts', 'nit', 'xcutoff', 'nc1c2', 'quadno',
                      'xsplit']
@@ -321,10 +343,61 @@ class Rind(object):
         if any(kwds):
             self.__dict__.update(**kwds)
             self.set_constants()
+        return self._rind(cov, m, ab, bb, indI, xc, nt, self.num_workers)
+
+    def batch(self, problems, num_workers=None):
+        """
+        Return expectations for a sequence of problems.
+
+        Parameters
+        ----------
+        problems : sequence of tuples
+            the positional arguments (S, m, Blo, Bup[, indI, xc, Nt]) of each
+            problem.
+        num_workers : scalar integer, optional
+            number of threads evaluating the problems in parallel
+            (default self.num_workers). None means the number of processors.
+            The problems are evaluated one at a time by the fortran engine.
+
+        Returns
+        -------
+        results : list
+            the tuple (val, err, terr) for each problem.
+
+        Examples
+        --------
+        >>> import wafo.gaussian as wg
+        >>> import numpy as np
+        >>> Sc = [[1, 0.3], [0.3, 1]]
+        >>> problems = [(Sc, [0, 0], 0, np.inf, [-1, 1], None, nt)
+        ...             for nt in (2, 0)]
+        >>> rind = wg.Rind(engine='numba', seed=1)
+        >>> (E0, err0, _), (E1, err1, _) = rind.batch(problems, num_workers=2)
+        >>> np.allclose(E0, 0.298487, atol=1e-3), np.allclose(E1, 0.241372,
+        ...                                                   atol=1e-3)
+        (True, True)
+        """
+        problems = list(problems)
+        if num_workers is None:
+            num_workers = self.num_workers
+        if self.engine == 'fortran':
+            num_workers = 1
+        results = [None] * len(problems)
+
+        def solve(rows):
+            for i in range(len(problems))[rows]:
+                results[i] = self._rind(*problems[i], num_workers=1)
+        _run_threaded(solve, len(problems), num_workers,
+                      num_slices=len(problems))
+        return results
+
+    def _rind(self, cov, m, ab, bb, indI=None, xc=None, nt=None,
+              num_workers=1):
         if xc is None:
             xc = zeros((0, 1))
 
-        big, b_lo, b_up, xc = atleast_2d(cov, ab, bb, xc)
+        big, b_lo, b_up, xc = atleast_2d(*[np.asarray(x, dtype=float)
+                                           for x in (cov, ab, bb, xc)])
         b_lo = b_lo.copy()
         b_up = b_up.copy()
 
@@ -342,11 +415,8 @@ class Rind(object):
                 raise ValueError('Inconsistent size of b_lo and b_up')
             indI = r_[-1:Ntd]
 
-        Ex, indI = atleast_1d(m, indI)
-        if self.seed is None:
-            seed = int(floor(random.rand(1) * 1e10))  # @UndefinedVariable
-        else:
-            seed = int(self.seed)
+        Ex, indI = atleast_1d(np.asarray(m, dtype=float),
+                              np.asarray(indI, dtype=int))
 
         #   INFIN  = INTEGER, array of integration limits flags:  size 1 x Nb
         #            if INFIN(I) < 0, Ith limits are (-infinity, infinity);
@@ -362,8 +432,23 @@ class Rind(object):
 
         b_up[0, ind] = minimum(b_up[0, ind], infinity * dev[indI[ind + 1]])
         b_lo[0, ind] = maximum(b_lo[0, ind], -infinity * dev[indI[ind + 1]])
-        ind2 = indI + 1
 
+        if self.engine == 'numba':
+            h_lo, h_up = _rind_limits(b_lo, b_up, indI, infin, xc)
+            if self.nit < nt:
+                # Only the first nit Xt variables are restricted
+                h_lo[:, self.nit:nt] = -inf
+                h_up[:, self.nit:nt] = inf
+            return _rind_qmc(big, Ex, xc, nt, h_lo, h_up, self.xcscale,
+                             self.abseps, self.releps, self.coveps,
+                             self.maxpts, num_workers,
+                             check_random_state(self.seed))
+
+        if self.seed is None:
+            seed = int(floor(random.rand(1) * 1e10))  # @UndefinedVariable
+        else:
+            seed = int(self.seed)
+        ind2 = indI + 1
         return rindmod.rind(big, Ex, xc, nt, ind2, b_lo, b_up, infin, seed)
 
 
@@ -373,7 +458,7 @@ def test_rind():
     n = 5
     Blo = -inf
     Bup = -1.2
-    indI = [-1, n - 1]  # Barriers
+    indI = np.array([-1, n - 1], dtype=int)  # Barriers
     # A = np.repeat(Blo, n)
     # B = np.repeat(Bup, n)  # Integration limits
     m = zeros(n)
@@ -455,7 +540,313 @@ def cdflomax(x, alpha, m0):
     return cdfnorm(c1) - alpha * exp(-x ** 2 / 2 / m0) * cdfnorm(c2)
 
 
-def prbnormtndpc(rho, a, b, d=None, df=0, abseps=1e-4, ierc=0, hnc=0.24):
+_GL10 = np.polynomial.legendre.leggauss(10)
+_GL20 = np.polynomial.legendre.leggauss(20)
+_XMAX = 8.5  # the product correlation integrals are truncated to |z| < _XMAX
+_QMC_NUM_SHIFTS = 10
+# probability panels for the integration over the chi distribution
+_CHI_PANELS = np.array([0, 1e-8, 1e-6, 1e-4, 1e-3, 1e-2, 0.05, 0.2, 0.5, 0.8,
+                        0.95, 0.99, 0.999, 1 - 1e-4, 1 - 1e-6, 1 - 1e-8, 1])
+
+
+def _batch_limits(a, b, n):
+    """Return integration limits as contiguous arrays, shape (num_limits, n).
+    """
+    a, b = np.broadcast_arrays(atleast_2d(np.asarray(a, dtype=float)),
+                               atleast_2d(np.asarray(b, dtype=float)))
+    if a.ndim != 2 or a.shape[1] != n:
+        raise ValueError('Size of input is inconsistent!')
+    return np.ascontiguousarray(a), np.ascontiguousarray(b)
+
+
+def _is_batch(a, b):
+    return np.ndim(a) > 1 or np.ndim(b) > 1
+
+
+def _unbatch(a, b, results):
+    """Return scalar results if the limits were given as vectors."""
+    if _is_batch(a, b):
+        return results
+    return tuple(result[0] for result in results)
+
+
+def _run_threaded(fun, num_rows, num_workers, num_slices=None):
+    """Call fun(rows) for slices of rows, in parallel threads if
+    num_workers > 1. The numba kernels release the GIL.
+
+    The rows are split into num_slices slices (default num_workers), which
+    are handed to the threads one at a time.
+    """
+    if num_workers is None:
+        import multiprocessing
+        num_workers = multiprocessing.cpu_count()
+    num_workers = max(min(num_workers, num_rows), 1)
+    if num_slices is None:
+        num_slices = num_workers
+    num_slices = max(min(num_slices, num_rows), 1)
+    bounds = np.linspace(0, num_rows, num_slices + 1).astype(int)
+    slices = [slice(i, j) for i, j in zip(bounds[:-1], bounds[1:])]
+    if num_workers == 1:
+        for rows in slices:
+            fun(rows)
+        return
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(num_workers)
+    try:
+        pool.map(fun, slices, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _primes(num):
+    """Return the first num prime numbers."""
+    primes = []
+    candidate = 2
+    while len(primes) < num:
+        if all(candidate % p for p in primes if p * p <= candidate):
+            primes.append(candidate)
+        candidate += 1
+    return np.array(primes, dtype=float)
+
+
+def _chol_semidefinite(correl):
+    """Return lower triangular L so that L L' = correl.
+
+    Columns with a zero pivot, i.e., variables that are linear combinations
+    of the previous ones, are set to zero.
+    """
+    n = correl.shape[0]
+    chol = zeros((n, n))
+    tol = 1e-12 * n
+    for j in range(n):
+        pivot = correl[j, j] - np.dot(chol[j, :j], chol[j, :j])
+        if pivot > tol:
+            chol[j, j] = sqrt(pivot)
+            chol[j + 1:, j] = (correl[j + 1:, j] -
+                               np.dot(chol[j + 1:, :j], chol[j, :j])
+                               ) / chol[j, j]
+        elif pivot < -sqrt(tol):
+            raise ValueError('The correlation matrix is not positive '
+                             'semidefinite')
+    return chol
+
+
+def _chol_pivoted(cov, tol):
+    """Return lower triangular L and permutation p so that
+    L L' = cov[p][:, p].
+
+    The variable with the largest conditional variance is taken first. When
+    all the remaining conditional variances are below tol, the remaining
+    variables are taken as linear combinations of the previous ones.
+    """
+    n = cov.shape[0]
+    chol = zeros((n, n))
+    perm = np.arange(n)
+    pivots = diag(cov).copy()
+    for j in range(n):
+        k = j + np.argmax(pivots[j:])
+        if k != j:
+            perm[[j, k]] = perm[[k, j]]
+            pivots[[j, k]] = pivots[[k, j]]
+            chol[[j, k], :j] = chol[[k, j], :j]
+        if pivots[j] <= tol:
+            break
+        chol[j, j] = sqrt(pivots[j])
+        chol[j + 1:, j] = (cov[perm[j + 1:], perm[j]] -
+                           np.dot(chol[j + 1:, :j], chol[j, :j])) / chol[j, j]
+        pivots[j + 1:] -= chol[j + 1:, j] ** 2
+    return chol, perm
+
+
+def _lattice_qmc(kernel, num_dims, num_limits, abseps, releps, maxpts,
+                 num_workers, random_state, scale=1.0):
+    """Integrate over the unit cube with randomly shifted rank-1 (Richtmyer)
+    lattice rules for many integrands.
+
+    kernel(index, q, shifts, start, num_points, out) must store the mean of
+    the integrands index over the points k = start, ..., start + num_points - 1
+    of the lattice k * q shifted by shifts[j] in out[:, j]. The number of
+    points is doubled until the error estimate of the integrals times scale
+    is below the tolerance or maxpts is reached.
+    """
+    num_shifts = _QMC_NUM_SHIFTS
+    q = np.sqrt(_primes(num_dims)) % 1
+    shifts = check_random_state(random_state).random_sample((num_shifts,
+                                                             num_dims))
+    # 99% confidence level of the mean of the shifted rules
+    factor = special.stdtrit(num_shifts - 1, 0.995) / sqrt(num_shifts)
+    max_points = max(int(maxpts) // num_shifts, 1)
+    scale = np.broadcast_to(scale, (num_limits,))
+
+    means = zeros((num_limits, num_shifts))
+    val = zeros(num_limits)
+    err = zeros(num_limits)
+    inform = np.ones(num_limits, dtype=int)
+    todo = np.arange(num_limits)
+    start, num_points = 0, min(max(10 * (num_dims + 1), 64), max_points)
+    while todo.size and num_points > 0:
+        out = np.empty((todo.size, num_shifts))
+
+        def work(rows):
+            kernel(todo[rows], q, shifts, start, num_points, out[rows])
+        _run_threaded(work, todo.size, num_workers)
+        means[todo] = (means[todo] * start + out * num_points) / (start +
+                                                                  num_points)
+        start += num_points
+        val[todo] = scale[todo] * means[todo].mean(axis=1)
+        err[todo] = scale[todo] * factor * means[todo].std(axis=1, ddof=1)
+        done = err[todo] <= np.maximum(abseps, releps * np.abs(val[todo]))
+        inform[todo[done]] = 0
+        todo = todo[~done]
+        num_points = min(start, max_points - start)
+    return val, err, inform
+
+
+def _prbnormnd_qmc(correl, a, b, abseps, releps, maxpts, num_workers,
+                   random_state):
+    """Return multivariate normal probabilities for many integration limits.
+
+    The correlation matrix is factorized once and the separation-of-variables
+    integrand of Genz (1992) is integrated with randomly shifted rank-1
+    lattice rules.
+    """
+    chol = _chol_semidefinite(correl)
+
+    def kernel(index, q, shifts, start, num_points, out):
+        _prbnormnd_lattice(chol, a[index], b[index], q, shifts, start,
+                           num_points, out)
+    return _lattice_qmc(kernel, chol.shape[0] - 1, a.shape[0], abseps, releps,
+                        maxpts, num_workers, random_state)
+
+
+def _rind_limits(b_lo, b_up, indI, infin, xc):
+    """Return the integration limits Hlo and Hup, shape Nx x Ntd."""
+    mb = b_lo.shape[0]
+    shape = (xc.shape[1], indI[-1] + 1)
+    h_lo = np.empty(shape)
+    h_up = np.empty(shape)
+    for j in range(len(indI) - 1):
+        rows = slice(indI[j] + 1, indI[j + 1] + 1)
+        if infin[j] > 0:
+            h_lo[:, rows] = (b_lo[0, j] +
+                             np.dot(b_lo[1:mb, j], xc[:mb - 1]))[:, None]
+        else:
+            h_lo[:, rows] = -inf
+        if infin[j] % 2 == 0:
+            h_up[:, rows] = (b_up[0, j] +
+                             np.dot(b_up[1:mb, j], xc[:mb - 1]))[:, None]
+        else:
+            h_up[:, rows] = inf
+    return h_lo, h_up
+
+
+def _rind_qmc(big, ex, xc, nt, h_lo, h_up, xcscale, abseps, releps, coveps,
+              maxpts, num_workers, random_state):
+    """Return Rind expectations by randomized lattice rules.
+
+    [Xt, Xd] is conditioned on Xc = xc by regression and the Jacobian
+    |Xd(1)*...*Xd(Nd)| is included in the separation-of-variables integrand.
+    Only the upper triangular part of big is used.
+    """
+    cov = triu(big) + triu(big, 1).T
+    ntd = h_lo.shape[1]
+    nc, nx = xc.shape
+    mu = np.repeat(ex[:ntd, None], nx, axis=1)
+    log_fxc = np.repeat(float(xcscale), nx)
+    s_td = cov[:ntd, :ntd]
+    if nc > 0:
+        try:
+            chol_c = np.linalg.cholesky(cov[ntd:, ntd:])
+        except np.linalg.LinAlgError:
+            raise ValueError('The covariance matrix of Xc must be positive '
+                             'definite')
+        z = linalg.solve_triangular(chol_c, xc - ex[ntd:, None], lower=True)
+        w = linalg.solve_triangular(chol_c, cov[ntd:, :ntd], lower=True)
+        s_td = s_td - np.dot(w.T, w)
+        mu += np.dot(w.T, z)
+        log_fxc -= (0.5 * (z ** 2).sum(axis=0) + np.log(diag(chol_c)).sum() +
+                    0.5 * nc * np.log(2 * np.pi))
+    fxc = exp(log_fxc)
+    if ntd == 0:
+        return fxc, zeros(nx), zeros(nx)
+
+    tol = coveps * max(diag(s_td).max(), 0)
+    chol, perm = _chol_pivoted(s_td, tol)
+    mu = np.ascontiguousarray(mu.T[:, perm])
+    a = np.ascontiguousarray(h_lo[:, perm]) - mu
+    b = np.ascontiguousarray(h_up[:, perm]) - mu
+    jac = perm >= nt
+
+    def kernel(index, q, shifts, start, num_points, out):
+        _rind_lattice(chol, a[index], b[index], mu[index], jac, q, shifts,
+                      start, num_points, out)
+    val, err, _inform = _lattice_qmc(kernel, ntd, nx, abseps, releps, maxpts,
+                                     num_workers, random_state, scale=fxc)
+    return val, err, zeros(nx)
+
+
+def _prbnormndpc_batch(rho, a, b, abserr, relerr, num_workers, limit=2000):
+    rho = np.asarray(rho, dtype=float).ravel()
+    a, b = _batch_limits(a, b, rho.size)
+    num_limits = a.shape[0]
+    val = zeros(num_limits)
+    err = zeros(num_limits)
+    inform = zeros(num_limits, dtype=np.int64)
+
+    def kernel(rows):
+        _prbnormndpc_gauss(rho, a[rows], b[rows], _GL20[0], _GL20[1],
+                           _GL10[0], _GL10[1], _XMAX, abserr, relerr, limit,
+                           val[rows], err[rows], inform[rows])
+    _run_threaded(kernel, num_limits, num_workers)
+    return val, err, inform
+
+
+def _chi_nodes(df, x, w):
+    """Return nodes and weights for integrating over S = sqrt(W / df),
+    where W is chi-square distributed with df degrees of freedom.
+    """
+    lo, hi = _CHI_PANELS[:-1, None], _CHI_PANELS[1:, None]
+    u = 0.5 * (hi + lo) + 0.5 * (hi - lo) * x
+    weights = 0.5 * (hi - lo) * w
+    return sqrt(special.chdtri(df, u) / df).ravel(), weights.ravel()
+
+
+def _prbnormtndpc_batch(rho, a, b, df, abseps, num_workers):
+    """Return multivariate normal or T probabilities with product
+    correlation for many integration limits.
+
+    The T probabilities are P(a*S < Y < b*S), with Y normal, integrated over
+    S with composite Gauss-Legendre rules in the probability domain.
+    """
+    rho = np.asarray(rho, dtype=float).ravel()
+    a, b = _batch_limits(a, b, rho.size)
+    if df <= 0:
+        return _prbnormndpc_batch(rho, a, b, abseps, 0, num_workers)
+    s20, w20 = _chi_nodes(df, *_GL20)
+    s10, w10 = _chi_nodes(df, *_GL10)
+    s = np.hstack((s20, s10))
+    num_limits, n = a.shape
+    val = zeros(num_limits)
+    err = zeros(num_limits)
+    inform = zeros(num_limits, dtype=int)
+    step = max(2**16 // s.size, 1)
+    for i in range(0, num_limits, step):
+        rows = slice(i, i + step)
+        scaled = [(lim[rows, None, :] * s[:, None]).reshape(-1, n)
+                  for lim in (a, b)]
+        vals, errs, infos = [res.reshape(-1, s.size) for res in
+                             _prbnormndpc_batch(rho, scaled[0], scaled[1],
+                                                abseps, 0, num_workers)]
+        val[rows] = np.dot(vals[:, :s20.size], w20)
+        err[rows] = (np.abs(val[rows] - np.dot(vals[:, s20.size:], w10)) +
+                     np.dot(errs[:, :s20.size], w20))
+        inform[rows] = np.where(np.any(infos, axis=1), 7, 0)
+    return val, err, inform
+
+
+def prbnormtndpc(rho, a, b, d=None, df=0, abseps=1e-4, ierc=0, hnc=0.24,
+                 num_workers=1):
     """
     Return Multivariate normal or T probability with product correlation.
 
@@ -468,7 +859,8 @@ def prbnormtndpc(rho, a, b, d=None, df=0, abseps=1e-4, ierc=0, hnc=0.24):
     a,b : array-like
         vector of lower and upper integration limits, respectively.
         Note: any values greater the 37 in magnitude, are considered as
-        infinite values.
+        infinite values. Arrays of shape (num_limits, n) evaluate the
+        probabilities of many limits in one call (see Notes).
     d : array-like
         vector of means (default zeros(size(rho)))
     df = Degrees of freedom, NDF<=0 gives normal probabilities (default)
@@ -476,6 +868,7 @@ def prbnormtndpc(rho, a, b, d=None, df=0, abseps=1e-4, ierc=0, hnc=0.24):
     ierc   = 1 if strict error control based on fourth derivative
              0 if error control based on halving the intervals (default)
     hnc   = start interval width of simpson rule (default 0.24)
+    num_workers = number of threads used for batched limits (default 1)
 
     Returns
     -------
@@ -491,10 +884,18 @@ def prbnormtndpc(rho, a, b, d=None, df=0, abseps=1e-4, ierc=0, hnc=0.24):
         7, if subintervals are too narrow or too many
         8, if bounds exceeds abseps
 
+    Notes
+    -----
      PRBNORMTNDPC calculates multivariate normal or student T probability
      with product correlation structure for rectangular regions.
      The accuracy is as best around single precision, i.e., about 1e-7.
 
+     Batched limits (or a missing mvnprdmod extension) are integrated by
+     compiled adaptive Gauss-Legendre rules, where the T probabilities are
+     integrated over the chi distribution with composite rules. Then
+     ierc and hnc are ignored and value, bound and inform are arrays of
+     length num_limits.
+
     Example:
     --------
     >>> import wafo.gaussian as wg
@@ -533,6 +934,11 @@ def prbnormtndpc(rho, a, b, d=None, df=0, abseps=1e-4, ierc=0, hnc=0.24):
 
     if d is None:
         d = zeros(len(rho))
+    if _is_batch(a, b) or mvnprdmod is None:
+        results = _prbnormtndpc_batch(rho, np.subtract(a, d),
+                                      np.subtract(b, d), df, abseps,
+                                      num_workers)
+        return _unbatch(a, b, results)
     # Make sure integration limits are finite
     aa = np.clip(a - d, -100, 100)
     bb = np.clip(b - d, -100, 100)
@@ -541,7 +947,7 @@ def prbnormtndpc(rho, a, b, d=None, df=0, abseps=1e-4, ierc=0, hnc=0.24):
 
 
 def prbnormndpc(rho, a, b, abserr=1e-4, relerr=1e-4, usesimpson=True,
-                usebreakpoints=False):
+                usebreakpoints=False, num_workers=1):
     """
     Return Multivariate Normal probabilities with product correlation
 
@@ -551,8 +957,10 @@ def prbnormndpc(rho, a, b, abserr=1e-4, relerr=1e-4, usesimpson=True,
               corr(Xi,Xj) = rho(i)*rho(j) for i~=j
                           = 1             for i==j
                  -1 <= rho <= 1
-      a,b   = lower and upper integration limits respectively.
+      a,b   = lower and upper integration limits respectively, either
+              vectors of length n or arrays of shape (num_limits, n).
       tol   = requested absolute tolerance
+      num_workers = number of threads used for batched limits (default 1)
 
     Returns
     -------
@@ -563,6 +971,11 @@ def prbnormndpc(rho, a, b, abserr=1e-4, relerr=1e-4, usesimpson=True,
     with product correlation structure for rectangular regions.
     The accuracy is up to almost double precision, i.e., about 1e-14.
 
+    Batched limits (or a missing mvnprdmod extension) are integrated by a
+    compiled adaptive Gauss-Legendre rule with breakpoints where the
+    integrand changes rapidly. Then usesimpson and usebreakpoints are
+    ignored and value, error and ier are arrays of length num_limits.
+
     Example:
     -------
     >>> import wafo.gaussian as wg
@@ -601,6 +1014,13 @@ def prbnormndpc(rho, a, b, abserr=1e-4, relerr=1e-4, usesimpson=True,
     Trondheim, Norway.
 
     """
+    if _is_batch(a, b) or mvnprdmod is None:
+        val, err, ier = _prbnormndpc_batch(rho, a, b, abserr, relerr,
+                                           num_workers)
+        if np.any(ier > 0):
+            warnings.warn('Abnormal termination ier = 1 for %d limits\n\n%s'
+                          % (np.sum(ier > 0), _ERRORMESSAGE[1]))
+        return _unbatch(a, b, (val, err, ier))
     # Call fortran implementation
     val, err, ier = mvnprdmod.prbnormndpc(rho, a, b, abserr, relerr,
                                           usebreakpoints, usesimpson)
@@ -647,15 +1067,18 @@ _ERRORMESSAGE[6] = """the input is invalid because:
         4) limit < npts2."""
 
 
-def prbnormnd(correl, a, b, abseps=1e-4, releps=1e-3, maxpts=None, method=0):
+def prbnormnd(correl, a, b, abseps=1e-4, releps=1e-3, maxpts=None, method=0,
+              num_workers=1, random_state=None):
     """
     Multivariate Normal probability by Genz' algorithm.
 
 
     Parameters
     CORREL = Positive semidefinite correlation matrix
-    A      = vector of lower integration limits.
-    B      = vector of upper integration limits.
+    A      = vector of lower integration limits or array of shape
+             (num_limits, n) with one set of limits in each row.
+    B      = vector of upper integration limits or array of shape
+             (num_limits, n).
     ABSEPS = absolute error tolerance.
     RELEPS = relative error tolerance.
     MAXPTS = maximum number of function values allowed. This
@@ -671,6 +1094,9 @@ def prbnormnd(correl, a, b, abseps=1e-4, releps=1e-3, maxpts=None, method=0):
          3 RCRUDE Crude Monte-Carlo Algorithm with simple
            antithetic variates and weighted results on restart
       4 SPHMVN Monte-Carlo algorithm by Deak (1980),  NMAX = 100
+    NUM_WORKERS = number of threads used for batched limits (default 1).
+    RANDOM_STATE = seed or RandomState for the random lattice shifts of
+        batched limits.
     Returns
     -------
     VALUE  REAL estimated value for the integral
@@ -700,24 +1126,37 @@ def prbnormnd(correl, a, b, abseps=1e-4, releps=1e-3, maxpts=None, method=0):
 
     >>> A = np.repeat(Blo,n)
     >>> B = np.repeat(Bup,n)-m
-    >>> val, err, inform = prbnormnd(Sc,A,B)
-    >>> np.allclose([val, err, inform],
-    ...    [0.0019456719705212067, 1.0059406844578488e-05, 0])
+    >>> val, err, inform = prbnormnd(Sc,A,B, random_state=1)
+    >>> bool(np.abs(val-Et) < 1e-4), bool(err < 1e-4), int(inform)
+    (True, True, 0)
+    >>> bool(np.abs(E0-Et) < 1e-4)
     True
 
-    >>> np.abs(val-Et)< err0+terr0
-    array([ True], dtype=bool)
-    >>> 'val = %2.5f' % val
-    'val = 0.00195'
+    Many limits with the same correlation are evaluated in one call:
+
+    >>> B2 = np.vstack((B, B + 1, B + 2))
+    >>> val2, err2, inform2 = prbnormnd(Sc, A, B2, maxpts=10**5,
+    ...                                 random_state=1)
+    >>> val2.shape, bool(np.abs(val2[0] - Et) < err2[0]), inform2.tolist()
+    ((3,), True, [0, 0, 0])
+
+    The batched limits are evaluated by randomly shifted lattice rules
+    applied to Genz' separation-of-variables integrand with vectorized
+    compiled kernels. The correlation matrix is factorized once for all
+    the limits and the kernels release the GIL, so the limits are split
+    between num_workers threads. Then method is ignored and val, err and
+    inform are arrays of length num_limits. The batched algorithm is also
+    used when the mvn extension is not available.
 
     See also
     --------
     prbnormndpc, Rind
     """
 
+    correl = np.asarray(correl, dtype=float)
     m, n = correl.shape
-    Na = len(a)
-    Nb = len(b)
+    Na = np.shape(a)[-1]
+    Nb = np.shape(b)[-1]
     if (m != n or m != Na or m != Nb):
         raise ValueError('Size of input is inconsistent!')
 
@@ -735,6 +1174,12 @@ def prbnormnd(correl, a, b, abseps=1e-4, releps=1e-3, maxpts=None, method=0):
     if (any(D != 1)):
         raise ValueError('This is not a correlation matrix')
 
+    if _is_batch(a, b) or mvn is None:
+        A, B = _batch_limits(a, b, n)
+        results = _prbnormnd_qmc(correl, A, B, abseps, releps, maxpts,
+                                 num_workers, random_state)
+        return _unbatch(a, b, results)
+
     # Make sure integration limits are finite
     A = np.clip(a, -100, 100)
     B = np.clip(b, -100, 100)
@@ -762,31 +1207,17 @@ def prbnormnd(correl, a, b, abseps=1e-4, releps=1e-3, maxpts=None, method=0):
 #    exTime = etime(clock,t0);
 #  '
 
-#     gauss legendre points and weights, n = 6
-_W6 = [0.1713244923791705e+00, 0.3607615730481384e+00, 0.4679139345726904e+00]
-_X6 = [-0.9324695142031522e+00, -
-       0.6612093864662647e+00, -0.2386191860831970e+00]
-#     gauss legendre points and weights, n = 12
-_W12 = [0.4717533638651177e-01, 0.1069393259953183e+00, 0.1600783285433464e+00,
-        0.2031674267230659e+00, 0.2334925365383547e+00, 0.2491470458134029e+00]
-_X12 = [-0.9815606342467191e+00, -0.9041172563704750e+00,
-        -0.7699026741943050e+00,
-        - 0.5873179542866171e+00, -0.3678314989981802e+00,
-        -0.1252334085114692e+00]
-#     gauss legendre points and weights, n = 20
-_W20 = [0.1761400713915212e-01, 0.4060142980038694e-01,
-        0.6267204833410906e-01, 0.8327674157670475e-01,
-        0.1019301198172404e+00, 0.1181945319615184e+00,
-        0.1316886384491766e+00, 0.1420961093183821e+00,
-        0.1491729864726037e+00, 0.1527533871307259e+00]
-_X20 = [-0.9931285991850949e+00, -0.9639719272779138e+00,
-        - 0.9122344282513259e+00, -0.8391169718222188e+00,
-        - 0.7463319064601508e+00, -0.6360536807265150e+00,
-        - 0.5108670019508271e+00, -0.3737060887154196e+00,
-        - 0.2277858511416451e+00, -0.7652652113349733e-01]
-
-
-def cdfnorm2d(b1, b2, r):
+
+_PARALLEL_MIN_SIZE = 2**16
+
+
+def _use_parallel(parallel, size):
+    if parallel is None:
+        return size >= _PARALLEL_MIN_SIZE
+    return parallel
+
+
+def cdfnorm2d(b1, b2, r, parallel=None):
     """
     Returnc Bivariate Normal cumulative distribution function
 
@@ -795,13 +1226,17 @@ def cdfnorm2d(b1, b2, r):
 
     b1, b2 : array-like
         upper integration limits
-    r : real scalar
+    r : array-like
         correlation coefficient  (-1 <= r <= 1).
+    parallel : bool, optional
+        If true evaluate in parallel threads. Default is true for arrays
+        with more than 65536 elements.
 
     Returns
     -------
     bvn : ndarray
-        distribution function evaluated at b1, b2.
+        distribution function evaluated at b1, b2, with shape given by
+        broadcasting b1, b2 and r.
 
     Notes
     -----
@@ -812,6 +1247,10 @@ def cdfnorm2d(b1, b2, r):
     G.O. Wesolowsky, (1989), with major modifications for double precision,
     and for |r| close to 1.
 
+    The probabilities are evaluated by a compiled numpy ufunc, i.e., b1, b2
+    and r are broadcast against each other. The Gauss-Legendre rule is
+    chosen for each element from the magnitude of its correlation.
+
     Example
     -------
     >>> import wafo.gaussian as wg
@@ -822,6 +1261,13 @@ def cdfnorm2d(b1, b2, r):
 
     surf(x,x,F)
 
+    Different correlations for each row of the grid:
+
+    >>> r2 = np.linspace(-1, 1, 20)[:, None]
+    >>> F2 = wg.cdfnorm2d(B1, B2, r2)
+    >>> bool(np.allclose(F2[13], wg.cdfnorm2d(B1[13], B2[13], r2[13, 0])))
+    True
+
     See also
     --------
     cdfnorm
@@ -841,134 +1287,34 @@ def cdfnorm2d(b1, b2, r):
     #     washington state university
     #     pullman, wa 99164-3113
     #     email : alangenz@wsu.edu
-
     b1, b2, r = np.broadcast_arrays(b1, b2, r)
-    cshape = b1.shape
-    h, k, r = -b1.ravel(), -b2.ravel(), r.ravel()
-
-    bvn = where(abs(r) > 1, nan, 0.0)
-
-    two = 2.e0
-    twopi = 6.283185307179586e0
-
-    hk = h * k
-
-    k0, = nonzero(abs(r) < 0.925e0)
-    if len(k0) > 0:
-        hs = (h[k0] ** 2 + k[k0] ** 2) / two
-        asr = arcsin(r[k0])
-        k1, = nonzero(r[k0] >= 0.75)
-        if len(k1) > 0:
-            k01 = k0[k1]
-            for i in range(10):
-                for sign in - 1, 1:
-                    sn = sin(asr[k1] * (sign * _X20[i] + 1) / 2)
-                    bvn[k01] = bvn[k01] + _W20[i] * \
-                        exp((sn * hk[k01] - hs[k1]) / (1 - sn * sn))
-
-        k1, = nonzero((0.3 <= r[k0]) & (r[k0] < 0.75))
-        if len(k1) > 0:
-            k01 = k0[k1]
-            for i in range(6):
-                for sign in - 1, 1:
-                    sn = sin(asr[k1] * (sign * _X12[i] + 1) / 2)
-                    bvn[k01] = bvn[k01] + _W12[i] * \
-                        exp((sn * hk[k01] - hs[k1]) / (1 - sn * sn))
-
-        k1, = nonzero(r[k0] < 0.3)
-        if len(k1) > 0:
-            k01 = k0[k1]
-            for i in range(3):
-                for sign in - 1, 1:
-                    sn = sin(asr[k1] * (sign * _X6[i] + 1) / 2)
-                    bvn[k01] = bvn[k01] + _W6[i] * \
-                        exp((sn * hk[k01] - hs[k1]) / (1 - sn * sn))
-
-        bvn[k0] *= asr / (two * twopi)
-        bvn[k0] += fi(-h[k0]) * fi(-k[k0])
-
-    k1, = nonzero((0.925 <= abs(r)) & (abs(r) <= 1))
-    if len(k1) > 0:
-        k2, = nonzero(r[k1] < 0)
-        if len(k2) > 0:
-            k12 = k1[k2]
-            k[k12] = -k[k12]
-            hk[k12] = -hk[k12]
-
-        k3, = nonzero(abs(r[k1]) < 1)
-        if len(k3) > 0:
-            k13 = k1[k3]
-            a2 = (1 - r[k13]) * (1 + r[k13])
-            a = sqrt(a2)
-            b = abs(h[k13] - k[k13])
-            bs = b * b
-            c = (4.e0 - hk[k13]) / 8.e0
-            d = (12.e0 - hk[k13]) / 16.e0
-            asr = -(bs / a2 + hk[k13]) / 2.e0
-            k4, = nonzero(asr > -100.e0)
-            if len(k4) > 0:
-                bvn[k13[k4]] = (a[k4] * exp(asr[k4]) *
-                                (1 - c[k4] * (bs[k4] - a2[k4]) *
-                                 (1 - d[k4] * bs[k4] / 5) / 3 +
-                                 c[k4] * d[k4] * a2[k4] ** 2 / 5))
-
-            k5, = nonzero(hk[k13] < 100.e0)
-            if len(k5) > 0:
-                #               b = sqrt(bs);
-                k135 = k13[k5]
-                bvn[k135] = bvn[k135] - exp(-hk[k135] / 2) * sqrt(twopi) * \
-                    fi(-b[k5] / a[k5]) * b[k5] * \
-                    (1 - c[k5] * bs[k5] * (1 - d[k5] * bs[k5] / 5) / 3)
-
-            a /= two
-            for i in range(10):
-                for sign in - 1, 1:
-                    xs = (a * (sign * _X20[i] + 1)) ** 2
-                    rs = sqrt(1 - xs)
-                    asr = -(bs / xs + hk[k13]) / 2
-                    k6, = nonzero(asr > -100.e0)
-                    if len(k6) > 0:
-                        k136 = k13[k6]
-                        bvn[k136] += (a[k6] * _W20[i] * exp(asr[k6]) *
-                                      (exp(-hk[k136] * (1 - rs[k6]) /
-                                           (2 * (1 + rs[k6]))) / rs[k6] -
-                                       (1 + c[k6] * xs[k6] *
-                                        (1 + d[k6] * xs[k6]))))
-
-            bvn[k3] = -bvn[k3] / twopi
-
-        k7, = nonzero(r[k1] > 0)
-        if len(k7):
-            k17 = k1[k7]
-            bvn[k17] += fi(-np.maximum(h[k17], k[k17]))
-
-        k8, = nonzero(r[k1] < 0)
-        if len(k8) > 0:
-            k18 = k1[k8]
-            bvn[k18] = -bvn[k18] + np.maximum(0, fi(-h[k18]) - fi(-k[k18]))
-
-    bvn.shape = cshape
-    return bvn
+    if _use_parallel(parallel, b1.size):
+        return np.asarray(_cdfnorm2d_parallel(b1, b2, r))
+    return np.asarray(_cdfnorm2d(b1, b2, r))
 
 
 def fi(x):
     return 0.5 * (erfc((-x) / sqrt(2)))
 
 
-def prbnorm2d(a, b, r):
+def prbnorm2d(a, b, r, parallel=None):
     """
     Returns Bivariate Normal probability
 
     Parameters
     ---------
-    a, b : array-like, size==2
-        vector with lower and upper integration limits, respectively.
-    r : real scalar
-        correlation coefficient
+    a, b : array-like, shape (..., 2)
+        lower and upper integration limits, respectively. The last axis holds
+        the limits of X1 and X2.
+    r : array-like
+        correlation coefficient, broadcast against a[..., 0] and b[..., 0].
+    parallel : bool, optional
+        If true evaluate in parallel threads. Default is true for arrays
+        with more than 65536 elements.
 
     Returns
     -------
-    prb : real scalar
+    prb : real scalar or ndarray
         computed probability Prob(A[0] <= X1 <= B[0] and A[1] <= X2 <= B[1])
         with an absolute error less than 1e-15.
 
@@ -980,6 +1326,9 @@ def prbnorm2d(a, b, r):
     >>> r = 0.3
     >>> np.allclose(wg.prbnorm2d(a,b,r), 0.56659121350428077)
     True
+    >>> np.allclose(wg.prbnorm2d([a, a], [b, [np.inf, 1]], r),
+    ...             [0.56659121350428077, 0.67894430247766])
+    True
 
     See also
     --------
@@ -987,42 +1336,17 @@ def prbnorm2d(a, b, r):
     cdfnorm,
     prbnormndpc
     """
-    infinity = 37
-    lower = np.asarray(a)
-    upper = np.asarray(b)
-    if np.all((lower <= -infinity) & (infinity <= upper)):
-        return 1.0
-    if (lower >= upper).any():
-        return 0.0
-    correl = r
-    infin = np.repeat(2, 2) - (upper > infinity) - 2 * (lower < -infinity)
-
-    if np.all(infin == 2):
-        return (bvd(lower[0], lower[1], correl) -
-                bvd(upper[0], lower[1], correl) -
-                bvd(lower[0], upper[1], correl) +
-                bvd(upper[0], upper[1], correl))
-    elif (infin[0] == 2 and infin[1] == 1):
-        return (bvd(lower[0], lower[1], correl) -
-                bvd(upper[0], lower[1], correl))
-    elif (infin[0] == 1 and infin[1] == 2):
-        return (bvd(lower[0], lower[1], correl) -
-                bvd(lower[0], upper[1], correl))
-    elif (infin[0] == 2 and infin[1] == 0):
-        return (bvd(-upper[0], -upper[1], correl) -
-                bvd(-lower[0], -upper[1], correl))
-    elif (infin[0] == 0 and infin[1] == 2):
-        return (bvd(-upper[0], -upper[1], correl) -
-                bvd(-upper[0], -lower[1], correl))
-    elif (infin[0] == 1 and infin[1] == 0):
-        return bvd(lower[0], -upper[1], -correl)
-    elif (infin[0] == 0 and infin[1] == 1):
-        return bvd(-upper[0], lower[1], -correl)
-    elif (infin[0] == 1 and infin[1] == 1):
-        return bvd(lower[0], lower[1], correl)
-    elif (infin[0] == 0 and infin[1] == 0):
-        return bvd(-upper[0], -upper[1], correl)
-    return 1
+    lower = np.asarray(a, dtype=float)
+    upper = np.asarray(b, dtype=float)
+    args = np.broadcast_arrays(lower[..., 0], lower[..., 1], upper[..., 0],
+                               upper[..., 1], r)
+    if _use_parallel(parallel, args[0].size):
+        prb = _prbnorm2d_parallel(*args)
+    else:
+        prb = _prbnorm2d_ufunc(*args)
+    if np.ndim(prb) == 0:
+        return float(prb)
+    return prb
 
 
 def bvd(lo, up, r):
@@ -7,8 +7,10 @@ from __future__ import absolute_import, division, print_function
 from scipy import sparse
 import numpy as np
 from itertools import product
+import numba
+from numba import jit, prange
 
-__all__ = ['accum', 'gridcount']
+__all__ = ['accum', 'gridcount', 'linbin']
 
 
 def _assert(cond, msg):
@@ -101,7 +103,106 @@ def accumsum(accmap, a, shape=None):
     return np.bincount(accmap.ravel(), a.ravel(), np.array(shape).max())
 
 
-def accum(accmap, a, func=None, shape=None, fill_value=0, dtype=None):
+@jit(nopython=True)
+def _add(x, y):
+    return x + y
+
+
+@jit(nopython=True)
+def _multiply(x, y):
+    return x * y
+
+
+@jit(nopython=True)
+def _maximum(x, y):
+    return max(x, y)
+
+
+@jit(nopython=True)
+def _minimum(x, y):
+    return min(x, y)
+
+
+_REDUCERS = {'sum': _add, 'mean': _add, 'prod': _multiply, 'max': _maximum,
+             'min': _minimum, 'count': _add}
+_REDUCER_NAMES = {np.sum: 'sum', np.mean: 'mean', np.prod: 'prod',
+                  np.max: 'max', np.min: 'min', len: 'count',
+                  np.size: 'count', sum: 'sum', max: 'max', min: 'min'}
+
+
+def _num_chunks(n, size):
+    """Return number of data chunks, i.e., per-thread partial grids, to use.
+
+    The partial grids are limited to about 2**24 elements in total.
+    """
+    num_threads = numba.config.NUMBA_NUM_THREADS
+    return int(max(1, min(num_threads, n // 1024, 2**24 // max(size, 1))))
+
+
+# The accum kernels take the reducer as argument and can not be cached.
+@jit(nopython=True)
+def _accum_chunk(index, values, func, start, stop, out, count):
+    """Reduce values[start:stop] with same index into out using func.
+
+    The first value of each group is the initial accumulator, i.e., func is
+    never applied to single-value groups. count holds the group sizes.
+    """
+    for i in range(start, stop):
+        j = index[i]
+        if count[j] > 0:
+            out[j] = func(out[j], values[i])
+        else:
+            out[j] = values[i]
+        count[j] += 1
+
+
+@jit(nopython=True, parallel=True)
+def _accum_reduce_parallel(index, values, size, func, num_chunks):
+    """Reduce values with same index using binary function func.
+
+    The data are split in num_chunks chunks which are reduced in parallel
+    into partial grids which are merged at the end.
+    """
+    n = index.size
+    chunk = (n + num_chunks - 1) // num_chunks
+    partial = np.zeros((num_chunks, size), dtype=values.dtype)
+    counts = np.zeros((num_chunks, size), dtype=np.int64)
+    for k in prange(num_chunks):
+        _accum_chunk(index, values, func, k * chunk,
+                     min((k + 1) * chunk, n), partial[k], counts[k])
+    out = partial[0]
+    count = counts[0]
+    for j in prange(size):
+        for k in range(1, num_chunks):
+            if counts[k, j] > 0:
+                if count[j] > 0:
+                    out[j] = func(out[j], partial[k, j])
+                else:
+                    out[j] = partial[k, j]
+                count[j] += counts[k, j]
+    return out, count
+
+
+def _get_reducer(func):
+    """Return name and compiled binary function or None if func is unknown.
+    """
+    if func is None:
+        func = 'sum'
+    if isinstance(func, str):
+        _assert(func in _REDUCERS, 'func must be one of {}, got {!r}'.format(
+            sorted(_REDUCERS), func))
+        return func, _REDUCERS[func]
+    if hasattr(func, 'py_func'):  # numba compiled function
+        return 'custom', func
+    try:
+        name = _REDUCER_NAMES.get(func)
+    except TypeError:  # func is unhashable
+        name = None
+    return name, _REDUCERS.get(name)
+
+
+def accum(accmap, a, func=None, shape=None, fill_value=0, dtype=None,
+          parallel=False):
     """An accumulation function similar to Matlab's `accumarray` function.
 
     Parameters
@@ -119,10 +220,18 @@ def accum(accmap, a, func=None, shape=None, fill_value=0, dtype=None):
         1D, then the shape of `accmap` can be either (15,4) or (15,4,1)
     a : ndarray
         The input data to be accumulated.
-    func : callable or None
+    func : callable, string or None
         The accumulation function.  The function will be passed a list
         of values from `a` to be accumulated.
         If None, numpy.sum is assumed.
+        The reductions 'sum', 'max', 'min', 'mean', 'prod' and 'count' (or
+        the corresponding numpy functions np.sum, np.max, np.min, np.mean,
+        np.prod and len) are done with compiled code. func may
+        also be a numba compiled associative binary function, f(acc, value),
+        which is used to accumulate the values in the same way. The first
+        value of each group is the initial accumulator, so func must be a
+        pure reduction like max(acc, value) and not transform the values:
+        a group with a single value returns that value unchanged.
     shape : ndarray or None
         The shape of the output array.  If None, the shape will be determined
         from `accmap`.
@@ -131,6 +240,11 @@ def accum(accmap, a, func=None, shape=None, fill_value=0, dtype=None):
     dtype : numpy data type, or None
         The data type of the output array.  If None, the data type of
         `a` is used.
+    parallel : bool
+        If True the compiled reductions are done in parallel over chunks of
+        the data with per-thread partial results merged at the end. The
+        parallel kernel is compiled on first use and starts the numba
+        threading layer. (default False)
 
     Returns
     -------
@@ -182,6 +296,22 @@ def accum(accmap, a, func=None, shape=None, fill_value=0, dtype=None):
     >>> np.allclose(t[1][1], [9])
     True
 
+    # Accumulate using a compiled binary function, here keeping the value
+    # with the largest magnitude
+    >>> from numba import jit
+    >>> @jit(nopython=True)
+    ... def absmax(x, y):
+    ...     return x if abs(x) >= abs(y) else y
+    >>> accum(accmap, a, func=absmax)
+    array([[4, 6],
+           [8, 9]])
+    >>> accum(accmap, -a, func=absmax)
+    array([[-4, -6],
+           [-8, -9]])
+    >>> accum(accmap, a, func='count')
+    array([[4, 2],
+           [2, 1]])
+
     """
 
     def create_array_of_python_lists(accmap, a, shape):
@@ -214,7 +344,33 @@ def accum(accmap, a, func=None, shape=None, fill_value=0, dtype=None):
         shape = np.atleast_1d(shape)
         return accmap, shape, dtype, func
 
+    def compiled_accum(accmap, a, name, reducer, shape, dtype):
+        index = np.ravel_multi_index(
+            tuple(np.reshape(accmap, (-1, len(shape))).T), shape)
+        values = np.ravel(a)
+        if name == 'count':
+            values = np.ones(values.shape, dtype=np.int64)
+        elif name == 'mean':
+            values = values.astype(float)
+        size = int(np.prod(shape))
+        num_chunks = _num_chunks(values.size, size) if parallel else 1
+        if num_chunks > 1:
+            out, count = _accum_reduce_parallel(index, values, size, reducer,
+                                                num_chunks)
+        else:
+            out = np.zeros(size, dtype=values.dtype)
+            count = np.zeros(size, dtype=np.int64)
+            _accum_chunk(index, values, reducer, 0, values.size, out, count)
+        if name == 'mean':
+            out = out / np.maximum(count, 1)
+        out = np.where(count > 0, out, fill_value).astype(dtype)
+        return out.reshape(shape)
+
+    name, reducer = _get_reducer(func)
     accmap, shape, dtype, func = _initialize(accmap, a, func, shape, dtype)
+    if reducer is not None:
+        return compiled_accum(accmap, np.asarray(a), name, reducer,
+                              tuple(shape), dtype)
 
     # Create an array of python lists of values.
     vals = create_array_of_python_lists(accmap, a, shape)
@@ -229,47 +385,137 @@ def accum(accmap, a, func=None, shape=None, fill_value=0, dtype=None):
     return out
 
 
-def _gridcount_nd(acfun, data, x, y, w, binx):
-    d, inc = x.shape
-    c_shape = np.repeat(inc, d)
-    nc = c_shape.prod()  # inc ** d
-
-    c = np.zeros((nc, ))
-    fact2 = np.asarray(np.reshape(inc * np.arange(d), (d, -1)), dtype=int)
-    fact1 = np.asarray(np.reshape(c_shape.cumprod() / inc, (d, -1)), dtype=int)
-    bt0 = [0, 0]
-    x1 = x.ravel()
-    for ir in range(2 ** (d - 1)):
-        bt0[0] = np.reshape(bitget(ir, np.arange(d)), (d, -1))
-        bt0[1] = 1 - bt0[0]
-        for ix in range(2):
-            one = np.mod(ix, 2)
-            two = np.mod(ix + 1, 2)
-            # Convert to linear index
-            # linear index to c
-            b1 = np.sum((binx + bt0[one]) * fact1, axis=0)
-            bt2 = bt0[two] + fact2
-            b2 = binx + bt2   # linear index to X
-            c += acfun(b1, np.abs(np.prod(x1[b2] - data, axis=0)) * y,
-                       shape=(nc, ))
-
-    c = np.reshape(c / w, c_shape, order='F')
-
-    T = list(range(d))
-    T[1], T[0] = T[0], T[1]
-    # make sure c is stored in the same way as meshgrid
-    c = c.transpose(*T)
-    return c
+@jit(nopython=True, cache=True)
+def _linbin_chunk(data, xlo, dx, shape, strides, y, out, start, stop):
+    """Add linear binned y-weights of data[:, start:stop] to out.
 
+    out[m] is the C-ordered flat view of the grid of shape `shape` for the
+    weights y[m].
+    """
+    d = data.shape[0]
+    num_y = out.shape[0]
+    base = np.zeros(d, dtype=np.int64)
+    frac = np.zeros(d, dtype=data.dtype)
+    for i in range(start, stop):
+        for k in range(d):
+            t = (data[k, i] - xlo[k]) / dx[k]
+            b = min(max(int(np.floor(t)), 0), shape[k] - 2)
+            base[k] = b
+            frac[k] = t - b
+        for corner in range(2 ** d):
+            w = 1.0
+            ix = 0
+            for k in range(d):
+                if (corner >> k) & 1:
+                    w *= frac[k]
+                    ix += (base[k] + 1) * strides[k]
+                else:
+                    w *= 1 - frac[k]
+                    ix += base[k] * strides[k]
+            for m in range(num_y):
+                out[m, ix] += w * y[m, i]
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _linbin_parallel(data, xlo, dx, shape, strides, y, out, num_chunks):
+    """Add linear binned y-weights of data to out.
+
+    The data are split in num_chunks chunks which are binned in parallel
+    into partial grids which are summed at the end.
+    """
+    n = data.shape[1]
+    num_y, size = out.shape
+    chunk = (n + num_chunks - 1) // num_chunks
+    partial = np.zeros((num_chunks, num_y, size), dtype=out.dtype)
+    for j in prange(num_chunks):
+        _linbin_chunk(data, xlo, dx, shape, strides, y, partial[j],
+                      j * chunk, min((j + 1) * chunk, n))
+    for ix in prange(size):
+        for j in range(num_chunks):
+            for m in range(num_y):
+                out[m, ix] += partial[j, m, ix]
+
+
+def linbin(data, xlo, dx, shape, y=1, dtype=float, out=None,
+           parallel=False):
+    """Returns D-dimensional histogram using linear binning.
+
+    Parameters
+    ----------
+    data : array-like
+        column vectors with D-dimensional data, shape D x Nd
+    xlo, dx : array-like
+        lower limit and spacing of the grid in each dimension, size D.
+        The grid must include the range of the data.
+    shape : tuple
+        number of grid points in each dimension.
+    y : array-like
+        response data. Scalar, vector of size Nd or M x Nd array of M
+        responses which are binned in the same pass over the data.
+    dtype : numpy data type
+        float64 or float32
+    out : ndarray, optional
+        if given the counts are added to out.
+    parallel : bool
+        if True the data are binned in parallel over chunks with per-thread
+        partial grids summed at the end. The parallel kernel is compiled on
+        first use and starts the numba threading layer. (default False)
+
+    Returns
+    -------
+    c : ndarray
+        linear binned counts, shape `shape` with 'ij' indexing, i.e.,
+        c[i0, i1, ...] is the count at (xlo[0] + i0 * dx[0], ...).
+        If y is a M x Nd array c has shape (M,) + shape and c[m] are the
+        linear binned y[m] weights.
+
+    LINBIN is compiled with numba and bins the data in one pass. It makes no
+    temporary arrays of size Nd * 2**D, and it is used by gridcount and the
+    binned KDE's.
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> import wafo.kdetools as wk
+    >>> data = np.array(
+    ...    [[ 1.07855907,  1.51199717,  1.54382893,  1.54774808,  1.51913566],
+    ...     [ 1.11386486,  1.49146216,  1.51127214,  2.61287913,  0.94793051]])
+    >>> x = np.linspace(0, 3, 7)
+    >>> c = linbin(data, (0, 0), (0.5, 0.5), (7, 7))
+    >>> np.allclose(c.T, wk.gridcount(data, np.vstack((x, x))))
+    True
 
-def _gridcount_1d(acfun, data, x, y, w, binx, inc):
-    x.shape = -1,
-    c = (acfun(binx, (x[binx + 1] - data) * y, shape=(inc, )) +
-         acfun(binx + 1, (data - x[binx]) * y, shape=(inc, ))).ravel()
-    return c / w
+    See also
+    --------
+    gridcount
+    """
+    dtype = np.dtype(dtype)
+    dataset = np.atleast_2d(data).astype(dtype)
+    d, n = dataset.shape
+    shape = tuple(int(ni) for ni in np.atleast_1d(shape))
+    xlo = np.atleast_1d(xlo).astype(dtype) * np.ones(d, dtype=dtype)
+    dx = np.atleast_1d(dx).astype(dtype) * np.ones(d, dtype=dtype)
+    _assert(len(shape) == d, 'Dimension of data and shape do not match.')
+    y = np.asarray(y, dtype=dtype)
+    out_shape = shape if y.ndim < 2 else y.shape[:1] + shape
+    y = (np.atleast_2d(y) * np.ones((1, n), dtype=dtype)).astype(dtype)
+    if out is None:
+        out = np.zeros(out_shape, dtype=dtype)
+    _assert(out.shape == out_shape and out.dtype == dtype and
+            out.flags.c_contiguous, 'out does not match shape and dtype!')
+    shape = np.array(shape, dtype=np.int64)
+    strides = np.cumprod(np.append(shape[1:], 1)[::-1])[::-1].copy()
+    flat_out = out.reshape(len(y), -1)
+    num_chunks = _num_chunks(n * len(y), out.size) if parallel else 1
+    if num_chunks > 1:
+        _linbin_parallel(dataset, xlo, dx, shape, strides, y, flat_out,
+                         num_chunks)
+    else:
+        _linbin_chunk(dataset, xlo, dx, shape, strides, y, flat_out, 0, n)
+    return out
 
 
-def gridcount(data, X, y=1):
+def gridcount(data, X, y=1, parallel=False):
     '''
     Returns D-dimensional histogram using linear binning.
 
@@ -282,6 +528,8 @@ def gridcount(data, X, y=1):
         The discretization must include the range of the data.
     y : array-like
         response data. Scalar or vector of size Nd.
+    parallel : bool
+        if True the data are binned in parallel (see linbin).
 
     Returns
     -------
@@ -351,15 +599,11 @@ def gridcount(data, X, y=1):
     _assert(not ((datlo < xlo) | (xup < datup)).any(),
             'X does not include whole range of the data!')
 
-    #  acfun = accumsum_sparse  # faster than accum
-    acfun = accumsum  # faster than accumsum_sparse
-
-    dx = np.diff(x[:, :2], axis=1)
-    binx = np.asarray(np.floor((dataset - xlo[:, np.newaxis]) / dx), dtype=int)
-    w = dx.prod()
-    if d == 1:
-        return _gridcount_1d(acfun, dataset, x, y, w, binx, inc)
-    return _gridcount_nd(acfun, dataset, x, y, w, binx)
+    dx = x[:, 1] - x[:, 0]
+    c = linbin(dataset, xlo, dx, (inc,) * d, y=y, parallel=parallel)
+    if d > 1:  # make sure c is stored in the same way as meshgrid
+        c = c.swapaxes(0, 1)
+    return c
 
 
 if __name__ == '__main__':
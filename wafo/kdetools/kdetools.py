@@ -14,18 +14,26 @@ from __future__ import absolute_import, division, print_function
 # from abc import ABCMeta, abstractmethod
 import copy
 import warnings
+from collections import deque
+from functools import partial
+from multiprocessing.pool import ThreadPool
 import numpy as np
+import numba
+from numba import jit, float64, int64, void
 import scipy.stats as st
 from scipy import interpolate, linalg, special
+from scipy.spatial import cKDTree
 from numpy import sqrt, atleast_2d, meshgrid
-from numpy.fft import fftn, ifftn
+from scipy.fftpack import next_fast_len
 from wafo.misc import nextpow2
 from wafo.containers import PlotData
 from wafo.testing import test_docstrings
-from wafo.kdetools.kernels import iqrange, qlevels, Kernel
-from wafo.kdetools.gridding import gridcount
+from wafo.kdetools.kernels import (iqrange, QLevels, Kernel, _kernel_factor,
+                                   _kernel_radial)
+from wafo.kdetools.gridding import gridcount, linbin
 
-__all__ = ['TKDE', 'KDE', 'test_docstrings', 'KRegression', 'BKRegression']
+__all__ = ['TKDE', 'KDE', 'BinnedKDE', 'test_docstrings', 'KRegression',
+           'BKRegression']
 
 _TINY = np.finfo(float).machar.tiny
 # _REALMIN = np.finfo(float).machar.xmin
@@ -47,6 +55,66 @@ def _invnorm(q):
     return special.ndtri(q)
 
 
+def _as_rows(x):
+    """Return columns of the d x n array x as a vector of n void scalars."""
+    x = np.ascontiguousarray(x.T)
+    return x.view(np.dtype((np.void, x.dtype.itemsize * x.shape[1]))).ravel()
+
+
+def _in1d_once(x, y):
+    """Return mask of the elements of x that are matched by an element of y.
+
+    Each element of y matches at most one equal element of x, i.e., values
+    repeated in x are only matched as many times as they occur in y.
+    """
+    _values, inverse = np.unique(np.concatenate((x, y)), return_inverse=True)
+    ix, iy = inverse[:x.size], inverse[x.size:]
+    num_y = np.bincount(iy, minlength=inverse.max() + 1)
+    order = np.argsort(ix, kind='mergesort')
+    sorted_ix = ix[order]
+    occurrence = np.empty(x.size, dtype=int)
+    occurrence[order] = np.arange(x.size) - np.searchsorted(sorted_ix,
+                                                            sorted_ix)
+    return occurrence < num_y[ix]
+
+
+@jit(void(float64[:, :], float64[:, :], float64[:, :], float64[:, :],
+          float64[:], float64[:], int64, int64, float64, int64, float64[:]),
+     nopython=True, nogil=True)
+def _kde_sum(points, data, tpoints, tdata, lambda_, weights, r, kind, radius,
+             p, out):
+    """out[j] = sum_i sum(dx**r) * kernel(du / lambda_[i]) * weights[i]
+
+    where dx = points[:, j] - data[:, i] and du = tpoints[:, j] - tdata[:, i]
+    are the differences in the original and the inv_hs scaled coordinates,
+    respectively. Releases the GIL.
+    """
+    d, m = points.shape
+    n = data.shape[1]
+    radial = kind == 0 or kind == 4 or kind == 5
+    for j in range(m):
+        total = 0.0
+        for i in range(n):
+            inv_lambda = 1.0 / lambda_[i]
+            value = 0.0 if radial else 1.0
+            for k in range(d):
+                u_k = (tpoints[k, j] - tdata[k, i]) * inv_lambda
+                if radial:
+                    value += _kernel_factor(kind, u_k, radius, p)
+                else:
+                    value *= _kernel_factor(kind, u_k, radius, p)
+            if radial:
+                value = _kernel_radial(kind, value, radius, p)
+            if value != 0.0:
+                if r > 0:
+                    moment = 0.0
+                    for k in range(d):
+                        moment += (points[k, j] - data[k, i]) ** r
+                    value *= moment
+                total += value * weights[i]
+        out[j] = total
+
+
 def _logit(p):
     pc = p.clip(min=0, max=1)
     return (np.log(pc) - np.log1p(-pc)).clip(min=-40, max=40)
@@ -138,12 +206,21 @@ class _KDE(object):
         output : string optional
             'value' if value output
             'data' if object output
+        dtype : numpy data type
+            float64 (default) or float32. The latter halves the memory used
+            by the binned data and the cached kernel fft.
 
         Returns
         -------
         values : array-like
             The values evaluated at meshgrid(*args).
 
+        Notes
+        -----
+        The data are linearly binned on the grid and convolved with the
+        kernel weights using fft. The kernel is truncated outside its
+        effective support and its fft is cached for reuse as long as the
+        smoothing parameter and grid spacing are unchanged.
         """
         return self.eval_grid_fun(self._eval_grid_fast, *args, **kwds)
 
@@ -167,6 +244,12 @@ class _KDE(object):
         values : array-like
             The values evaluated at meshgrid(*args).
 
+        Notes
+        -----
+        For d > 1 the PlotData object has the contour levels clevels which
+        encloses plevels % of the pdf and a QLevels object qlevels which
+        caches the levels for further percentile queries, e.g.,
+        wdata.qlevels([60, 80]).
         """
         return self.eval_grid_fun(self._eval_grid, *args, **kwds)
 
@@ -176,9 +259,10 @@ class _KDE(object):
     def _add_contour_levels(self, wdata):
         p_levels = np.r_[10:90:20, 95, 99, 99.9]
         try:
-            c_levels = qlevels(wdata.data, p=p_levels)
-            wdata.clevels = c_levels
+            levels = QLevels(wdata.data)
+            wdata.clevels = levels(p_levels)
             wdata.plevels = p_levels
+            wdata.qlevels = levels
         except ValueError as e:
             msg = "Could not calculate contour levels!. ({})".format(str(e))
             warnings.warn(msg)
@@ -640,8 +724,10 @@ class KDE(_KDE):
         h = self._check_hs(h)
         # pylint: disable=attribute-defined-outside-init
         self._inv_hs, deth = self._invert_hs(h)
+        self._det_hs = deth
         self._norm_factor = deth * self.n
         self._hs = h
+        self._kernel_fft_cache = {}
 
     @property
     def inc(self):
@@ -672,23 +758,56 @@ class KDE(_KDE):
             g = np.exp(np.mean(np.log(f)))
             self._lambda = (f / g) ** (-alpha)
 
-    @staticmethod
-    def _make_flat_grid(dx, d, inc):
-        Xn = []
-        x0 = np.linspace(-inc, inc, 2 * inc + 1)
-        for i in range(d):
-            Xn.append(x0[:-1] * dx[i])
+    def _kernel_support(self, dx, inc):
+        """Return number of grid steps outside which the kernel is negligible.
+        """
+        tau = self.kernel.truncation_radius(_EPS)
+        hs = self.hs
+        extent = hs if hs.ndim == 1 else np.abs(hs).sum(axis=1)
+        num_steps = np.ceil(tau * extent / np.abs(dx)) + 1
+        return np.minimum(num_steps, inc - 1).astype(int)
 
-        Xnc = meshgrid(*Xn)
+    def _make_kernel_fft(self, dx, inc, r, dtype, power=1):
+        """Return fft shape and fft of the truncated kernel weights.
 
-        for i in range(d):
-            Xnc[i].shape = (-1,)
-        return np.vstack(Xnc)
+        The weights are kernel**power * x**r, where x is the offset.
+
+        The kernel is only evaluated within its (truncated) support and
+        wrapped around on a grid large enough to avoid aliasing.
+        """
+        d = len(dx)
+        num_steps = self._kernel_support(dx, inc)
+        offsets = [np.arange(-ni, ni + 1) for ni in num_steps]
+        Xnc = meshgrid(*[oi * dxi for oi, dxi in zip(offsets, dx)],
+                       indexing='ij')
+        Xnc = np.vstack([xi.ravel() for xi in Xnc])
+
+        Xn = np.dot(self._inv_hs, Xnc)
+        kw = self._kernel_weights(Xn, dx, d, inc) ** power
+        if r != 0:
+            kw *= self._moment_fun(r)(Xnc)
+
+        shape = tuple(next_fast_len(inc + ni) for ni in num_steps)
+        kwc = np.zeros(shape, dtype=dtype)
+        kwc[np.ix_(*offsets)] = kw.reshape([oi.size for oi in offsets])
+        ctype = np.result_type(dtype, np.complex64)
+        return shape, np.fft.rfftn(kwc).astype(ctype)
+
+    def _kernel_fft(self, dx, inc, r=0, dtype=float, power=1):
+        """Return fft shape and cached fft of the kernel weights."""
+        dtype = np.dtype(dtype)
+        key = (self.kernel.name, self.hs.tobytes(), tuple(dx), inc, r,
+               dtype.str, power)
+        if key not in self._kernel_fft_cache:
+            self._kernel_fft_cache[key] = self._make_kernel_fft(dx, inc, r,
+                                                                dtype, power)
+        return self._kernel_fft_cache[key]
 
     def _kernel_weights(self, Xn, dx, d, inc):
+        """Return kernel weights normalized to unit mass."""
         kw = self.kernel(Xn)
-        norm_fact0 = (kw.sum() * dx.prod() * self.n)
-        norm_fact = (self._norm_factor * self.kernel.norm_factor(d, self.n))
+        norm_fact0 = kw.sum() * dx.prod()
+        norm_fact = self._det_hs * self.kernel.norm_factor(d, self.n)
         if np.abs(norm_fact0 - norm_fact) > 0.05 * norm_fact:
             warnings.warn(
                 'Numerical inaccuracy due to too low discretization. ' +
@@ -699,36 +818,79 @@ class KDE(_KDE):
         kw = kw / norm_fact
         return kw
 
-    def _eval_grid_fast(self, *args, **kwds):
+    def _binned_convolutions(self, args, y, moments, dtype=float):
+        """Return convolutions of the binned weighted data with kernel moments.
+
+        Parameters
+        ----------
+        args : list of d vectors
+            equidistant grid in each dimension.
+        y : M x n array
+            weights of the data, e.g., powers of the response, which are
+            binned in the same pass over the data.
+        moments : list of tuples (m, r, power)
+            the data binned with weights y[m] are convolved with the kernel
+            weights kernel**power * x**r.
+        dtype : numpy data type
+            float64 or float32
+
+        Returns
+        -------
+        z : array
+            shape len(moments) x inc x ... x inc, with z[i] stored in the same
+            way as meshgrid(*args).
+
+        All the convolutions are done together with one forward fft of the
+        binned data, cached ffts of the kernel weights and one inverse fft.
+        The kernel weights are normalized to unit mass, so the cached ffts
+        do not depend on the number of data.
+        """
         X = np.vstack(args)
         d, inc = X.shape
         dx = X[:, 1] - X[:, 0]
-
-        Xnc = self._make_flat_grid(dx, d, inc)
-
-        Xn = np.dot(self._inv_hs, Xnc)
-        kw = self._kernel_weights(Xn, dx, d, inc)
-
-        r = kwds.get('r', 0)
-        if r != 0:
-            fun = self._moment_fun(r)
-            kw *= fun(np.vstack(Xnc))
-        kw.shape = (2 * inc, ) * d
-        kw = np.fft.ifftshift(kw)
-
-        y = kwds.get('y', 1.0)
+        xlo = X[:, 0]
         if self.alpha > 0:
             warnings.warn('alpha parameter is not used for binned kde!')
 
+        kernel_ffts = [self._kernel_fft(dx, inc, r, dtype, power)
+                       for _m, r, power in moments]
+        shape = kernel_ffts[0][0]
+        axes = tuple(range(1, d + 1))
+
         # Find the binned kernel weights, c.
-        c = gridcount(self.dataset, X, y=y)
-        # Perform the convolution.
-        z = np.real(ifftn(fftn(c, s=kw.shape) * fftn(kw)))
+        c = self._bin_data(xlo, dx, inc, y, dtype)
+        # Perform the convolutions.
+        c_fft = np.fft.rfftn(c, s=shape, axes=axes)
+        index = [m for m, _r, _power in moments]
+        kw_fft = np.stack([kernel_fft for _shape, kernel_fft in kernel_ffts])
+        z = np.fft.irfftn(c_fft[index] * kw_fft, s=shape, axes=axes)
+
+        powers = np.array([power for _m, _r, power in moments])
+        scale = float(self.n) ** -powers
+        z = z[(slice(None),) + (slice(0, inc),) * d]
+        z = (z * scale.reshape((-1,) + (1,) * d)).astype(dtype)
+        if d > 1:  # make sure z is stored in the same way as meshgrid
+            z = z.swapaxes(1, 2)
+        return z
+
+    def _bin_data(self, xlo, dx, inc, y, dtype):
+        """Return the data linearly binned with the M x n weights y."""
+        d = len(xlo)
+        xup = xlo + (inc - 1) * dx
+        datlo, datup = self.dataset.min(axis=1), self.dataset.max(axis=1)
+        _assert(not ((datlo < xlo) | (xup < datup)).any(),
+                'X does not include whole range of the data!')
+        y = np.atleast_2d(y) * np.ones((1, self.n))
+        return linbin(self.dataset, xlo, dx, (inc,) * d, y=y, dtype=dtype)
 
-        ix = (slice(0, inc),) * d
+    def _eval_grid_fast(self, *args, **kwds):
+        r = kwds.get('r', 0)
+        y = kwds.get('y', 1.0)
+        dtype = np.dtype(kwds.get('dtype', float))
+        z = self._binned_convolutions(args, y, [(0, r, 1)], dtype)[0]
         if r == 0:
-            return z[ix] * (z[ix] > 0.0)
-        return z[ix]
+            return z * (z > 0.0)
+        return z
 
     def _eval_grid(self, *args, **kwds):
 
@@ -777,6 +939,87 @@ class KDE(_KDE):
             result[i] = np.sum(fun(dxi) * kernel(tdiff) * y_d_lambda, axis=-1)
         return result / self.norm_factor
 
+    def _loop_over_neighbours(self, data, points, y, r, tol=None,
+                              chunksize=10000):
+        """Sum kernel contributions from data within the kernel support only.
+
+        The data and points are scaled by inv_hs and the data within the
+        (truncated) support of the kernel, scaled by max(lambda_), are found
+        with a KD-tree.
+        """
+        fun = self._moment_fun(r)
+        d, m = points.shape
+        inv_hs, lambda_ = self._inv_hs, self._lambda
+        kernel = self.kernel
+        radius = kernel.truncation_radius(tol) * lambda_.max()
+        p_norm = kernel.support_p_norm
+
+        y_d_lambda = y / lambda_ ** d * np.ones(self.n)
+        tdata = np.dot(inv_hs, data)
+        tpoints = np.dot(inv_hs, points)
+        tree = cKDTree(tdata.T)
+        result = np.zeros((m,))
+        for start in range(0, m, chunksize):
+            stop = min(start + chunksize, m)
+            ptree = cKDTree(tpoints[:, start:stop].T)
+            pairs = tree.sparse_distance_matrix(ptree, radius, p=p_norm,
+                                                output_type='ndarray')
+            i, j = pairs['i'], pairs['j'] + start
+            tdiff = (tpoints[:, j] - tdata[:, i]) / lambda_[i]
+            dxi = points[:, j] - data[:, i]
+            result[start:stop] = np.bincount(
+                j - start, fun(dxi) * kernel(tdiff) * y_d_lambda[i],
+                minlength=stop - start)
+        return result / self.norm_factor
+
+    def _loop_over_chunks(self, data, points, y, r, out=None,
+                          num_threads=None, chunksize=None):
+        """Sum kernel contributions with compiled kernels in a thread pool.
+
+        The points are split into chunks which are evaluated in parallel by
+        the numba kernel _kde_sum, which releases the GIL.
+        """
+        d, m = points.shape
+        lambda_ = self._lambda
+        mkernel = self.kernel.kernel
+        if out is None:
+            out = np.empty(m)
+        _assert(out.shape == (m,) and out.dtype == np.float64 and
+                out.flags.c_contiguous,
+                'out must be a contiguous float64 array of shape (m,)!')
+        if num_threads is None:
+            num_threads = numba.config.NUMBA_NUM_THREADS
+        if chunksize is None:
+            chunksize = max(-(-m // (4 * num_threads)), 1)
+
+        weights = (y / lambda_ ** d * np.ones(self.n)).astype(float)
+        data = np.asarray(data, dtype=float)
+        points = np.asarray(points, dtype=float)
+        inv_hs = np.asarray(self._inv_hs, dtype=float)
+        tdata = np.dot(inv_hs, data)
+        tpoints = np.dot(inv_hs, points)
+        params = (lambda_.astype(float), weights, int(r), int(mkernel.kind),
+                  float(mkernel.r), int(mkernel.p))
+
+        def _task(start):
+            stop = min(start + chunksize, m)
+            _kde_sum(points[:, start:stop], data, tpoints[:, start:stop],
+                     tdata, *params, out=out[start:stop])
+
+        starts = range(0, m, chunksize)
+        if num_threads > 1 and len(starts) > 1:
+            pool = ThreadPool(min(num_threads, len(starts)))
+            try:
+                pool.map(_task, starts)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for start in starts:
+                _task(start)
+        out /= self.norm_factor
+        return out
+
     def _eval_points(self, points, **kwds):
         """Evaluate the estimated pdf on a set of points.
 
@@ -785,6 +1028,23 @@ class KDE(_KDE):
         points : (# of dimensions, # of points)-array
             Alternatively, a (# of dimensions,) vector can be passed in and
             treated as a single point.
+        method : {'loop', 'tree', 'parallel'}
+            'loop' sums the contributions from all data to all points.
+            'tree' only sums the contributions from data within the support
+            of the kernel found with a KD-tree. This is much faster for large
+            datasets and compactly supported kernels (default 'loop').
+            'parallel' sums the contributions from all data to chunks of the
+            points in a pool of threads with compiled kernels.
+        tol : real scalar or None
+            truncation tolerance for kernels with infinite support when
+            method='tree', i.e., contributions where the kernel is less than
+            tol are ignored (default None, i.e., the effective support).
+        out : ndarray, optional
+            preallocated float64 output array of shape (# of points,) for
+            method='parallel'.
+        num_threads, chunksize : int, optional
+            number of threads (default numba.config.NUMBA_NUM_THREADS) and
+            number of points in each chunk for method='parallel'.
 
         Returns
         -------
@@ -802,13 +1062,385 @@ class KDE(_KDE):
 
         y = kwds.get('y', 1)
         r = kwds.get('r', 0)
-
+        method = kwds.get('method', 'loop')
+
+        if method == 'tree':
+            return self._loop_over_neighbours(self.dataset, points, y, r,
+                                              tol=kwds.get('tol'))
+        if method == 'parallel':
+            return self._loop_over_chunks(
+                self.dataset, points, y, r, out=kwds.get('out'),
+                num_threads=kwds.get('num_threads'),
+                chunksize=kwds.get('chunksize'))
+        _assert(method == 'loop', 'Unknown method: {}'.format(method))
         more_points_than_data = m >= self.n
         if more_points_than_data:
             return self._loop_over_data(self.dataset, points, y, r)
         return self._loop_over_points(self.dataset, points, y, r)
 
 
+class BinnedKDE(KDE):
+
+    """ Kernel-Density Estimator built from data given in chunks.
+
+    The data are linearly binned on a fixed grid as they arrive, so the
+    memory used is bounded by the grid size and the size of a reservoir
+    subsample, and not by the number of data. Data can also be removed from
+    the grid or expire from a sliding window. Evaluating the estimate after
+    an update only redoes the fft convolution of the binned data with the
+    cached kernel fft.
+
+    Parameters
+    ----------
+    xmin, xmax  : vectors
+        range of the evaluation grid, which must cover the range of all the
+        data. The number of dimensions, d, is given by their length.
+    hs : array-like (optional)
+        smooting parameter vector/matrix.
+        (default compute from the reservoir subsample using
+        kernel.get_smoothing and rescale it to the total number of data)
+    kernel :  kernel function object.
+        kernel must have get_smoothing method
+    inc :  scalar integer (default 512)
+        number of grid points in each dimension.
+    sample_size : scalar integer (default 10000)
+        size of the reservoir subsample used to select the smoothing
+        parameter.
+    seed : int or None
+        seed of the random generator used for the reservoir sampling.
+    window : scalar integer or None
+        if given, only the window most recent data are kept in the estimate,
+        and older data expire as new data are added. The data in the window
+        are stored.
+    hs_update : real scalar (default 0)
+        the smoothing parameter is selected again when the number of data
+        added or removed since the last selection exceeds hs_update * n.
+        The default reselects it after every update and hs_update=np.inf
+        keeps the first selection. (Not used if hs is given.)
+
+    Members
+    -------
+    d : int
+        number of dimensions
+    n : int
+        number of datapoints binned
+    dataset : (d, min(n, sample_size))-array
+        uniform random subsample of the data (reservoir sample). Expired
+        data are replaced by other data in the window. Data removed with
+        kde.remove are replaced from the next chunk added.
+    counts : array
+        linear binned counts on the grid, shape (inc,) * d with 'ij' indexing
+
+    Methods
+    -------
+    kde.add(data)
+        bin a chunk of data and update the reservoir subsample
+    kde.remove(data)
+        remove a chunk of previously added data from the estimate
+    kde.eval_grid_fast() : array
+        evaluate the estimated pdf on the grid the data are binned on
+    kde.eval_grid(x0, x1,..., xd) : array
+        interpolate the estimated pdf on meshgrid(x0, x1,..., xd)
+    kde.eval_points(points) : array
+        interpolate the estimated pdf on a provided set of points
+    BinnedKDE.from_chunks(chunks, xmin, xmax) : BinnedKDE object
+        bin all the chunks from an iterable or generator
+    BinnedKDE.from_array(data, chunksize) : BinnedKDE object
+        bin a (memory mapped) array chunk by chunk
+
+    Example
+    -------
+    >>> import wafo.kdetools as wk
+    >>> data = np.random.RandomState(0).rayleigh(1, size=(1, 50000))
+    >>> kde = wk.BinnedKDE(xmin=-1, xmax=7, inc=256, sample_size=1000, seed=1)
+    >>> for chunk in np.split(data, 10, axis=1):
+    ...     kde = kde.add(chunk)
+    >>> kde.n, kde.dataset.shape
+    (50000, (1, 1000))
+    >>> f = kde.eval_grid_fast(output='plot')
+    >>> bool(np.abs(np.trapz(f.data, f.args) - 1) < 1e-3)
+    True
+
+    >>> mm = wk.BinnedKDE.from_array(data, chunksize=2**14, inc=256)
+    >>> mm.n
+    50000
+
+    Sliding window of the 20000 most recent data
+    >>> sw = wk.BinnedKDE(xmin=-1, xmax=7, inc=256, window=20000,
+    ...                   hs_update=0.5)
+    >>> for chunk in np.split(data, 10, axis=1):
+    ...     sw = sw.add(chunk)
+    >>> sw.n
+    20000
+    >>> f1 = wk.KDE(data[:, -20000:], hs=sw.hs, xmin=-1, xmax=7, inc=256)
+    >>> np.allclose(sw.eval_grid_fast(), f1.eval_grid_fast())
+    True
+    """
+
+    def __init__(self, xmin, xmax, hs=None, kernel=None, inc=512,
+                 sample_size=10000, seed=None, window=None, hs_update=0.0):
+        xmin, xmax = np.atleast_1d(xmin, xmax)
+        d = max(xmin.size, xmax.size)
+        self._xmin = xmin * np.ones(d)
+        self._xmax = xmax * np.ones(d)
+        _assert(np.all(self._xmin < self._xmax),
+                'xmin must be less than xmax!')
+        self.kernel = kernel if kernel else Kernel('gauss')
+        self.args = None
+        self._inc = int(inc)
+        self._alpha = 0.0
+        self.sample_size = int(sample_size)
+        self._random_state = np.random.RandomState(seed)
+        self._dataset = np.zeros((d, 0))
+        # sequence numbers of the data in the reservoir subsample
+        self._sample_index = np.zeros(0, dtype=np.int64)
+        self._num_seen = 0
+        self._num_data = 0
+        self.counts = np.zeros((self._inc,) * d)
+        self.window = window
+        self._window_data = deque()
+        self.hs_update = hs_update
+        self.hs = hs
+
+    @classmethod
+    def from_chunks(cls, chunks, xmin, xmax, **kwds):
+        """Return BinnedKDE object from an iterable of d x m data chunks."""
+        kde = cls(xmin, xmax, **kwds)
+        for chunk in chunks:
+            kde.add(chunk)
+        return kde
+
+    @classmethod
+    def from_array(cls, data, xmin=None, xmax=None, chunksize=2**20, **kwds):
+        """Return BinnedKDE object from a d x n (memory mapped) array.
+
+        The array is read in chunks of chunksize data. If xmin or xmax is not
+        given the default range min(data)-2*std(data), max(data)+2*std(data)
+        is found in an extra pass over the data.
+        """
+        n = np.shape(data)[-1]
+        chunks = [data[..., i:i + chunksize] for i in range(0, n, chunksize)]
+        if xmin is None or xmax is None:
+            datlo, datup, sigma = cls._range_and_std(chunks)
+            xmin = datlo - 2 * sigma if xmin is None else xmin
+            xmax = datup + 2 * sigma if xmax is None else xmax
+        return cls.from_chunks(chunks, xmin, xmax, **kwds)
+
+    @staticmethod
+    def _range_and_std(chunks):
+        datlo = datup = None
+        n, mean, m2 = 0, 0.0, 0.0
+        for chunk in chunks:
+            chunk = atleast_2d(chunk).astype(float)
+            lo, up = chunk.min(axis=1), chunk.max(axis=1)
+            datlo = lo if datlo is None else np.minimum(datlo, lo)
+            datup = up if datup is None else np.maximum(datup, up)
+            # Chan et al. parallel update of mean and sum of squares
+            m = chunk.shape[1]
+            mean_m = chunk.mean(axis=1)
+            delta = mean_m - mean
+            m2 = m2 + ((chunk - mean_m[:, None]) ** 2).sum(axis=1) + \
+                delta ** 2 * n * m / (n + m)
+            mean = mean + delta * m / (n + m)
+            n += m
+        return datlo, datup, sqrt(m2 / max(n - 1, 1))
+
+    @property
+    def n(self):
+        return self._num_data
+
+    @property
+    def inc(self):
+        return self._inc
+
+    @property
+    def hs(self):
+        if self._hs is None or self._num_changed > self.hs_update * self.n:
+            self._select_hs()
+        return self._hs
+
+    @hs.setter
+    def hs(self, hs):
+        # pylint: disable=attribute-defined-outside-init
+        self._hs_input = hs
+        self._hs = None
+        self._num_changed = 0
+        self._kernel_fft_cache = {}
+
+    def _select_hs(self):
+        """Select the smoothing parameter from the reservoir subsample."""
+        _assert(self.n > 0, 'No data binned yet!')
+        hs = self._hs_input
+        if self._hs is not None and hs is not None:
+            self._num_changed = 0
+            return
+        if hs is None:
+            num_sampled = self.dataset.shape[1]
+            _assert(num_sampled > 0, 'The reservoir subsample is empty, '
+                    'give hs!')
+            hs = self.kernel.get_smoothing(self.dataset)
+            # the selectors are univariate, i.e., hs is proportional to
+            # n**(-1/5). Rescale to the total number of data.
+            hs = hs * (num_sampled / self.n) ** (1. / 5)
+        KDE.hs.fset(self, hs)
+        # pylint: disable=attribute-defined-outside-init
+        self._num_changed = 0
+
+    def _check_chunk(self, data):
+        data = atleast_2d(data).astype(float)
+        _assert(data.shape[0] == self.d,
+                'Dimension 0 of data must be {}'.format(self.d))
+        if data.shape[1] > 0:
+            datlo, datup = data.min(axis=1), data.max(axis=1)
+            _assert(not ((datlo < self.xmin) | (self.xmax < datup)).any(),
+                    'The data is outside the range [xmin, xmax]!')
+        return data
+
+    def _bin(self, data, weight):
+        dx = (self.xmax - self.xmin) / (self.inc - 1)
+        linbin(data, self.xmin, dx, self.counts.shape, y=weight,
+               out=self.counts)
+        self._num_data += weight * data.shape[1]
+        self._num_changed += data.shape[1]
+
+    def add(self, data):
+        """Bin a chunk of data and update the reservoir subsample.
+
+        Parameters
+        ----------
+        data : (# of dims, # of data)-array
+            chunk of datapoints which must be within [xmin, xmax].
+
+        Returns
+        -------
+        self : BinnedKDE object
+
+        If window is given the oldest data are removed so that at most window
+        data remain in the estimate.
+        """
+        data = self._check_chunk(data)
+        if data.shape[1] == 0:
+            return self
+        self._update_reservoir(data)
+        self._num_seen += data.shape[1]
+        self._bin(data, 1)
+        if self.window is not None:
+            self._window_data.append(data)
+            self._expire(self.n - self.window)
+        return self
+
+    def _expire(self, num_expired):
+        """Remove the num_expired oldest data in the window."""
+        if num_expired <= 0:
+            return
+        while num_expired > 0:
+            oldest = self._window_data.popleft()
+            m = oldest.shape[1]
+            if m > num_expired:
+                self._window_data.appendleft(oldest[:, num_expired:])
+                oldest = oldest[:, :num_expired]
+            self._bin(oldest, -1)
+            num_expired -= oldest.shape[1]
+        self._keep_sample(self._sample_index >= self._num_seen - self.n)
+        self._refill_from_window()
+
+    def _refill_from_window(self):
+        """Refill the reservoir with a uniform draw of the other window data.
+
+        The data kept are a uniform subsample of the window, so adding a
+        uniform draw of the rest keeps it uniform.
+        """
+        num_missing = min(self.sample_size, self.n) - self._dataset.shape[1]
+        if num_missing <= 0:
+            return
+        first = self._num_seen - self.n
+        others = np.setdiff1d(np.arange(first, self._num_seen),
+                              self._sample_index, assume_unique=True)
+        index = self._random_state.choice(others, num_missing, replace=False)
+        data = np.hstack(self._window_data)
+        self._dataset = np.hstack((self._dataset, data[:, index - first]))
+        self._sample_index = np.hstack((self._sample_index, index))
+
+    def remove(self, data):
+        """Remove a chunk of previously added data from the estimate.
+
+        Parameters
+        ----------
+        data : (# of dims, # of data)-array
+            chunk of datapoints which have been added before.
+
+        Returns
+        -------
+        self : BinnedKDE object
+
+        The data are subtracted from the binned counts and each datapoint
+        removes at most one equal point from the reservoir subsample. It is
+        not checked that the data have been added. Use the window parameter
+        instead for sliding windows.
+        """
+        data = self._check_chunk(data)
+        _assert(data.shape[1] <= self.n,
+                'Can not remove more data than binned!')
+        _assert(self.window is None,
+                'Data are removed automatically when window is given!')
+        self._remove(data)
+        return self
+
+    def _remove(self, data):
+        self._bin(data, -1)
+        sample = self._dataset
+        if sample.shape[1] > 0:
+            self._keep_sample(~_in1d_once(_as_rows(sample), _as_rows(data)))
+
+    def _keep_sample(self, mask):
+        self._dataset = self._dataset[:, mask]
+        self._sample_index = self._sample_index[mask]
+
+    def _update_reservoir(self, data):
+        """Merge the chunk into the reservoir subsample.
+
+        Called before the data are binned, i.e., the reservoir is a uniform
+        subsample of the self.n data binned so far. The number of data kept
+        from the reservoir in a uniform subsample of all the n + m data is
+        hypergeometric, which gives the same distribution as reservoir
+        sampling (algorithm R) of the chunk. If removed data left the
+        reservoir short, the chunk fills up the rest.
+        """
+        n, m = self.n, data.shape[1]
+        num_sampled = self._dataset.shape[1]
+        size = min(self.sample_size, n + m)
+        random_state = self._random_state
+        num_old = 0
+        if n > 0 and size > 0:
+            num_old = min(random_state.hypergeometric(n, m, size),
+                          num_sampled)
+        num_new = min(size - num_old, m)
+        old = np.sort(random_state.choice(num_sampled, num_old,
+                                          replace=False))
+        new = np.sort(random_state.choice(m, num_new, replace=False))
+        self._dataset = np.hstack((self._dataset[:, old], data[:, new]))
+        self._sample_index = np.hstack((self._sample_index[old],
+                                        self._num_seen + new))
+
+    def _bin_data(self, xlo, dx, inc, y, dtype):
+        grid_dx = (self.xmax - self.xmin) / (self.inc - 1)
+        _assert(inc == self.inc and np.allclose(xlo, self.xmin) and
+                np.allclose(dx, grid_dx),
+                'The grid must be the grid the data are binned on, '
+                'i.e., kde.get_args()!')
+        _assert(np.all(np.asarray(y) == 1),
+                'Weighted data is not supported by BinnedKDE!')
+        return self.counts.astype(dtype)[None]
+
+    def _eval_points(self, points, **kwds):
+        args = self.get_args()
+        f = self.eval_grid_fast(*args, **kwds)
+        if self.d > 1:
+            f = f.swapaxes(0, 1)
+        return interpolate.interpn(args, f, points.T, bounds_error=False,
+                                   fill_value=0.0)
+
+
 class KRegression(object):
 
     """ Kernel-Regression
@@ -850,6 +1482,9 @@ class KRegression(object):
         number of dimensions
     n : int
         number of datapoints
+    se : array or None
+        pointwise standard error of the last kreg.eval_grid_fast estimate
+        computed with alpha given.
 
     Methods
     -------
@@ -862,6 +1497,12 @@ class KRegression(object):
     kde(x0, x1,..., xd) : array
         same as kde.eval_grid(x0, x1,..., xd)
 
+    The kreg.eval_grid_fast method bins the data and the response moments in
+    one pass and convolves all the moment grids together. If alpha is given,
+    e.g., kreg.eval_grid_fast(output='plot', alpha=0.05), it also computes
+    the pointwise standard error of the estimate, se, which is returned as
+    100*(1-alpha)% confidence bands in the dataCI member of the output
+    object. (Not available if L2 is given.)
 
     Example
     -------
@@ -878,6 +1519,14 @@ class KRegression(object):
     ...     [ 3.18670593,  3.18678088,  3.18682196,  3.18682932,  3.18680337])
     True
 
+    95% confidence bands
+    >>> fci = kreg(output='plotobj', alpha=0.05)
+    >>> fci.dataCI.shape == (len(fci.data), 2)
+    True
+    >>> lo, up = fci.dataCI.T
+    >>> bool(np.all(lo <= fci.data) & np.all(fci.data <= up))
+    True
+
     h = f.plot(label='p=0')
     """
 
@@ -887,13 +1536,70 @@ class KRegression(object):
         self.tkde = TKDE(data, hs=hs, kernel=kernel,
                          alpha=alpha, xmin=xmin, xmax=xmax, inc=inc, L2=L2)
         self.y = np.atleast_1d(y)
+        _assert(p in (0, 1), 'p must be 0 or 1 (got {})'.format(p))
         self.p = p
+        self.se = None
 
         self._grdfun = None
 
     def eval_grid_fast(self, *args, **kwds):
-        self._grdfun = self.tkde.eval_grid_fast
-        return self.tkde.eval_grid_fun(self._eval_gridfun, *args, **kwds)
+        alpha = kwds.pop('alpha', None)
+        compute_se = alpha is not None
+        if self.tkde.L2 is not None:
+            _assert(not compute_se,
+                    'Confidence bands are not available when L2 is given!')
+            self._grdfun = self.tkde.eval_grid_fast
+            return self.tkde.eval_grid_fun(self._eval_gridfun, *args, **kwds)
+        eval_grd = partial(self._eval_grid_binned, compute_se=compute_se)
+        f = self.tkde.eval_grid_fun(eval_grd, *args, **kwds)
+        if compute_se and isinstance(f, PlotData):
+            z0 = -_invnorm(alpha / 2)
+            f.dataCI = np.stack((f.data - z0 * self.se,
+                                 f.data + z0 * self.se), axis=-1)
+        return f
+
+    def _eval_grid_binned(self, *args, **kwds):
+        """Return binned local polynomial estimate.
+
+        The estimate is m(x) = sum(l_i(x) * y_i), where the weights l_i(x)
+        are given by the moments s_r = sum(K_i * (x - x_i)**r). If compute_se
+        is True the standard error, sqrt(sigma2(x) * sum(l_i(x)**2)), where
+        sigma2(x) is the local variance of the response around m(x), is
+        stored in self.se.
+        """
+        compute_se = kwds.pop('compute_se', False)
+        p = self.p
+        y = self.y
+        dtype = kwds.get('dtype', float)
+        # moments (m, r, power) of the data binned with weights [1, y, y**2]
+        weights = [np.ones_like(y), y]
+        moments = ([(0, r, 1) for r in range(2 * p + 1)] +
+                   [(1, r, 1) for r in range(p + 1)])
+        if compute_se:
+            weights.append(y ** 2)
+            moments += [(2, 0, 1)] + [(0, r, 2) for r in range(2 * p + 1)]
+        z = self.tkde.tkde._binned_convolutions(args, np.vstack(weights),
+                                                moments, dtype)
+        s = z[:2 * p + 1]
+        t = z[2 * p + 1:3 * p + 2]
+        if p == 0:
+            f = t[0] / (s[0] + _TINY)
+        else:
+            den = s[2] * s[0] - s[1] ** 2
+            f = (s[2] * t[0] - s[1] * t[1]) / den
+        f = f.clip(min=-_REALMAX, max=_REALMAX)
+        self.se = None
+        if compute_se:
+            u0 = z[3 * p + 2]
+            q = z[3 * p + 3:]
+            if p == 0:
+                sum_l2 = q[0] / (s[0] ** 2 + _TINY)
+            else:
+                sum_l2 = (s[2] ** 2 * q[0] - 2 * s[2] * s[1] * q[1] +
+                          s[1] ** 2 * q[2]) / den ** 2
+            sigma2 = (u0 - 2 * f * t[0] + f ** 2 * s[0]) / (s[0] + _TINY)
+            self.se = sqrt(sigma2.clip(min=0) * sum_l2.clip(min=0))
+        return f
 
     def eval_grid(self, *args, **kwds):
         self._grdfun = self.tkde.eval_grid
@@ -8,17 +8,17 @@ from abc import ABCMeta, abstractmethod
 import warnings
 import numpy as np
 from numpy import pi, sqrt, exp, percentile
-from numpy.fft import fft, ifft
 from scipy import optimize
 from scipy.special import gamma
 from scipy.linalg import sqrtm
-from wafo.misc import tranproc  # , trangood
-from wafo.kdetools.gridding import gridcount
+from numba import jit, float64, int64
+from wafo.kdetools.gridding import linbin
 from wafo.dctpack import dct
 from wafo.testing import test_docstrings
 from six import with_metaclass
 
-__all__ = ['Kernel', 'sphere_volume', 'qlevels', 'iqrange', 'percentile']
+__all__ = ['Kernel', 'sphere_volume', 'qlevels', 'QLevels', 'iqrange',
+           'percentile']
 
 
 def _assert(cond, msg):
@@ -31,6 +31,138 @@ def _assert_warn(cond, msg):
         warnings.warn(msg)
 
 
+def _get_datasets(data):
+    """Return list of 1D datasets from d x n array or list of 1D arrays."""
+    if isinstance(data, (list, tuple)) and len(data) > 0 and all(
+            np.ndim(x) == 1 for x in data):
+        return [np.asarray(x, dtype=float) for x in data]
+    return list(np.atleast_2d(data).astype(float))
+
+
+def _golden_section(fun, a, b, xtol):
+    """Return minimizer of the unimodal function fun in [a, b].
+
+    Golden section search which stops when the interval is less than xtol.
+    """
+    invphi = (sqrt(5) - 1) / 2
+    c, d = b - invphi * (b - a), a + invphi * (b - a)
+    fc, fd = fun(c), fun(d)
+    while abs(b - a) > xtol:
+        if fc < fd:
+            b, d, fd = d, c, fc
+            c = b - invphi * (b - a)
+            fc = fun(c)
+        else:
+            a, c, fc = c, d, fd
+            d = a + invphi * (b - a)
+            fd = fun(d)
+    return (a + b) / 2
+
+
+def _gauss_weights(xn, sigma):
+    """Return gaussian kernel weights K(xn / sigma) / sigma for each sigma.
+    """
+    sigma = np.atleast_1d(sigma)[:, np.newaxis]
+    t = xn / sigma
+    return _GAUSS_KERNEL(t.reshape(1, -1)).reshape(t.shape) / sigma
+
+
+class _BinnedDatasets(object):
+    """Linear binned 1D datasets with cached fft of the counts.
+
+    Parameters
+    ----------
+    datasets : list of 1D arrays
+        the datasets may have different lengths.
+    inc : int
+        number of grid points for each dataset.
+
+    Dataset i is binned on linspace(ax[i], bx[i], inc), where [ax[i], bx[i]]
+    covers the range of the data with a margin of 1/8 of the range on each
+    side. All the datasets are binned in one pass and the fft of the counts
+    is cached, so that the convolutions with the kernel weights done in the
+    bandwidth selectors only requires the fft of the kernel weights.
+    """
+
+    def __init__(self, datasets, inc=128):
+        self.inc = inc
+        self.data = datasets
+        self.n = np.array([len(x) for x in datasets])
+        min_a = np.array([x.min() for x in datasets])
+        max_a = np.array([x.max() for x in datasets])
+        offset = (max_a - min_a) / 8.0
+        self.ax, self.bx = min_a - offset, max_a + offset
+        self.delta = (self.bx - self.ax) / (inc - 1)
+
+        # Stack the datasets on one grid and bin them all at once
+        u = np.hstack([(x - ax) / dx + i * inc for i, (x, ax, dx)
+                       in enumerate(zip(datasets, self.ax, self.delta))])
+        c = linbin(u, 0, 1, (len(datasets) * inc,))
+        self.counts = c.reshape(-1, inc)
+        self._fft_counts = np.fft.rfft(self.counts, 2 * inc, axis=1)
+        weights = np.full(inc + 1, 2.0)
+        weights[[0, -1]] = 1
+        self._power = np.abs(self._fft_counts) ** 2 * weights / (2 * inc)
+
+    def xn(self, scale=1.0, index=slice(None)):
+        """Return grid offsets, shape len(index) x inc, divided by scale."""
+        delta = (self.delta / scale * np.ones(len(self.n)))[index]
+        return np.arange(self.inc) * delta[:, np.newaxis]
+
+    @staticmethod
+    def _fft_kernel(kw0):
+        """Return fft of the symmetric kernel weights kw0 evaluated at xn."""
+        m = kw0.shape[0]
+        kw = np.hstack((kw0, np.zeros((m, 1)), kw0[:, -1:0:-1]))
+        return np.fft.rfft(kw, axis=1)
+
+    def convolve(self, kw0, index=slice(None)):
+        """Return convolution of the counts with kernel weights kw0."""
+        z = np.fft.irfft(self._fft_counts[index] * self._fft_kernel(kw0),
+                         axis=1)
+        return z[:, :self.inc]
+
+    def estimate_psi(self, g, order=4, scale=1.0, index=slice(None)):
+        """Return binned estimate of the functional psi_order.
+
+        Parameters
+        ----------
+        g : array-like
+            bandwidth of the gaussian kernel for the datasets in index.
+        order : int
+            even order of psi.
+        scale : array-like
+            scale of the data, i.e., the grid spacing is delta / scale.
+        index : slice or array of indices
+            selected datasets.
+        """
+        g = np.atleast_1d(g) * np.ones(len(self.n))[index]
+        xn = self.xn(scale, index)
+        kw0 = _GAUSS_KERNEL.deriv4_6_8_10(xn / g[:, np.newaxis],
+                                          numout=(order - 2) // 2)[-1]
+        psi = self.quadratic_form(kw0, index)
+        return psi / (self.n[index] ** 2 * g ** (order + 1))
+
+    def quadratic_form(self, kw0, index=slice(None)):
+        """Return sum(c[j] * c[k] * kw(x[j] - x[k])) for the datasets in index.
+
+        The symmetric kernel weights kw0 are evaluated at xn. If index is an
+        integer, each row of kw0 is applied to the same dataset.
+        """
+        # sum(c * z) = sum(abs(fft(c))**2 * fft(kw)) / (2 * inc) (Parseval)
+        return (self._power[index] * self._fft_kernel(kw0).real).sum(axis=-1)
+
+    def power_nd(self):
+        """Return power spectrum of the counts of d x n data binned jointly.
+        """
+        d, inc = len(self.n), self.inc
+        c = linbin(np.vstack(self.data), self.ax, self.delta, (inc,) * d)
+        power = np.abs(np.fft.rfftn(c, s=(2 * inc,) * d)) ** 2
+        weights = np.full(inc + 1, 2.0)
+        weights[[0, -1]] = 1
+        return power * weights / (2 * inc) ** d
+
+
 # stats = (mu2, R, Rdd) where
 #     mu2 : 2'nd order moment, i.e.,int(x^2*kernel(x))
 #     R :  integral of squared kernel, i.e., int(kernel(x)^2)
@@ -45,7 +177,173 @@ _stats_logi = (pi ** 2 / 3, 1. / 6, 1 / 42)
 _stats_gaus = (1, 1. / (2 * sqrt(pi)), 3. / (8 * sqrt(pi)))
 
 
-def qlevels(pdf, p=(10, 30, 50, 70, 90, 95, 99, 99.9), xi=(), indexing='xy'):
+def _mass_levels(values, weights, offset, prev, targets, tol, nbins=1024,
+                 leafsize=4096):
+    """Return levels where the mass of values above the level equals targets.
+
+    The values are binned in a histogram by decreasing height and only the
+    bins containing the targets are refined, i.e., the values are never
+    fully sorted.
+
+    Parameters
+    ----------
+    values, weights : 1D arrays
+        heights and positive masses of the points.
+    offset : real scalar
+        mass of the points above values.max().
+    prev : tuple or None
+        (mass, value) of the lowest point above values.max().
+    targets : 1D array
+        sorted target masses.
+    tol : real scalar or None
+        width of the histogram bins the levels are interpolated within. If
+        None the levels are found by linear interpolation of the exact mass
+        curve.
+    """
+    vmax, vmin = values.max(), values.min()
+    if tol is None and (values.size <= leafsize or vmax == vmin):
+        ind = np.argsort(-values, kind='mergesort')
+        masses = offset + np.cumsum(weights[ind])
+        heights = values[ind]
+        if prev is not None:
+            masses, heights = np.r_[prev[0], masses], np.r_[prev[1], heights]
+        return np.interp(targets, masses, heights)
+
+    if tol is not None:
+        nbins = max(int(np.ceil((vmax - vmin) / tol)), 1)
+    width = (vmax - vmin) / nbins
+    bins = np.minimum(((vmax - values) / width).astype(np.intp), nbins - 1)
+    mass = np.bincount(bins, weights, minlength=nbins)
+    cum_mass = offset + np.cumsum(mass)
+    kbins = np.minimum(np.searchsorted(cum_mass, targets), nbins - 1)
+    if tol is not None:
+        before = cum_mass[kbins] - mass[kbins]
+        frac = np.clip((targets - before) / mass[kbins], 0, 1)
+        return vmax - (kbins + frac) * width
+
+    levels = np.empty(targets.shape)
+    nonempty = np.flatnonzero(mass > 0)
+    for k in np.unique(kbins):
+        mask = bins == k
+        if mask.all():  # no progress: bin width below resolution
+            return _mass_levels(values, weights, offset, prev, targets, tol,
+                                nbins, leafsize=values.size)
+        j = np.searchsorted(nonempty, k) - 1
+        prev_k = prev
+        if j >= 0:
+            kprev = nonempty[j]
+            prev_k = (cum_mass[kprev], values[bins == kprev].min())
+        sel = kbins == k
+        levels[sel] = _mass_levels(values[mask], weights[mask],
+                                   cum_mass[k] - mass[k], prev_k,
+                                   targets[sel], tol, nbins, leafsize)
+    return levels
+
+
+class QLevels(object):
+    """Quantile levels which encloses P% of pdf with caching.
+
+    Parameters
+    ----------
+    pdf: array-like
+        joint point density function given as array or vector
+    xi : tuple
+        input arguments to the pdf, i.e., (x0, x1,...., xn)
+    indexing : {'xy', 'ij'}, optional
+        Cartesian ('xy', default) or matrix ('ij') indexing of pdf.
+    tol : real scalar, optional
+        resolution of the levels. If given, the levels are interpolated
+        linearly within histogram bins of width tol. If None (default) the
+        bins are refined until the levels are linear interpolations of the
+        exact integrated pdf.
+
+    Call qlevels(p) to get the levels which encloses p% of pdf. The levels
+    already computed are stored in qlevels.cache so repeated queries do not
+    recompute them.
+
+    Example
+    -------
+    >>> import wafo.stats as ws
+    >>> x = np.linspace(-8,8,2001)
+    >>> ql = QLevels(ws.norm.pdf(x), xi=(x,))
+    >>> np.allclose(ql([50, 90]), [0.31830968, 0.103671], rtol=1e-5)
+    True
+    >>> sorted(ql.cache)
+    [50.0, 90.0]
+
+    See also
+    --------
+    qlevels
+    """
+
+    def __init__(self, pdf, xi=(), indexing='xy', tol=None):
+        pdf = np.atleast_1d(pdf)
+        _assert(not np.any(pdf < 0), 'This is not a pdf since one or more '
+                'values of pdf is negative')
+        self.pdf = pdf
+        self.tol = tol
+        self.cache = {}
+        self.size = pdf.size
+        if self.size == 0:
+            return
+        self.max, self.min = pdf.max(), pdf.min()
+        pdf_dx = self._pdf_dx(pdf, xi, indexing).ravel()
+        mask = pdf_dx > 0
+        self._weights = pdf_dx[mask]
+        self._values = pdf.ravel()[mask]
+        self._total = self._weights.sum()
+
+    @staticmethod
+    def _pdf_dx(pdf, xi, indexing):
+        def _dx(x):
+            dx = np.diff(x.ravel()) * 0.5
+            return np.r_[0, dx] + np.r_[dx, 0]
+
+        if not xi:
+            return pdf
+        if not isinstance(xi, tuple):
+            xi = (xi,)
+        dx = np.meshgrid(*[_dx(x) for x in xi], sparse=True, indexing=indexing)
+        dxij = np.ones((1))
+        for dxi in dx:
+            dxij = dxij * dxi
+        _assert(dxij.shape == pdf.shape,
+                'Shape of pdf does not match the arguments')
+        return pdf * dxij
+
+    def _check_levels(self, levels):
+        _assert_warn(not np.any(levels >= self.max),
+                     'The lowest percent level is too close to 0%')
+        _assert_warn(not np.any(levels <= self.min),
+                     'The given pdf is too sparsely sampled or the highest '
+                     'percent level is too close to 100%')
+
+    def _compute(self, p):
+        if self._values.size == 0:
+            return np.zeros(p.shape)
+        n = self.size
+        # normalize total mass to n/(n+1.5e-8) to reflect finite sampling
+        targets = p / 100.0 * self._total * (n + 1.5e-8) / n
+        return _mass_levels(self._values, self._weights, 0.0, None, targets,
+                            self.tol)
+
+    def __call__(self, p=(10, 30, 50, 70, 90, 95, 99, 99.9)):
+        p = np.atleast_1d(p).astype(float)
+        _assert(not np.any((p < 0) | (100 < p)),
+                'PL must satisfy 0 <= PL <= 100')
+        if self.size == 0:
+            return []
+        missing = np.unique([pi for pi in p if pi not in self.cache])
+        if missing.size:
+            self.cache.update(zip(missing, self._compute(missing)))
+        levels = np.array([self.cache[pi] for pi in p])
+        self._check_levels(levels)
+        levels[levels < 0] = 0.0
+        return levels
+
+
+def qlevels(pdf, p=(10, 30, 50, 70, 90, 95, 99, 99.9), xi=(), indexing='xy',
+            tol=None):
     """QLEVELS Calculates quantile levels which encloses P% of pdf.
 
     Parameters
@@ -59,6 +357,11 @@ def qlevels(pdf, p=(10, 30, 50, 70, 90, 95, 99, 99.9), xi=(), indexing='xy'):
     indexing : {'xy', 'ij'}, optional
         Cartesian ('xy', default) or matrix ('ij') indexing of pdf.
         See numpy.meshgrid for more details.
+    tol : real scalar, optional
+        resolution of the levels. If given, the levels are interpolated
+        linearly within histogram bins of width tol. If None (default) the
+        bins are refined until the levels are linear interpolations of the
+        exact integrated pdf.
 
     Returns
     ------
@@ -72,14 +375,20 @@ def qlevels(pdf, p=(10, 30, 50, 70, 90, 95, 99, 99.9), xi=(), indexing='xy'):
     NB! QLEVELS normalizes the integral of PDF to n/(n+0.001) before
     calculating 'levels' in order to reflect the sampling of PDF is finite.
 
+    The pdf values are not sorted. Instead they are binned in a histogram by
+    decreasing height and only the bins containing the levels are refined
+    until they are small enough to be sorted. Use QLevels to cache the levels
+    for repeated queries.
+
     Example
     -------
     >>> import wafo.stats as ws
     >>> x = np.linspace(-8,8,2001);
     >>> PL = np.r_[10:90:20, 90, 95, 99, 99.9]
-    >>> qlevels(ws.norm.pdf(x),p=PL, xi=(x,));
-    array([ 0.39591707,  0.37058719,  0.31830968,  0.23402133,  0.10362052,
-            0.05862129,  0.01449505,  0.00178806])
+    >>> np.allclose(qlevels(ws.norm.pdf(x),p=PL, xi=(x,)),
+    ...     [0.39591707, 0.37058719, 0.31830968, 0.23402133, 0.103671,
+    ...      0.05844683, 0.01446518, 0.00179202])
+    True
 
     # compared with the exact values
     >>> ws.norm.pdf(ws.norm.ppf((100-PL)/200))
@@ -88,61 +397,10 @@ def qlevels(pdf, p=(10, 30, 50, 70, 90, 95, 99, 99.9), xi=(), indexing='xy'):
 
     See also
     --------
-    qlevels2, tranproc
+    QLevels, qlevels2, tranproc
 
     """
-    def _dx(x):
-        dx = np.diff(x.ravel()) * 0.5
-        return np.r_[0, dx] + np.r_[dx, 0]
-
-    def _init(pdf, xi, indexing):
-        if not xi:
-            return pdf.ravel()
-        if not isinstance(xi, tuple):
-            xi = (xi,)
-        dx = np.meshgrid(*[_dx(x) for x in xi], sparse=True, indexing=indexing)
-        dxij = np.ones((1))
-        for dxi in dx:
-            dxij = dxij * dxi
-        _assert(dxij.shape == pdf.shape,
-                'Shape of pdf does not match the arguments')
-        return (pdf * dxij).ravel()
-
-    def _check_levels(levels, pdf):
-        _assert_warn(not np.any(levels >= max(pdf.ravel())),
-                     'The lowest percent level is too close to 0%')
-        _assert_warn(not np.any(levels <= min(pdf.ravel())),
-                     'The given pdf is too sparsely sampled or the highest '
-                     'percent level is too close to 100%')
-
-    pdf, p = np.atleast_1d(pdf, p)
-    _assert(not any(pdf.ravel() < 0),
-            'This is not a pdf since one or more values of pdf is negative')
-    _assert(not np.any((p < 0) | (100 < p)), 'PL must satisfy 0 <= PL <= 100')
-
-    if min(pdf.shape) == 0:
-        return []
-
-    ind = np.argsort(pdf.ravel())  # sort by height of pdf
-    ind = ind[::-1]
-    sorted_pdf = pdf.flat[ind]
-
-    pdf_dx = _init(pdf, xi, indexing=indexing)
-    # integration in the order of decreasing height of pdf
-    cdf = np.cumsum(pdf_dx[ind])
-    n = pdf_dx.size
-    # normalize cdf to make sure int pdf dx1 dx2 approx 1
-    cdf = cdf / cdf[-1] * n / (n + 1.5e-8)
-
-    # make sure cdf is strictly increasing by not considering duplicate values
-    ind, = np.where(np.diff(np.r_[cdf, 1]) > 0)
-
-    # calculating the inverse of cdf to find the levels
-    levels = tranproc(cdf[ind], sorted_pdf[ind], p / 100.0)
-
-    _check_levels(levels, pdf)
-    levels[levels < 0] = 0.0
-    return levels
+    return QLevels(pdf, xi=xi, indexing=indexing, tol=tol)(p)
 
 
 def qlevels2(data, p=(10, 30, 50, 70, 90, 95, 99, 99.9), method=1):
@@ -261,7 +519,49 @@ def sphere_volume(d, r=1.0):
     return (r ** d) * 2.0 * pi ** (d / 2.0) / (d * gamma(d / 2.0))
 
 
+@jit(float64(int64, float64, float64, int64), nopython=True, nogil=True)
+def _kernel_factor(kind, u_k, r, p):
+    """Return contribution of coordinate u_k to the kernel value.
+
+    The kind is the _Kernel.kind attribute of the kernel classes below.
+    The contributions are summed for the radial kernels (kind 0, 4 and 5),
+    see _kernel_radial, and multiplied for the product kernels.
+    """
+    if kind == 0 or kind == 4:  # multivariate p-weight, gaussian
+        return u_k * u_k
+    if kind == 5:  # laplace
+        return abs(u_k)
+    if kind == 1:  # product of 1D p-weight
+        t = 1.0 - (u_k / r) ** 2
+        return t ** p if t > 0 else 0.0
+    if kind == 2:  # rectangular
+        return 1.0 if abs(u_k) <= r else 0.0
+    if kind == 3:  # triangular
+        t = 1.0 - abs(u_k)
+        return t if t > 0 else 0.0
+    # logistic: s / (s + 1)**2 = e / (1 + e)**2 with e = exp(-|u|)
+    e = np.exp(-abs(u_k))
+    return e / (1.0 + e) ** 2
+
+
+@jit(float64(int64, float64, float64, int64), nopython=True, nogil=True)
+def _kernel_radial(kind, total, r, p):
+    """Return kernel value from the sum of the factors of radial kernels."""
+    if kind == 0:
+        t = 1.0 - total / (r * r)
+        return t ** p if t > 0 else 0.0
+    if kind == 4:
+        sigma = r / 4.0
+        return np.exp(-0.5 * total / (sigma * sigma))
+    return np.exp(-total)
+
+
 class _Kernel(with_metaclass(ABCMeta)):
+    # Minkowski p-norm in which the support of the kernel is a ball.
+    support_p_norm = np.inf
+    # kernel type used by the compiled _kernel_factor function
+    kind = -1
+    p = 0
 
     def __init__(self, r=1.0, stats=None, name=''):
         self.r = r  # radius of effective support of kernel
@@ -314,6 +614,28 @@ class _Kernel(with_metaclass(ABCMeta)):
 
     def _effective_support(self):
         return -self.r, self.r
+
+    def truncation_radius(self, tol=None):
+        """Return radius of the ball outside which the kernel is negligible.
+
+        Parameters
+        ----------
+        tol : real scalar or None
+            truncation tolerance, i.e., the (unnormalized) kernel is less than
+            tol outside the ball. Compactly supported kernels are never
+            truncated. If tol is None the effective support is used.
+
+        The ball is measured in the support_p_norm of the kernel.
+        Raises ValueError unless tol is None or 0 < tol < 1.
+        """
+        self._check_tol(tol)
+        return self.r
+
+    @staticmethod
+    def _check_tol(tol):
+        if tol is not None and not 0 < tol < 1:
+            raise ValueError('tol must be in the open interval (0, 1), '
+                             'got {}'.format(tol))
     __call__ = kernel
 
 
@@ -325,6 +647,8 @@ class _KernelMulti(_Kernel):
     p=3;  Multivariate Tri-weight Kernel
     p=4;  Multivariate Four-weight Kernel
     """
+    support_p_norm = 2
+    kind = 0
 
     def __init__(self, r=1.0, p=1, stats=None, name=''):
         self.p = p
@@ -358,6 +682,8 @@ class _KernelProduct(_KernelMulti):
     p=3;  1D product Tri-weight Kernel
     p=4;  1D product Four-weight Kernel
     """
+    support_p_norm = np.inf
+    kind = 1
 
     def norm_factor(self, d=1, n=None):
         r = self.r
@@ -380,6 +706,7 @@ mkernel_p1triweight = _KernelProduct(p=3, stats=_stats_triw,
 
 
 class _KernelRectangular(_Kernel):
+    kind = 2
 
     def _kernel(self, x):
         return np.where(np.all(np.abs(x) <= self.r, axis=0), 1, 0.0)
@@ -393,6 +720,7 @@ mkernel_rectangular = _KernelRectangular(stats=_stats_rect)
 
 
 class _KernelTriangular(_Kernel):
+    kind = 3
 
     def _kernel(self, x):
         pdf = (1 - np.abs(x)).clip(min=0.0)
@@ -403,6 +731,8 @@ mkernel_triangular = _KernelTriangular(stats=_stats_tria)
 
 
 class _KernelGaussian(_Kernel):
+    support_p_norm = 2
+    kind = 4
 
     def _kernel(self, x):
         sigma = self.r / 4.0
@@ -413,6 +743,13 @@ class _KernelGaussian(_Kernel):
         sigma = self.r / 4.0
         return (2 * pi * sigma) ** (d / 2.0)
 
+    def truncation_radius(self, tol=None):
+        self._check_tol(tol)
+        if tol is None:
+            return self.r
+        sigma = self.r / 4.0
+        return sigma * sqrt(-2 * np.log(tol))
+
     def deriv4_6_8_10(self, t, numout=4):
         """Returns 4th, 6th, 8th and 10th derivatives of the kernel function.
         """
@@ -439,6 +776,14 @@ _GAUSS_KERNEL = mkernel_gaussian
 
 
 class _KernelLaplace(_Kernel):
+    support_p_norm = 1
+    kind = 5
+
+    def truncation_radius(self, tol=None):
+        self._check_tol(tol)
+        if tol is None:
+            return self.r
+        return -np.log(tol)
 
     def _kernel(self, x):
         absX = np.abs(x)
@@ -452,6 +797,15 @@ mkernel_laplace = _KernelLaplace(r=7.0, stats=_stats_lapl)
 
 
 class _KernelLogistic(_Kernel):
+    support_p_norm = 1
+    kind = 6
+
+    def truncation_radius(self, tol=None):
+        # kernel(x) <= exp(-sum(abs(x)))
+        self._check_tol(tol)
+        if tol is None:
+            return self.r
+        return -np.log(tol)
 
     def _kernel(self, x):
         s = exp(x)
@@ -514,7 +868,7 @@ class Kernel(object):
     >>> gauss = wk.Kernel('gaussian')
     >>> gauss.stats()
     (1, 0.28209479177387814, 0.21157109383040862)
-    >>> np.allclose(gauss.hscv(data), 0.21555043)
+    >>> np.allclose(gauss.hscv(data), 0.21562016)
     True
     >>> np.allclose(gauss.hstt(data), 0.16341135)
     True
@@ -525,6 +879,13 @@ class Kernel(object):
     >>> wk.Kernel('laplace').stats()
     (2, 0.25, inf)
 
+    The bandwidth selectors accept a list of (ragged) 1D datasets as well as
+    a d x n data array. All the datasets are binned once in one pass and the
+    fixed-point iterations are done simultaneously for all the datasets.
+    >>> hs = gauss.hste([data, data[:10], data[5:]])
+    >>> np.allclose(hs[0], gauss.hste(data))
+    True
+
     >>> triweight = wk.Kernel('triweight')
     >>> np.allclose(triweight.stats(),
     ...            (0.1111111111111111, 0.81585081585081587, np.inf))
@@ -591,13 +952,20 @@ class Kernel(object):
     def effective_support(self):
         return self.kernel.effective_support()
 
+    @property
+    def support_p_norm(self):
+        return self.kernel.support_p_norm
+
+    def truncation_radius(self, tol=None):
+        return self.kernel.truncation_radius(tol)
+
     def hns(self, data):
         """Returns Normal Scale Estimate of Smoothing Parameter.
 
         Parameter
         ---------
         data : 2D array
-            shape d x n (d = # dimensions )
+            shape d x n (d = # dimensions ) or list of d 1D datasets.
 
         Returns
         -------
@@ -639,12 +1007,12 @@ class Kernel(object):
         Chapman and Hall, pp 60--63
         """
 
-        a = np.atleast_2d(data)
-        n = a.shape[1]
+        datasets = _get_datasets(data)
+        n = np.array([len(x) for x in datasets])
 
         amise_constant = self.kernel.get_amise_constant(n)
-        iqr = iqrange(a, axis=1)  # interquartile range
-        std_a = np.std(a, axis=1, ddof=1)
+        iqr = np.array([iqrange(x) for x in datasets])  # interquartile range
+        std_a = np.array([np.std(x, ddof=1) for x in datasets])
         # use of interquartile range guards against outliers.
         # the use of interquartile range is better if
         # the distribution is skew or have heavy tails
@@ -793,66 +1161,60 @@ class Kernel(object):
           Chapman and Hall, pp 74--75
         '''
 
-        A = np.atleast_2d(data)
-        d, n = A.shape
+        datasets = _get_datasets(data)
+        binned = _BinnedDatasets(datasets, inc)
+        n = binned.n
 
         amise_constant = self.kernel.get_amise_constant(n)
         ste_constant = self.kernel.get_ste_constant(n)
 
-        sigmaA = self.hns(A) / amise_constant
+        sigmaA = self.hns(datasets) / amise_constant
         if h0 is None:
             h0 = sigmaA * amise_constant
 
-        h = np.asarray(h0, dtype=float)
-
-        ax1, bx1 = self._get_grid_limits(A)
+        h = np.array(h0, dtype=float) * np.ones(len(n))
 
         mu2, R = _GAUSS_KERNEL.stats[:2]
         ste_constant2 = _GAUSS_KERNEL.get_ste_constant(n)
 
-        for dim in range(d):
-            s = sigmaA[dim]
-            ax = ax1[dim]
-            bx = bx1[dim]
-
-            xa = np.linspace(ax, bx, inc)
-            xn = np.linspace(0, bx - ax, inc)
+        psi6NS = _GAUSS_KERNEL.psi(6, sigmaA)
+        psi8NS = _GAUSS_KERNEL.psi(8, sigmaA)
 
-            c = gridcount(A[dim], xa)
+        k40, k60 = _GAUSS_KERNEL.deriv4_6_8_10(0, numout=2)
+        g1 = self._get_g(k40, mu2, psi6NS, n, order=6)
+        g2 = self._get_g(k60, mu2, psi8NS, n, order=8)
 
-            psi6NS = _GAUSS_KERNEL.psi(6, s)
-            psi8NS = _GAUSS_KERNEL.psi(8, s)
+        psi4 = binned.estimate_psi(g1, order=4)
+        psi6 = binned.estimate_psi(g2, order=6)
 
-            k40, k60 = _GAUSS_KERNEL.deriv4_6_8_10(0, numout=2)
-            g1 = self._get_g(k40, mu2, psi6NS, n, order=6)
-            g2 = self._get_g(k60, mu2, psi8NS, n, order=8)
+        def update(h1, i):
+            gamma_ = ((2 * k40 * mu2 * psi4[i] * h1 ** 5) /
+                      (-psi6[i] * R)) ** (1.0 / 7)
+            psi4Gamma = binned.estimate_psi(gamma_, order=4, index=i)
+            return (ste_constant2[i] / psi4Gamma) ** (1.0 / 5)
 
-            psi4 = self._estimate_psi(c, xn, g1, n, order=4)
-            psi6 = self._estimate_psi(c, xn, g2, n, order=6)
+        h = self._fixed_point_iterations(update, h, 0, maxit, releps, abseps)
 
-            h1 = h[dim]
-            h_old = 0
-            count = 0
+        # Kernel other than Gaussian scale bandwidth
+        return h * (ste_constant / ste_constant2) ** (1.0 / 5)
 
-            while ((abs(h_old - h1) > max(releps * h1, abseps)) and
-                   (count < maxit)):
-                count += 1
-                h_old = h1
-
-                gamma_ = ((2 * k40 * mu2 * psi4 * h1 ** 5) /
-                          (-psi6 * R)) ** (1.0 / 7)
-
-                psi4Gamma = self._estimate_psi(c, xn, gamma_, n, order=4)
-
-                h1 = (ste_constant2 / psi4Gamma) ** (1.0 / 5)
-
-            # Kernel other than Gaussian scale bandwidth
-            h1 = h1 * (ste_constant / ste_constant2) ** (1.0 / 5)
-
-            _assert_warn(count < maxit, 'The obtained value did not converge.')
-
-            h[dim] = h1
-        # end for dim loop
+    @staticmethod
+    def _fixed_point_iterations(update, h, count, maxit, releps, abseps):
+        """Iterate h = update(h, index) for the unconverged datasets."""
+        def not_converged(h1, h_old):
+            return np.abs(h_old - h1) > np.maximum(releps * h1, abseps)
+
+        counts = np.full(h.shape, count)
+        active = not_converged(h, 0) & (counts < maxit)
+        while active.any():
+            i = np.flatnonzero(active)
+            counts[i] += 1
+            h_old = h[i]
+            h[i] = update(h_old, i)
+            active[i] = not_converged(h[i], h_old) & (counts[i] < maxit)
+
+        _assert_warn(np.all(counts < maxit),
+                     'The obtained value did not converge.')
         return h
 
     def hisj(self, data, inc=512, L=7):
@@ -879,23 +1241,24 @@ class Kernel(object):
         Z. I. Botev, J. F. Grotowski, and D. P. Kroese (2010)
         Annals of Statistics, Volume 38, Number 5, pages 2916-2957.
         '''
-        A = np.atleast_2d(data)
-        d, n = A.shape
+        datasets = _get_datasets(data)
+        binned = _BinnedDatasets(datasets, inc)
+        n = binned.n
         ste_constant = self.kernel.get_ste_constant(n)
-        ax1, bx1 = self._get_grid_limits(A)
-
         ste_constant2 = _GAUSS_KERNEL.get_ste_constant(n)
 
-        def fixed_point(t, N, I, a2):
+        I = np.asfarray(np.arange(1, inc)) ** 2
+        logI = np.log(I)
+
+        def fixed_point(t, N, a2):
             ''' this implements the function t-zeta*gamma^[L](t)'''
 
             prod = np.prod
-            # L = 7
-            logI = np.log(I)
 
             def fun(s, time):
                 return (2 * pi ** (2 * s) *
-                        (a2 * exp(s * logI - I * pi ** 2 * time)).sum())
+                        (a2 * exp(s * logI - I * pi ** 2 *
+                                  time[:, np.newaxis])).sum(axis=1))
             f = fun(L, t)
             for s in range(L - 1, 1, -1):
                 K0 = prod(np.r_[1:2 * s:2]) / sqrt(2 * pi)
@@ -904,54 +1267,49 @@ class Kernel(object):
                 f = fun(s, time)
             return t - (2 * N * sqrt(pi) * f) ** (-2. / 5)
 
-        h = np.empty(d)
-        for dim in range(d):
-            ax, bx = ax1[dim], bx1[dim]
-            xa = np.linspace(ax, bx, inc)
-            R = bx - ax
-
-            c = gridcount(A[dim], xa)
-            N = len(set(A[dim]))
-            a = dct(c / len(A[dim]), norm=None)
-
-            # now compute the optimal bandwidth^2 using the referenced method
-            I = np.asfarray(np.arange(1, inc)) ** 2
-            a2 = (a[1:] / 2) ** 2
-
-            x = np.linspace(0, 0.1, 150)
-            ai = x[0]
-            bi = x[1]
-            f0 = fixed_point(ai, N, I, a2)
-            for xi in x[1:]:
-                bi = xi
-                f1 = fixed_point(bi, N, I, a2)
-                if f1 * f0 <= 0:
-                    # print('ai = %g, bi = %g' % (ai,bi))
-                    break
-                else:
-                    ai = xi
-
+        N = np.array([len(set(x)) for x in datasets])
+        a = dct(binned.counts / n[:, np.newaxis], norm=None, axis=1)
+
+        # now compute the optimal bandwidth^2 using the referenced method
+        a2 = (a[:, 1:] / 2) ** 2
+
+        # bracket the roots of all the datasets simultaneously
+        x = np.linspace(0, 0.1, 150)
+        ai = np.full(len(n), x[0])
+        bi = np.full(len(n), x[1])
+        f0 = fixed_point(ai, N, a2)
+        searching = np.ones(len(n), dtype=bool)
+        for xi in x[1:]:
+            i = np.flatnonzero(searching)
+            if len(i) == 0:
+                break
+            bi[i] = xi
+            found = fixed_point(bi[i], N[i], a2[i]) * f0[i] <= 0
+            searching[i[found]] = False
+            ai[i[~found]] = xi
+
+        t_star = np.empty(len(n))
+        for i in range(len(n)):
             # use  fzero to solve the equation t=zeta*gamma^[5](t)
             try:
-                t_star = optimize.brentq(lambda t: fixed_point(t, N, I, a2),
-                                         a=ai, b=bi)
+                t_star[i] = optimize.brentq(
+                    lambda t: fixed_point(np.atleast_1d(t), N[i:i + 1],
+                                          a2[i:i + 1])[0], a=ai[i], b=bi[i])
             except Exception as err:
-                t_star = 0.28 * N ** (-2. / 5)
+                t_star[i] = 0.28 * N[i] ** (-2. / 5)
                 warnings.warn('Failure in obtaining smoothing parameter'
                               ' ({})'.format(str(err)))
 
-            # smooth the discrete cosine transform of initial data using t_star
-            # a_t = a*exp(-np.arange(inc)**2*pi**2*t_star/2)
-            # now apply the inverse discrete cosine transform
-            # density = idct(a_t)/R;
+        # smooth the discrete cosine transform of initial data using t_star
+        # a_t = a*exp(-np.arange(inc)**2*pi**2*t_star/2)
+        # now apply the inverse discrete cosine transform
+        # density = idct(a_t)/R;
 
-            # take the rescaling of the data into account
-            bandwidth = sqrt(t_star) * R
+        # take the rescaling of the data into account
+        bandwidth = sqrt(t_star) * (binned.bx - binned.ax)
 
-            # Kernel other than Gaussian scale bandwidth
-            h[dim] = bandwidth * (ste_constant / ste_constant2) ** (1.0 / 5)
-        # end  for dim loop
-        return h
+        # Kernel other than Gaussian scale bandwidth
+        return bandwidth * (ste_constant / ste_constant2) ** (1.0 / 5)
 
     def hstt(self, data, h0=None, inc=128, maxit=100, releps=0.01, abseps=0.0):
         '''HSTT Scott-Tapia-Thompson estimate of smoothing parameter.
@@ -993,67 +1351,39 @@ class Kernel(object):
          'Density estimation for statistics and data analysis'
           Chapman and Hall, pp 57--61
         '''
-        A = np.atleast_2d(data)
-        d, n = A.shape
+        datasets = _get_datasets(data)
+        binned = _BinnedDatasets(datasets, inc)
+        n = binned.n
 
         amise_constant = self.kernel.get_amise_constant(n)
         ste_constant = self.kernel.get_ste_constant(n)
 
-        sigmaA = self.hns(A) / amise_constant
+        sigmaA = self.hns(datasets) / amise_constant
         if h0 is None:
             h0 = sigmaA * amise_constant
 
-        h = np.asarray(h0, dtype=float)
+        h = np.array(h0, dtype=float) / sigmaA
+        delta = binned.delta / sigmaA
+        norm_factor = self.norm_factor(d=1)
 
-        ax1, bx1 = self._get_grid_limits(A)
+        def update(h1, i):
+            xn = binned.xn(sigmaA, i) / h1[:, np.newaxis]
+            kw4 = self.kernel(xn.reshape(1, -1)).reshape(xn.shape)
+            kw4 /= (n[i] * h1 * norm_factor)[:, np.newaxis]
+            f = binned.convolve(kw4, i)  # convolution.
 
-        for dim in range(d):
-            s = sigmaA[dim]
-            datan = A[dim] / s
-            ax = ax1[dim] / s
-            bx = bx1[dim] / s
-
-            xa = np.linspace(ax, bx, inc)
-            xn = np.linspace(0, bx - ax, inc)
-
-            c = gridcount(datan, xa)
-
-            count = 1
-            h_old = 0
-            h1 = h[dim] / s
-            delta = (bx - ax) / (inc - 1)
-            while ((abs(h_old - h1) > max(releps * h1, abseps)) and
-                   (count < maxit)):
-                count += 1
-                h_old = h1
-
-                kw4 = self.kernel(xn / h1) / (n * h1 * self.norm_factor(d=1))
-                kw = np.r_[kw4, 0, kw4[-1:0:-1]]  # Apply 'fftshift' to kw.
-                f = np.real(ifft(fft(c, 2 * inc) * fft(kw)))  # convolution.
-
-                # Estimate psi4=R(f'') using simple finite differences and
-                # quadrature.
-                ix = np.arange(1, inc - 1)
-                z = ((f[ix + 1] - 2 * f[ix] + f[ix - 1]) / delta ** 2) ** 2
-                psi4 = delta * z.sum()
-                h1 = (ste_constant / psi4) ** (1. / 5)
-
-            _assert_warn(count < maxit, 'The obtained value did not converge.')
-
-            h[dim] = h1 * s
-        # end # for dim loop
-        return h
+            # Estimate psi4=R(f'') using simple finite differences and
+            # quadrature.
+            z = ((f[:, 2:] - 2 * f[:, 1:-1] + f[:, :-2]) /
+                 delta[i, np.newaxis] ** 2) ** 2
+            psi4 = delta[i] * z.sum(axis=1)
+            return (ste_constant[i] / psi4) ** (1. / 5)
 
-    @staticmethod
-    def _estimate_psi(c, xn, gi, n, order=4):
-        # order = numout*2+2
-        inc = len(xn)
-        kw0 = _GAUSS_KERNEL.deriv4_6_8_10(xn / gi, numout=(order - 2) // 2)[-1]
-        kw = np.r_[kw0, 0, kw0[-1:0:-1]]  # Apply fftshift to kw.
-        z = np.real(ifft(fft(c, 2 * inc) * fft(kw)))     # convolution.
-        return np.sum(c * z[:inc]) / (n ** 2 * gi ** (order + 1))
-
-    def hscv(self, data, hvec=None, inc=128, maxit=100, fulloutput=False):
+        h = self._fixed_point_iterations(update, h, 1, maxit, releps, abseps)
+        return h * sigmaA
+
+    def hscv(self, data, hvec=None, inc=128, maxit=100, fulloutput=False,
+             method='fft', joint=False):
         '''
         HSCV Smoothed cross-validation estimate of smoothing parameter.
 
@@ -1066,12 +1396,21 @@ class Kernel(object):
         inc = length of estimated kerneldensity estimate
         maxit = maximum number of iterations
         fulloutput = True if fulloutput is wanted
+        method = 'fft' computes the score for all values of hvec from the
+                 fft of the binned data (default).
+                 'direct' sums the kernel over all pairs of data.
+        joint = if True the diagonal bandwidth of d x n data is refined by
+                minimizing the multivariate score jointly over all
+                dimensions. Otherwise each dimension is treated separately.
 
         Returns
         -------
         hs     = smoothing parameter
-        hvec   = vector defining possible values of hs
         score  = score vector
+        hvec   = vector defining possible values of hs
+
+        The minimum of the score is refined by golden section search
+        between the neighbouring values of hvec.
 
           Example
           ------
@@ -1097,27 +1436,27 @@ class Kernel(object):
         Chapman and Hall, pp 75--79
         '''
 
-        A = np.atleast_2d(data)
-        d, n = A.shape
+        datasets = _get_datasets(data)
+        binned = _BinnedDatasets(datasets, inc)
+        n = binned.n
+        d = len(n)
 
         amise_constant = self.kernel.get_amise_constant(n)
         ste_constant = self.kernel.get_ste_constant(n)
 
-        sigmaA = self.hns(A) / amise_constant
+        sigmaA = self.hns(datasets) / amise_constant
         if hvec is None:
             H = amise_constant / 0.93
-            hvec = np.linspace(0.25 * H, H, maxit)
-        hvec = np.asarray(hvec, dtype=float)
-
-        steps = len(hvec)
-        score = np.zeros(steps)
+            hvec = np.linspace(0.25 * H, H, maxit, axis=-1)
+        hvec = np.asarray(hvec, dtype=float) * np.ones((d, 1))
 
-        ax1, bx1 = self._get_grid_limits(A)
+        steps = hvec.shape[-1]
+        score = np.zeros((d, steps))
 
         ste_constant2 = _GAUSS_KERNEL.get_ste_constant(n)
 
         h = np.zeros(d)
-        hvec = hvec * (ste_constant2 / ste_constant) ** (1. / 5.)
+        hvec = hvec * ((ste_constant2 / ste_constant) ** (1. / 5.))[:, None]
 
         k40, k60, k80, k100 = _GAUSS_KERNEL.deriv4_6_8_10(0, numout=4)
         mu2 = _GAUSS_KERNEL.stats[0]
@@ -1128,64 +1467,125 @@ class Kernel(object):
         g1 = self._get_g(k60, mu2, psi8, n, order=8)
         g2 = self._get_g(k100, mu2, psi12, n, order=12)
 
-        for dim in range(d):
-            s = sigmaA[dim]
-            ax = ax1[dim] / s
-            bx = bx1[dim] / s
-            datan = A[dim] / s
-
-            xa = np.linspace(ax, bx, inc)
-            xn = np.linspace(0, bx - ax, inc)
-
-            c = gridcount(datan, xa)
+        psi6 = binned.estimate_psi(g1, order=6, scale=sigmaA)
+        psi10 = binned.estimate_psi(g2, order=10, scale=sigmaA)
+
+        g3 = self._get_g(k40, mu2, psi6, n, order=6)
+        g4 = self._get_g(k80, mu2, psi10, n, order=10)
+
+        psi4 = binned.estimate_psi(g3, order=4, scale=sigmaA)
+        psi8 = binned.estimate_psi(g4, order=8, scale=sigmaA)
+
+        const = ((441. / (64 * pi)) ** (1. / 18.) *
+                 (4 * pi) ** (-1. / 5.) *
+                 psi4 ** (-2. / 5.) * psi8 ** (-1. / 9.))
+
+        def score_fun(dim, hi):
+            """Return score for each candidate bandwidth hi."""
+            hi = np.atleast_1d(hi)
+            g = const[dim] * n[dim] ** (-23. / 45) * hi ** (-2)
+            sig1 = sqrt(2 * hi ** 2 + 2 * g ** 2)
+            sig2 = sqrt(hi ** 2 + 2 * g ** 2)
+            sig3 = sqrt(2 * g ** 2)
+            if method == 'fft':
+                xn = binned.xn(sigmaA[dim], [dim])[0]
+                term2 = (binned.quadratic_form(_gauss_weights(xn, sig1), dim) -
+                         2 * binned.quadratic_form(_gauss_weights(xn, sig2),
+                                                   dim) +
+                         binned.quadratic_form(_gauss_weights(xn, sig3), dim))
+            else:
+                Y = np.atleast_2d(datasets[dim] / sigmaA[dim])
+                Y = (Y - Y.T).ravel()
+                term2 = np.array([np.sum(_GAUSS_KERNEL(Y / s1) / s1 -
+                                         2 * _GAUSS_KERNEL(Y / s2) / s2 +
+                                         _GAUSS_KERNEL(Y / s3) / s3)
+                                  for s1, s2, s3 in zip(sig1, sig2, sig3)])
+            return 1. / (n[dim] * hi * 2. * sqrt(pi)) + term2 / n[dim] ** 2
 
-            psi6 = self._estimate_psi(c, xn, g1, n, order=6)
-            psi10 = self._estimate_psi(c, xn, g2, n, order=10)
-
-            g3 = self._get_g(k40, mu2, psi6, n, order=6)
-            g4 = self._get_g(k80, mu2, psi10, n, order=10)
-
-            psi4 = self._estimate_psi(c, xn, g3, n, order=4)
-            psi8 = self._estimate_psi(c, xn, g4, n, order=8)
-
-            const = ((441. / (64 * pi)) ** (1. / 18.) *
-                     (4 * pi) ** (-1. / 5.) *
-                     psi4 ** (-2. / 5.) * psi8 ** (-1. / 9.))
-
-            M = np.atleast_2d(datan)
-
-            Y = (M - M.T).ravel()
-
-            for i in range(steps):
-                g = const * n ** (-23. / 45) * hvec[i] ** (-2)
-                sig1 = sqrt(2 * hvec[i] ** 2 + 2 * g ** 2)
-                sig2 = sqrt(hvec[i] ** 2 + 2 * g ** 2)
-                sig3 = sqrt(2 * g ** 2)
-                term2 = np.sum(_GAUSS_KERNEL(Y / sig1) / sig1 -
-                               2 * _GAUSS_KERNEL(Y / sig2) / sig2 +
-                               _GAUSS_KERNEL(Y / sig3) / sig3)
-
-                score[i] = 1. / (n * hvec[i] * 2. * sqrt(pi)) + term2 / n ** 2
-
-            idx = score.argmin()
+        for dim in range(d):
+            score[dim] = score_fun(dim, hvec[dim])
+            idx = score[dim].argmin()
+            h[dim] = hvec[dim, idx]
+            if 0 < idx < steps - 1:
+                a, b = hvec[dim, idx - 1], hvec[dim, idx + 1]
+                h[dim] = _golden_section(lambda hi: score_fun(dim, hi)[0],
+                                         a, b, xtol=1e-3 * (b - a))
             # Kernel other than Gaussian scale bandwidth
-            h[dim] = hvec[idx] * (ste_constant / ste_constant2) ** (1 / 5)
+            h[dim] *= (ste_constant[dim] / ste_constant2[dim]) ** (1 / 5)
             _assert_warn(0 < idx,
                          "Optimum is probably lower than "
-                         "hs={0:g} for dim={1:d}".format(h[dim] * s, dim))
-            _assert_warn(idx < maxit - 1,
+                         "hs={0:g} for dim={1:d}".format(h[dim] * sigmaA[dim],
+                                                         dim))
+            _assert_warn(idx < steps - 1,
                          "Optimum is probably higher than "
-                         "hs={0:g} for dim={1:d}".format(h[dim] * s, dim))
-
-        hvec = hvec * (ste_constant / ste_constant2) ** (1 / 5)
+                         "hs={0:g} for dim={1:d}".format(h[dim] * sigmaA[dim],
+                                                         dim))
+        if joint and d > 1:
+            _assert(np.all(n == n[0]), 'joint=True requires a d x n array')
+            scale = (ste_constant / ste_constant2) ** (1 / 5)
+            h = self._hscv_joint(binned, sigmaA, const, h / scale) * scale
+
+        hvec = hvec * ((ste_constant / ste_constant2) ** (1 / 5))[:, None]
         if fulloutput:
+            if d == 1:
+                score, hvec = score[0], hvec[0]
             return h * sigmaA, score, hvec
         return h * sigmaA
 
-    def _get_grid_limits(self, data):
-        min_a, max_a = data.min(axis=1), data.max(axis=1)
-        offset = (max_a - min_a) / 8.0
-        return min_a - offset, max_a + offset
+    @staticmethod
+    def _hscv_joint(binned, scale, const, h, maxcycles=5):
+        """Return diagonal bandwidth minimizing the multivariate scv score.
+
+        The score is computed from the power spectrum of the jointly binned
+        data and the product of the 1D kernel transforms. It is minimized by
+        cyclic golden section searches along each dimension starting from h.
+        """
+        d, n = len(h), binned.n[0]
+        power = binned.power_nd()
+        xn = binned.xn(scale)
+        axes = 'abcdefghijklmnopqrstuvwxyz'[:d]
+
+        def kernel_fft(k, sigma):
+            kw_fft = binned._fft_kernel(_gauss_weights(xn[k], sigma))[0].real
+            if k < d - 1:  # full fft along all but the last axis
+                kw_fft = np.r_[kw_fft, kw_fft[-2:0:-1]]
+            return kw_fft
+
+        def get_sigmas(k, hk):
+            g = const[k] * n ** (-23. / 45) * hk ** (-2)
+            return (sqrt(2 * hk ** 2 + 2 * g ** 2), sqrt(hk ** 2 + 2 * g ** 2),
+                    sqrt(2 * g ** 2))
+
+        def coordinate_score_fun(k):
+            """Return score as function of h[k] with the other h fixed."""
+            others = [m for m in range(d) if m != k]
+            subscripts = '{},{}->{}'.format(
+                axes, ','.join(axes[m] for m in others), axes[k])
+            sigmas = [get_sigmas(m, h[m]) for m in others]
+            # contract the power spectrum along all the other axes
+            t = [np.einsum(subscripts, power,
+                           *[kernel_fft(m, sig[j])
+                             for m, sig in zip(others, sigmas)],
+                           optimize=True) for j in range(3)]
+            c0 = np.prod(1. / (h[others] * 2. * sqrt(pi))) / n
+
+            def score_fun(hk):
+                sig1, sig2, sig3 = get_sigmas(k, hk)
+                term2 = (t[0].dot(kernel_fft(k, sig1)) -
+                         2 * t[1].dot(kernel_fft(k, sig2)) +
+                         t[2].dot(kernel_fft(k, sig3)))
+                return c0 / (hk * 2. * sqrt(pi)) + term2 / n ** 2
+            return score_fun
+
+        h = h.copy()
+        for _cycle in range(maxcycles):
+            h_old = h.copy()
+            for k in range(d):
+                h[k] = _golden_section(coordinate_score_fun(k), h[k] / 2,
+                                       2 * h[k], xtol=1e-3 * h[k])
+            if np.all(np.abs(h - h_old) <= 1e-3 * h):
+                break
+        return h
 
     def hldpi(self, data, L=2, inc=128):
         '''HLDPI L-stage Direct Plug-In estimate of smoothing parameter.
@@ -1217,40 +1617,26 @@ class Kernel(object):
          'Kernel smoothing'
           Chapman and Hall, pp 67--74
         '''
-        A = np.atleast_2d(data)
-        d, n = A.shape
+        datasets = _get_datasets(data)
+        binned = _BinnedDatasets(datasets, inc)
+        n = binned.n
 
         amise_constant = self.kernel.get_amise_constant(n)
         ste_constant = self.kernel.get_ste_constant(n)
 
-        sigmaA = self.hns(A) / amise_constant
-
-        ax1, bx1 = self._get_grid_limits(A)
+        sigmaA = self.hns(datasets) / amise_constant
         mu2 = _GAUSS_KERNEL.stats[0]
 
-        h = np.zeros(d)
-        for dim in range(d):
-            s = sigmaA[dim]
-            datan = A[dim]  # / s
-            ax = ax1[dim]  # / s
-            bx = bx1[dim]  # / s
-
-            xa = np.linspace(ax, bx, inc)
-            xn = np.linspace(0, bx - ax, inc)
-
-            c = gridcount(datan, xa)
-
-            psi = _GAUSS_KERNEL.psi(r=2 * L + 4, sigma=s)
-            if L > 0:
-                # High order derivatives of the Gaussian kernel
-                Kd = _GAUSS_KERNEL.deriv4_6_8_10(0, numout=L)
-
-                # L-stage iterations to estimate PSI_4
-                for ix in range(L, 0, -1):
-                    gi = self._get_g(Kd[ix - 1], mu2, psi, n, order=2 * ix + 4)
-                    psi = self._estimate_psi(c, xn, gi, n, order=2 * ix + 2)
-            h[dim] = (ste_constant / psi) ** (1. / 5)
-        return h
+        psi = _GAUSS_KERNEL.psi(r=2 * L + 4, sigma=sigmaA)
+        if L > 0:
+            # High order derivatives of the Gaussian kernel
+            Kd = _GAUSS_KERNEL.deriv4_6_8_10(0, numout=L)
+
+            # L-stage iterations to estimate PSI_4
+            for ix in range(L, 0, -1):
+                gi = self._get_g(Kd[ix - 1], mu2, psi, n, order=2 * ix + 4)
+                psi = binned.estimate_psi(gi, order=2 * ix + 2)
+        return (ste_constant / psi) ** (1. / 5)
 
     def norm_factor(self, d=1, n=None):
         return self.kernel.norm_factor(d, n)
@@ -6,7 +6,8 @@ Created on 23. des. 2016
 from __future__ import absolute_import, division, print_function
 import unittest
 import numpy as np
-from numpy.testing import assert_allclose
+from numpy.testing import assert_allclose, assert_raises
+from numba import jit
 import wafo.kdetools.gridding as wkg
 from wafo.kdetools.tests.data import DATA1D, DATA2D, DATA3D
 
@@ -111,6 +112,78 @@ class TestKdeTools(unittest.TestCase):
         t = np.trapz(np.trapz(np.trapz(np.trapz(c / dx**4 / N, x), x), x), x)
         assert_allclose(t, 0.4236703654904251)
 
+    @staticmethod
+    def test_accum():
+        rng = np.random.RandomState(1)
+        accmap = rng.randint(0, 4, size=(5000, 2))
+        a = rng.randn(5000)
+        for func in [np.sum, np.max, np.min, np.mean, np.prod, len]:
+            c = wkg.accum(accmap, a, func=func, shape=(5, 4), fill_value=-1)
+            c0 = wkg.accum(accmap, a, func=lambda x: func(x), shape=(5, 4),
+                           fill_value=-1)
+            assert_allclose(c, c0)
+            c1 = wkg.accum(accmap, a, func=func, shape=(5, 4), fill_value=-1,
+                           parallel=True)
+            assert_allclose(c1, c0)
+
+        # per-thread partial results merged
+        index = np.ravel_multi_index(accmap.T, (5, 4))
+        out, count = wkg._accum_reduce_parallel(index, a, 20, wkg._maximum, 3)
+        assert_allclose(np.where(count > 0, out, -1).reshape(5, 4),
+                        wkg.accum(accmap, a, func=np.max, shape=(5, 4),
+                                  fill_value=-1))
+        assert_allclose(count.sum(), 5000)
+
+        @jit(nopython=True)
+        def absmax(x, y):
+            return x if abs(x) >= abs(y) else y
+        c = wkg.accum(accmap, a, func=absmax, shape=(5, 4))
+        c0 = wkg.accum(accmap, a, func=lambda x: x[np.argmax(np.abs(x))],
+                       shape=(5, 4))
+        assert_allclose(c, c0)
+        assert_allclose(wkg.accum(np.array([0, 1, 1]), np.array([-3, 1, 2]),
+                                  func=absmax), [-3, 2])
+
+        for func in ['median', 'std']:
+            assert_raises(ValueError, wkg.accum, accmap, a, func=func)
+
+    @staticmethod
+    def test_linbin():
+        for data, inc in [(DATA1D, 10), (DATA2D, 5), (DATA3D, 4),
+                          (np.reshape(DATA2D, (4, 10)), 3)]:
+            data = np.atleast_2d(data)
+            d = len(data)
+            x = np.linspace(0, max(np.ravel(data)) + 1, inc)
+            X = np.vstack((x,) * d)
+            c = wkg.gridcount(data, X)
+            if d > 1:
+                c = c.swapaxes(0, 1)
+            c1 = wkg.linbin(data, (0,) * d, x[1] - x[0], (inc,) * d)
+            assert_allclose(c1, c, atol=1e-12)
+
+            c2 = wkg.linbin(data, (0,) * d, x[1] - x[0], (inc,) * d,
+                            dtype=np.float32)
+            assert c2.dtype == np.float32
+            assert_allclose(c2, c, atol=1e-5)
+
+            n = data.shape[1]
+            y = np.vstack((np.ones(n), np.arange(n)))
+            c3 = wkg.linbin(data, (0,) * d, x[1] - x[0], (inc,) * d, y=y)
+            assert c3.shape == (2,) + (inc,) * d
+            assert_allclose(c3[0], c, atol=1e-12)
+            assert_allclose(c3[1], wkg.linbin(data, (0,) * d, x[1] - x[0],
+                                              (inc,) * d, y=y[1]))
+
+            # per-thread partial grids summed
+            shape = np.repeat(inc, d)
+            c4 = np.zeros((2, inc ** d))
+            wkg._linbin_parallel(data, np.zeros(d), shape * 0 + x[1] - x[0],
+                                 shape, inc ** np.arange(d)[::-1], y, c4, 3)
+            assert_allclose(c4.reshape(c3.shape), c3, atol=1e-12)
+            c5 = wkg.linbin(data, (0,) * d, x[1] - x[0], (inc,) * d,
+                            parallel=True)
+            assert_allclose(c5, c, atol=1e-12)
+
 
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
@@ -194,6 +194,8 @@ class TestKde(unittest.TestCase):
              [0.001613328022214066, 0.00794857884864038, 0.0005874786787715641]
              ]
         assert_allclose(f0.data, t)
+        assert_allclose(f0.clevels, f0.qlevels(f0.plevels))
+        assert_allclose(f0.clevels, wk.qlevels(f0.data, f0.plevels))
 
     def test_2d_default_bandwidth(self):
         # N = 20
@@ -206,6 +208,155 @@ class TestKde(unittest.TestCase):
         self.assertRaises(ValueError, kde0.eval_points, [1, 2, 3])
         assert_allclose(kde0.eval_points([1, 2]), 0.11329600006973661)
 
+    def test_eval_points_tree(self):
+        data = DATA2D
+        x = np.linspace(0, max(np.ravel(data)) + 1, 7)
+        points = np.vstack([xi.ravel() for xi in np.meshgrid(x, x)])
+        for name in ['epanechnikov', 'p1biweight', 'triangular']:
+            kde0 = wk.KDE(data, hs=0.5, kernel=wk.Kernel(name), alpha=0.5)
+            assert_allclose(kde0.eval_points(points, method='tree'),
+                            kde0.eval_points(points), atol=1e-15)
+
+        kde0 = wk.KDE(data, hs=0.5, kernel=wk.Kernel('gauss'))
+        assert_allclose(kde0.eval_points(points, method='tree', tol=1e-12),
+                        kde0.eval_points(points), atol=1e-12)
+        for tol in [0, 1, 2, -1e-3]:
+            self.assertRaises(ValueError, kde0.eval_points, points,
+                              method='tree', tol=tol)
+            self.assertRaises(ValueError, wk.Kernel('epan').truncation_radius,
+                              tol)
+
+    def test_eval_grid_fast_3d(self):
+        data = np.reshape(DATA2D, (4, 10))[:3]
+        x = np.linspace(0, max(np.ravel(data)) + 1, 64)
+        points = np.vstack([xi.ravel() for xi in np.meshgrid(x, x, x)])
+        for hs in [0.5, [[0.5, 0.1, 0.0], [0.1, 0.4, 0.0], [0.0, 0.0, 0.6]]]:
+            kde0 = wk.KDE(data, hs=hs)
+            f = kde0.eval_grid_fast(x, x, x)
+            self.assertEqual(len(kde0._kernel_fft_cache), 1)
+            f0 = kde0.eval_points(points).reshape(f.shape)
+            assert_allclose(f, f0, atol=5e-3 * f0.max())
+
+            f32 = kde0.eval_grid_fast(x, x, x, dtype=np.float32)
+            self.assertEqual(f32.dtype, np.float32)
+            self.assertEqual(len(kde0._kernel_fft_cache), 2)
+            assert_allclose(f32, f, atol=1e-5 * f.max())
+
+    def test_eval_points_parallel(self):
+        rs = np.random.RandomState(0)
+        names = ['epan', 'biwe', 'triw', 'p1ep', 'p1bi', 'p1tr', 'rect',
+                 'tria', 'gaus', 'lapl', 'logi']
+        for d in [1, 2]:
+            data = rs.randn(d, 100)
+            points = 1.5 * rs.randn(d, 51)
+            y = rs.rand(100)
+            for name in names:
+                kde = wk.KDE(data, kernel=wk.Kernel(name), alpha=0.5)
+                for r in [0, 1]:
+                    f = kde.eval_points(points, r=r, y=y)
+                    f1 = kde.eval_points(points, r=r, y=y, method='parallel',
+                                         num_threads=3, chunksize=7)
+                    assert_allclose(f1, f, rtol=1e-10, atol=1e-14)
+        out = np.empty(51)
+        f = kde.eval_points(points, method='parallel', out=out)
+        self.assertIs(f, out)
+        assert_allclose(out, kde.eval_points(points))
+
+    def test_binned_kde(self):
+        data = np.random.RandomState(0).randn(2, 5000)
+        chunks = (data[:, i:i + 700] for i in range(0, 5000, 700))
+        kde = wk.BinnedKDE.from_chunks(chunks, xmin=[-6, -6], xmax=[6, 6],
+                                       inc=64, sample_size=500, seed=1)
+        self.assertEqual(kde.n, 5000)
+        self.assertEqual(kde.dataset.shape, (2, 500))
+        self.assertTrue(np.all(np.in1d(kde.dataset[0], data[0])))
+
+        kde0 = wk.KDE(data, hs=kde.hs, xmin=-6, xmax=6, inc=64)
+        assert_allclose(kde.eval_grid_fast(), kde0.eval_grid_fast(),
+                        atol=1e-14)
+        # smoothing selected on the subsample is rescaled to all the data
+        assert_allclose(kde.hs, wk.KDE(data).hs, rtol=0.15)
+
+        kde1 = wk.BinnedKDE.from_array(data, chunksize=1234, inc=64)
+        assert_allclose(kde1.xmin, data.min(axis=1) - 2 * data.std(axis=1),
+                        rtol=1e-3)
+        points = np.array([[0, 0.5, 1], [0, -0.5, 0.1]])
+        assert_allclose(kde1.eval_points(points),
+                        wk.KDE(data, hs=kde1.hs).eval_points(points),
+                        rtol=0.02)
+        self.assertRaises(ValueError, kde.add, [[7.0], [0.0]])
+
+    def test_binned_kde_updates(self):
+        data = np.random.RandomState(1).randn(1, 3000)
+        a, b, c = np.split(data, 3, axis=1)
+        kde = wk.BinnedKDE([-6], [6], hs=0.3, inc=128, seed=0)
+        kde.add(a).add(b)
+        f_ab = kde.eval_grid_fast()
+        kde.remove(a)
+        self.assertEqual(kde.n, 1000)
+        self.assertEqual(len(kde._kernel_fft_cache), 1)
+        self.assertFalse(np.any(np.in1d(kde.dataset[0], a[0])))
+        kde0 = wk.KDE(b, hs=0.3, xmin=-6, xmax=6, inc=128)
+        assert_allclose(kde.eval_grid_fast(), kde0.eval_grid_fast(),
+                        atol=1e-14)
+        kde.add(a)
+        assert_allclose(kde.eval_grid_fast(), f_ab, atol=1e-14)
+
+        # sliding window and scheduled reselection of the smoothing parameter
+        sw = wk.BinnedKDE([-6], [6], inc=128, window=1500, hs_update=0.5)
+        sw.add(a)
+        hs = sw.hs
+        sw.add(b[:, :400])
+        self.assertIs(sw.hs, hs)
+        sw.add(b[:, 400:]).add(c)
+        self.assertEqual(sw.n, 1500)
+        self.assertIsNot(sw.hs, hs)
+        assert_allclose(sw.hs, wk.KDE(data[:, -1500:]).hs)
+        kde1 = wk.KDE(data[:, -1500:], hs=sw.hs, xmin=-6, xmax=6, inc=128)
+        assert_allclose(sw.eval_grid_fast(), kde1.eval_grid_fast(),
+                        atol=1e-14)
+        self.assertRaises(ValueError, sw.remove, c)
+
+    def test_binned_kde_reservoir(self):
+        kde = wk.BinnedKDE([-6], [6], hs=0.3, inc=16, seed=0)
+        kde.add([[0., 0., 0., 1., 1.]]).remove([[0., 1.]])
+        assert_allclose(np.sort(kde.dataset[0]), [0, 0, 1])
+
+        # the reservoir stays uniform over the remaining data after removal
+        data = np.random.RandomState(2).rand(1, 40000)
+        kde = wk.BinnedKDE([0], [1], hs=0.1, inc=16, sample_size=2000, seed=3)
+        kde.add(data[:, :20000]).remove(data[:, :20000:2])
+        kde.add(data[:, 20000:])
+        is_new = np.in1d(kde.dataset[0], data[0, 20000:])
+        self.assertAlmostEqual(is_new.mean(), 2. / 3, delta=0.05)
+
+        sw = wk.BinnedKDE([0], [1], inc=16, sample_size=500, window=3000,
+                          seed=4)
+        for chunk in np.array_split(data[:, :10000], 7, axis=1):
+            sw.add(chunk)
+        self.assertTrue(np.all(np.in1d(sw.dataset[0], data[0, 7000:10000])))
+
+    def test_binned_kde_reservoir_size(self):
+        data = np.random.RandomState(5).rand(1, 10000)
+        chunks = np.split(data, 20, axis=1)
+        kde = wk.BinnedKDE([0], [1], inc=16, sample_size=500, seed=6)
+        for i, chunk in enumerate(chunks):
+            kde.add(chunk)
+            self.assertEqual(kde.dataset.shape[1], min(500, kde.n))
+            if i >= 3:
+                kde.remove(chunks[i - 3])
+        self.assertEqual(kde.n, 1500)
+        self.assertTrue(np.all(np.isfinite(kde.eval_grid_fast())))
+
+        sw = wk.BinnedKDE([0], [1], inc=16, sample_size=500, window=1200,
+                          seed=7)
+        for chunk in chunks:
+            sw.add(chunk)
+            self.assertEqual(sw.dataset.shape[1], min(500, sw.n))
+            index = sw._sample_index
+            self.assertEqual(np.unique(index).size, index.size)
+            assert_allclose(sw.dataset[0], data[0, index])
+
 
 class TestRegression(unittest.TestCase):
     def test_KRegression(self):
@@ -273,6 +424,41 @@ class TestRegression(unittest.TestCase):
                          3.04171702362464, 3.03475567689171, 3.020239732466334,
                          3.002434232424511, 2.987257365211814])
 
+    def test_KRegression_binned(self):
+        x = np.linspace(0, 1, 51)
+        y = 2 + np.sin(2 * np.pi * x) + 0.1 * np.cos(17 * x)
+        for p in [0, 1]:
+            kreg = wk.KRegression(x, y, p=p, hs=0.1, kernel=wk.Kernel('gauss'))
+            f = kreg.eval_grid_fast(output='plotobj', alpha=0.05)
+            kreg._grdfun = kreg.tkde.eval_grid_fast
+            f0 = kreg.tkde.eval_grid_fun(kreg._eval_gridfun)
+            assert_allclose(f.data, f0, rtol=1e-6, atol=1e-6)
+
+            # brute force standard error at grid points inside the data
+            mask = (0.1 < f.args) & (f.args < 0.9)
+            xi = f.args[mask]
+            k0 = np.exp(-0.5 * ((xi[:, None] - x[None, :]) / 0.1) ** 2)
+            k = k0
+            if p == 1:
+                d = x[None, :] - xi[:, None]
+                s1 = (k0 * d).sum(axis=1)[:, None]
+                s2 = (k0 * d ** 2).sum(axis=1)[:, None]
+                k = k0 * (s2 - d * s1)
+            w = k / k.sum(axis=1)[:, None]
+            m = (w * y).sum(axis=1)
+            sigma2 = (k0 * (y - m[:, None]) ** 2).sum(1) / k0.sum(1)
+            se = np.sqrt(sigma2 * (w ** 2).sum(axis=1))
+            assert_allclose(kreg.se[mask], se, rtol=1e-2)
+            lo, up = f.dataCI.T
+            assert_allclose(up - lo, 2 * 1.959963984540054 * kreg.se)
+
+            # the bands are only computed when alpha is given
+            f1 = kreg.eval_grid_fast(output='plotobj')
+            assert_allclose(f1.data, f.data)
+            self.assertEqual(np.size(getattr(f1, 'dataCI', ())), 0)
+            self.assertIsNone(kreg.se)
+        self.assertRaises(ValueError, wk.KRegression, x, y, p=2)
+
     def test_BKRegression(self):
         # from wafo.kdetools.kdetools import _get_data
         # n = 51
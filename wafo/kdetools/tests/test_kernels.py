@@ -79,6 +79,41 @@ class TestKernels(unittest.TestCase):
         # self.assertTrue(False)
 
 
+class TestQlevels(unittest.TestCase):
+    def test_qlevels_exact(self):
+        x = np.linspace(-5, 5, 301)
+        X, Y = np.meshgrid(x, x)
+        pdf = np.exp(-0.5 * (X ** 2 + (Y - 0.3 * X ** 2) ** 2))
+        pdf[pdf < 1e-10] = 0
+        p = np.r_[10:90:20, 95, 99, 99.9]
+        for f in [pdf, np.round(pdf, 2)]:
+            # brute force: sort and integrate by decreasing height
+            values = np.sort(f.ravel())[::-1]
+            n = values.size
+            cdf = np.cumsum(values) / values.sum() * n / (n + 1.5e-8)
+            mask = values > 0
+            truth = np.interp(p / 100, cdf[mask], values[mask])
+            for leafsize in [4096, 16]:
+                levels = wkk._mass_levels(
+                    values[mask][::-1], values[mask][::-1], 0, None,
+                    p / 100 * values.sum() * (n + 1.5e-8) / n, None,
+                    nbins=64, leafsize=leafsize)
+                assert_allclose(levels, truth, atol=1e-12)
+            assert_allclose(wkk.qlevels(f, p), truth, atol=1e-12)
+            assert_allclose(wkk.qlevels(f, p, tol=1e-4), truth, atol=1e-3)
+
+    def test_qlevels_cache(self):
+        x = np.linspace(-8, 8, 2001)
+        pdf = np.exp(-0.5 * x ** 2) / np.sqrt(2 * np.pi)
+        ql = wkk.QLevels(pdf, xi=(x,))
+        levels = ql([50, 90, 50])
+        assert_allclose(levels[0], levels[2])
+        assert_allclose(levels, wkk.qlevels(pdf, [50, 90, 50], xi=(x,)))
+        self.assertEqual(sorted(ql.cache), [50.0, 90.0])
+        ql.cache[50.0] = -1  # cached levels are not recomputed
+        assert_allclose(ql(50), 0)
+
+
 class TestSmoothing(unittest.TestCase):
     def setUp(self):
         self.data = DATA3D
@@ -121,8 +156,16 @@ class TestSmoothing(unittest.TestCase):
 
     def test_hscv(self):
         hs = self.gauss.hscv(self.data)
-        assert_allclose(hs, [0.1656318800590673, 0.3273938258112911,
-                             0.31072126996412214])
+        assert_allclose(hs, [0.1653332899123297, 0.3271313689213526,
+                             0.31109587934222255])
+        hs = self.gauss.hscv(self.data, method='direct')
+        assert_allclose(hs, [0.16529654779219705, 0.32711304890660886,
+                             0.31105803690319783])
+
+    def test_hscv_joint(self):
+        hs = self.gauss.hscv(self.data, joint=True)
+        assert_allclose(hs, [0.1535256705299165, 0.299569966603438,
+                             0.2945726006794132], rtol=1e-5)
 
     def test_hstt(self):
         hs = self.gauss.hstt(self.data)
@@ -141,6 +184,15 @@ class TestSmoothing(unittest.TestCase):
         hs = self.gauss.hisj(self.data)
         assert_allclose(hs, [0.29542502, 0.74277133, 0.51899114])
 
+    def test_ragged_datasets(self):
+        data = np.asarray(self.data)
+        datasets = [data[0], data[1, :15], data[2, 3:]]
+        for name in ['hns', 'hste', 'hstt', 'hscv', 'hldpi', 'hisj']:
+            fun = getattr(self.gauss, name)
+            hs = fun(datasets)
+            hs0 = [fun(data)[0] for data in datasets]
+            assert_allclose(hs, hs0, rtol=1e-6)
+
 
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
@@ -38,7 +38,7 @@ __all__ = ['now', 'spaceline', 'narg_smallest', 'args_flat', 'is_numlike',
            'getshipchar',
            'betaloge', 'gravity', 'nextpow2', 'discretize',
            'polar2cart', 'cart2polar', 'pol2cart', 'cart2pol',
-           'meshgrid', 'ndgrid', 'trangood', 'tranproc',
+           'meshgrid', 'ndgrid', 'trangood', 'tranproc', 'TranTable',
            'plot_histgrm', 'num2pistr', 'test_docstrings',
            'lazywhere', 'lazyselect',
            'piecewise',
@@ -2333,7 +2333,7 @@ def tranproc(x, f, x0, *xi):
 
     See also
     --------
-    trangood.
+    trangood, TranTable.
     """
     def _default_step(xo, N):
         hn = xo[1] - xo[0]
@@ -2413,6 +2413,130 @@ def tranproc(x, f, x0, *xi):
     return y
 
 
+class TranTable(object):
+    """
+    Tabulated transformation for repeated use on many realizations.
+
+    Parameters
+    ----------
+    x, f : array-like
+        [x,f(x)], transform function, y = f(x).
+    n_der : scalar integer
+        maximum number of time derivatives to transform. 0<=n_der<=4.
+        (default 4)
+    min_x, max_x : real scalars
+        range of x-values covered by the table. The transform is
+        extrapolated linearly outside this range. (Default min(x), max(x))
+
+    The transform is made uniformly spaced by trangood and the derivatives of
+    f are tabulated once at construction. Calling the object transforms
+    arrays of any shape (e.g. many realizations stored in a 2-D array) and
+    up to n_der time derivatives in one vectorized pass:
+
+    Y1 = f'(X0)*X1
+    Y2 = f''(X0)*X1^2 + f'(X0)*X2
+    Y3 = f'''(X0)*X1^3 + f'(X0)*X3 + 3*f''(X0)*X1*X2
+    Y4 = f''''(X0)*X1^4 + f'(X0)*X4 + 6*f'''(X0)*X1^2*X2
+      + f''(X0)*(3*X2^2 + 4*X1*X3)
+
+    Example
+    --------
+    >>> import wafo.transform.models as wtm
+    >>> tr = wtm.TrHermite()
+    >>> x = np.linspace(-5, 5, 501)
+    >>> g = tr(x)
+    >>> table = TranTable(x, g)
+    >>> x0 = np.linspace(-4, 4, 20).reshape(4, 5)
+    >>> y0, y1 = table(x0, np.ones_like(x0))
+    >>> y0.shape
+    (4, 5)
+    >>> z0, z1 = tranproc(x, g, x0.ravel(), np.ones(20))
+    >>> np.allclose(y0.ravel(), z0), np.allclose(y1.ravel(), z1)
+    (True, True)
+
+    See also
+    --------
+    tranproc, trangood
+    """
+
+    def __init__(self, x, f, n_der=4, min_x=None, max_x=None):
+        if n_der > 4:
+            raise ValueError('Transformation of derivatives of order>4 is ' +
+                             'not supported.')
+        xo = atleast_1d(x)
+        nmax = ceil((xo.ptp()) * 10 ** (7. / max(n_der, 1)))
+        xo, fo = trangood(xo, f, min_x=min_x, max_x=max_x, max_n=nmax)
+        self.n_der = n_der
+        self.x0 = xo[0]
+        self.dx = xo[1] - xo[0]
+        if n_der > 0 and self.dx ** n_der < sqrt(_EPS):
+            msg = ('Numerical problems may occur for the derivatives in ' +
+                   'TranTable.\n' +
+                   'The sampling of the transformation may be too small.')
+            warnings.warn(msg)
+        # Derivation of f(x) using a difference method. The k'th derivative
+        # is tabulated at x0 + k * dx / 2 + j * dx, j = 0, 1, ...
+        self.tables = [fo]
+        for _k in range(n_der):
+            self.tables.append(diff(self.tables[-1]) / self.dx)
+
+    def _interp(self, k, x):
+        """Return k'th derivative of f at x with linear interpolation."""
+        fk = self.tables[k]
+        xu = (x - (self.x0 + 0.5 * k * self.dx)) / self.dx
+        if k > 0:
+            # f is extrapolated linearly, i.e., f' is constant and the
+            # higher order derivatives are zero outside the table.
+            outside = (xu < 0) | (xu > fk.size - 1)
+            xu = np.clip(xu, 0, fk.size - 1)
+        fi = np.clip(floor(xu), 0, fk.size - 2)
+        xu -= fi
+        fi = fi.astype(np.intp)
+        y = fk.take(fi)
+        xu *= fk.take(fi + 1) - y
+        y += xu
+        if k > 1:
+            y = where(outside, 0, y)
+        return y
+
+    def __call__(self, x0, *xi):
+        """
+        Return transformed process x0 and up to four derivatives.
+
+        Parameters
+        ----------
+        x0, x1,...,xn : array-like
+            where xi is the i'th time derivative of x0. 0<=n<=n_der.
+            xi must broadcast against x0.
+
+        Returns
+        -------
+        y0 or [y0, y1,...,yn] : arrays
+            where yi is the i'th time derivative of y0 = f(x0).
+        """
+        x0 = asarray(x0, dtype=float)
+        y0 = self._interp(0, x0)
+        N = len(xi)
+        if N == 0:
+            return y0
+        if N > self.n_der:
+            raise ValueError('Transformation of derivatives of order>' +
+                             '{} is not supported.'.format(self.n_der))
+        xi = [asarray(xk, dtype=float) for xk in xi]
+        fd = [None] + [self._interp(k, x0) for k in range(1, N + 1)]
+        y = [y0, fd[1] * xi[0]]
+        if N > 1:
+            y.append(fd[2] * xi[0] ** 2 + fd[1] * xi[1])
+        if N > 2:
+            y.append(fd[3] * xi[0] ** 3 + fd[1] * xi[2] +
+                     3 * fd[2] * xi[0] * xi[1])
+        if N > 3:
+            y.append(fd[4] * xi[0] ** 4 + fd[1] * xi[3] +
+                     6 * fd[3] * xi[0] ** 2 * xi[1] +
+                     fd[2] * (3 * xi[1] ** 2 + 4 * xi[0] * xi[2]))
+        return y
+
+
 # pylint: disable=redefined-builtin
 def good_bins(data=None, range=None, num_bins=None, odd=False, loose=True):  # @ReservedAssignment
     ''' Return good bins for histogram
@@ -4,7 +4,9 @@ Created on 6. okt. 2016
 @author: pab
 """
 from __future__ import absolute_import, division
-from numba import jit, float64, int64, int32, int8, void
+import math
+from numba import (jit, vectorize, boolean, float64, int64, int32, int8,
+                   void)
 import numpy as np
 
 
@@ -589,5 +591,474 @@ def findrfc_astm(tp, t=None):
     return sig_rfc[:n - cnr[0]]
 
 
+@jit(void(int8[:], float64[:], float64[:], int64[:], int64[:], float64),
+     nopython=True)
+def _find_ok_peaks(is_ok, y, t, starts, stops, t_min):
+    """Mark the largest maxima of each cluster that are at least t_min apart.
+
+    Within each cluster y[start:stop] the peaks are visited in descending
+    order and accepted if they are further than t_min away from all the
+    peaks accepted so far.
+    """
+    accepted = np.empty(len(y))
+    for j in range(len(starts)):
+        start, stop = starts[j], stops[j]
+        order = np.argsort(-y[start:stop], kind='mergesort') + start
+        k = 0
+        for i in order:
+            ti = t[i]
+            ok = True
+            for m in range(k):
+                if accepted[m] - t_min <= ti and ti <= accepted[m] + t_min:
+                    ok = False
+                    break
+            if ok:
+                accepted[k] = ti
+                k += 1
+                is_ok[i] = 1
+
+
+_SQRT2 = np.sqrt(2.0)
+_SQRT2PI = np.sqrt(2.0 * np.pi)
+
+
+@jit(float64(float64), nopython=True, nogil=True)
+def _cdfnorm(x):
+    return 0.5 * math.erfc(-x / _SQRT2)
+
+
+@jit(float64(float64, float64), nopython=True, nogil=True)
+def _cdfnorm_diff(lo, hi):
+    """Return P(lo < X < hi) for standard normal X without cancellation."""
+    if hi <= lo:
+        return 0.0
+    if lo > 0:
+        return 0.5 * (math.erfc(lo / _SQRT2) - math.erfc(hi / _SQRT2))
+    return 0.5 * (math.erfc(-hi / _SQRT2) - math.erfc(-lo / _SQRT2))
+
+
+@jit(float64(float64), nopython=True, nogil=True)
+def _invnorm(p):
+    """Return the standard normal quantile (Wichura 1988, AS 241 PPND16)."""
+    q = p - 0.5
+    if abs(q) <= 0.425:
+        r = 0.180625 - q * q
+        num = (((((((2509.0809287301226727 * r +
+                     33430.575583588128105) * r +
+                    67265.770927008700853) * r +
+                   45921.953931549871457) * r +
+                  13731.693765509461125) * r +
+                 1971.5909503065514427) * r +
+                133.14166789178437745) * r +
+               3.387132872796366608)
+        den = (((((((5226.495278852545925 * r +
+                     28729.085735721942674) * r +
+                    39307.89580009271061) * r +
+                   21213.794301586595867) * r +
+                  5394.1960214247511077) * r +
+                 687.1870074920579083) * r +
+                42.313330701600911252) * r + 1.0)
+        return q * num / den
+    r = p if q < 0 else 1.0 - p
+    if r <= 0:
+        return -np.inf if q < 0 else np.inf
+    r = math.sqrt(-math.log(r))
+    if r <= 5.0:
+        r -= 1.6
+        num = (((((((7.7454501427834140764e-4 * r +
+                     0.0227238449892691845833) * r +
+                    0.24178072517745061177) * r +
+                   1.27045825245236838258) * r +
+                  3.64784832476320460504) * r +
+                 5.7694972214606914055) * r +
+                4.6303378461565452959) * r +
+               1.42343711074968357734)
+        den = (((((((1.05075007164441684324e-9 * r +
+                     5.475938084995344946e-4) * r +
+                    0.0151986665636164571966) * r +
+                   0.14810397642748007459) * r +
+                  0.68976733498510000455) * r +
+                 1.6763848301838038494) * r +
+                2.05319162663775882187) * r + 1.0)
+    else:
+        r -= 5.0
+        num = (((((((2.01033439929228813265e-7 * r +
+                     2.71155556874348757815e-5) * r +
+                    0.0012426609473880784386) * r +
+                   0.026532189526576123093) * r +
+                  0.29656057182850489123) * r +
+                 1.7848265399172913358) * r +
+                5.4637849111641143699) * r +
+               6.6579046435011037772)
+        den = (((((((2.04426310338993978564e-15 * r +
+                     1.4215117583164458887e-7) * r +
+                    1.8463183175100546818e-5) * r +
+                   7.868691311456132591e-4) * r +
+                  0.0148753612908506148525) * r +
+                 0.13692988092273580531) * r +
+                0.59983220655588793769) * r + 1.0)
+    val = num / den
+    return -val if q < 0 else val
+
+
+@jit(void(float64[:, :], float64[:, :], float64[:, :], float64[:],
+          float64[:, :], int64, int64, float64[:, :]), nopython=True,
+     nogil=True)
+def _prbnormnd_lattice(chol, a, b, q, shifts, start, num_points, out):
+    """Average Genz' separation-of-variables integrand over lattice points.
+
+    out[i, j] is the mean of the integrand for the limits a[i], b[i] over the
+    points k = start, ..., start + num_points - 1 of the rank-1 lattice k * q
+    randomly shifted by shifts[j] and baker transformed. chol is the lower
+    triangular (semidefinite) Cholesky factor of the correlation matrix.
+    """
+    n = chol.shape[0]
+    y = np.zeros(n)
+    for i in range(a.shape[0]):
+        for j in range(shifts.shape[0]):
+            total = 0.0
+            for k in range(start, start + num_points):
+                prb = 1.0
+                for m in range(n):
+                    s = 0.0
+                    for p in range(m):
+                        s += chol[m, p] * y[p]
+                    c = chol[m, m]
+                    if c > 0:
+                        d = _cdfnorm((a[i, m] - s) / c)
+                        e = _cdfnorm((b[i, m] - s) / c)
+                    else:
+                        d = 0.0 if a[i, m] <= s else 1.0
+                        e = 1.0 if s <= b[i, m] else 0.0
+                    if e <= d:
+                        prb = 0.0
+                        break
+                    prb *= e - d
+                    if m < n - 1:
+                        x = (k * q[m] + shifts[j, m]) % 1.0
+                        y[m] = _invnorm(d + abs(2.0 * x - 1.0) * (e - d))
+                total += prb
+            out[i, j] = total / num_points
+
+
+@jit(void(float64[:, :], float64[:, :], float64[:, :], float64[:, :],
+          boolean[:], float64[:], float64[:, :], int64, int64,
+          float64[:, :]), nopython=True, nogil=True)
+def _rind_lattice(chol, a, b, mu, jac, q, shifts, start, num_points, out):
+    """Average the separation-of-variables integrand of Rind over lattice
+    points.
+
+    Same as _prbnormnd_lattice except that chol is the Cholesky factor of a
+    covariance matrix, a and b are the limits of the centered variables and
+    that the integrand is multiplied by |mu[i, m] + X[m]| for all m with
+    jac[m] True, i.e., the Jacobian |Xd(1)*...*Xd(Nd)|.
+    """
+    n = chol.shape[0]
+    y = np.zeros(n)
+    for i in range(a.shape[0]):
+        for j in range(shifts.shape[0]):
+            total = 0.0
+            for k in range(start, start + num_points):
+                prb = 1.0
+                for m in range(n):
+                    s = 0.0
+                    for p in range(m):
+                        s += chol[m, p] * y[p]
+                    c = chol[m, m]
+                    if c > 0:
+                        d = _cdfnorm((a[i, m] - s) / c)
+                        e = _cdfnorm((b[i, m] - s) / c)
+                    else:
+                        d = 0.0 if a[i, m] <= s else 1.0
+                        e = 1.0 if s <= b[i, m] else 0.0
+                    if e <= d:
+                        prb = 0.0
+                        break
+                    prb *= e - d
+                    if m < n - 1 or jac[m]:
+                        x = (k * q[m] + shifts[j, m]) % 1.0
+                        y[m] = _invnorm(d + abs(2.0 * x - 1.0) * (e - d))
+                    if jac[m]:
+                        prb *= abs(mu[i, m] + s + c * y[m])
+                total += prb
+            out[i, j] = total / num_points
+
+
+@jit(float64(float64, float64[:], float64[:], float64[:], float64[:]),
+     nopython=True, nogil=True)
+def _prbnormndpc_integrand(z, rho, sig, a, b):
+    f = math.exp(-0.5 * z * z) / _SQRT2PI
+    for m in range(rho.size):
+        mu = rho[m] * z
+        if sig[m] > 0:
+            f *= _cdfnorm_diff((a[m] - mu) / sig[m], (b[m] - mu) / sig[m])
+        elif not (a[m] < mu and mu < b[m]):
+            f = 0.0
+        if f == 0.0:
+            break
+    return f
+
+
+@jit(void(float64[:], float64[:, :], float64[:, :], float64[:], float64[:],
+          float64[:], float64[:], float64, float64, float64, int64,
+          float64[:], float64[:], int64[:]), nopython=True, nogil=True)
+def _prbnormndpc_gauss(rho, a, b, x20, w20, x10, w10, xmax, abserr, relerr,
+                       limit, val, err, inform):
+    """Adaptive Gauss-Legendre integration of the product correlation integral
+
+        val[i] = int phi(z) prod_m P(a[i, m] < rho[m] z + sig[m] X < b[i, m])
+
+    over -xmax < z < xmax, where sig = sqrt(1 - rho**2). The interval is
+    initially split at the points where the factors change most rapidly and
+    panels are bisected until the 20 and 10 point rules agree to within the
+    tolerance. inform[i] = 1 if more than limit panels were needed.
+    """
+    n = rho.size
+    sig = np.sqrt(np.maximum(1.0 - rho * rho, 0.0))
+    points = np.empty(2 * n + 3)
+    lows = np.empty(limit)
+    highs = np.empty(limit)
+    for i in range(a.shape[0]):
+        ai = a[i]
+        bi = b[i]
+        num = 0
+        points[num] = -xmax
+        points[num + 1] = 0.0
+        points[num + 2] = xmax
+        num += 3
+        for m in range(n):
+            if rho[m] != 0:
+                for c in (ai[m] / rho[m], bi[m] / rho[m]):
+                    if -xmax < c and c < xmax:
+                        points[num] = c
+                        num += 1
+        sorted_points = np.sort(points[:num])
+        size = 0
+        for j in range(num - 1):
+            if sorted_points[j] < sorted_points[j + 1]:
+                lows[size] = sorted_points[j]
+                highs[size] = sorted_points[j + 1]
+                size += 1
+        total = 0.0
+        total_err = 0.0
+        flag = 0
+        while size > 0:
+            size -= 1
+            lo = lows[size]
+            hi = highs[size]
+            half = 0.5 * (hi - lo)
+            mid = 0.5 * (hi + lo)
+            q20 = 0.0
+            for k in range(x20.size):
+                q20 += w20[k] * _prbnormndpc_integrand(mid + half * x20[k],
+                                                       rho, sig, ai, bi)
+            q10 = 0.0
+            for k in range(x10.size):
+                q10 += w10[k] * _prbnormndpc_integrand(mid + half * x10[k],
+                                                       rho, sig, ai, bi)
+            q20 *= half
+            q10 *= half
+            delta = abs(q20 - q10)
+            tol = max(abserr, relerr * abs(q20)) * half / xmax
+            if delta <= tol or half < 1e-12:
+                total += q20
+                total_err += delta
+            elif size + 2 > limit:
+                total += q20
+                total_err += delta
+                flag = 1
+            else:
+                lows[size] = lo
+                highs[size] = mid
+                lows[size + 1] = mid
+                highs[size + 1] = hi
+                size += 2
+        val[i] = total
+        err[i] = total_err + math.erfc(xmax / _SQRT2)
+        inform[i] = flag
+
+
+# Gauss-Legendre points and weights (one half of the symmetric rules) used by
+# Drezner and Wesolowsky's bivariate normal method for small, medium and
+# large correlations, respectively.
+_BVN_W6 = np.array([0.1713244923791705e+00, 0.3607615730481384e+00,
+                    0.4679139345726904e+00])
+_BVN_X6 = np.array([-0.9324695142031522e+00, -0.6612093864662647e+00,
+                    -0.2386191860831970e+00])
+_BVN_W12 = np.array([0.4717533638651177e-01, 0.1069393259953183e+00,
+                     0.1600783285433464e+00, 0.2031674267230659e+00,
+                     0.2334925365383547e+00, 0.2491470458134029e+00])
+_BVN_X12 = np.array([-0.9815606342467191e+00, -0.9041172563704750e+00,
+                     -0.7699026741943050e+00, -0.5873179542866171e+00,
+                     -0.3678314989981802e+00, -0.1252334085114692e+00])
+_BVN_W20 = np.array([0.1761400713915212e-01, 0.4060142980038694e-01,
+                     0.6267204833410906e-01, 0.8327674157670475e-01,
+                     0.1019301198172404e+00, 0.1181945319615184e+00,
+                     0.1316886384491766e+00, 0.1420961093183821e+00,
+                     0.1491729864726037e+00, 0.1527533871307259e+00])
+_BVN_X20 = np.array([-0.9931285991850949e+00, -0.9639719272779138e+00,
+                     -0.9122344282513259e+00, -0.8391169718222188e+00,
+                     -0.7463319064601508e+00, -0.6360536807265150e+00,
+                     -0.5108670019508271e+00, -0.3737060887154196e+00,
+                     -0.2277858511416451e+00, -0.7652652113349733e-01])
+_TWOPI = 2.0 * np.pi
+
+
+@jit(nopython=True, nogil=True)  # the nodes are read-only global arrays
+def _bvnu_gauss(h, k, r, x, w):
+    hk = h * k
+    hs = 0.5 * (h * h + k * k)
+    asr = math.asin(r)
+    bvn = 0.0
+    for i in range(x.size):
+        for sign in (-1.0, 1.0):
+            sn = math.sin(0.5 * asr * (sign * x[i] + 1.0))
+            bvn += w[i] * math.exp((sn * hk - hs) / (1.0 - sn * sn))
+    return bvn * asr / (2.0 * _TWOPI) + _cdfnorm(-h) * _cdfnorm(-k)
+
+
+@jit(nopython=True, nogil=True)
+def _bvnu(h, k, r):
+    """Return P(X1 > h, X2 > k) for standard bivariate normal X1, X2 with
+    correlation r.
+
+    Genz' BVNU, based on the method of Drezner and Wesolowsky (1989) with
+    modifications for double precision and for abs(r) close to 1.
+    """
+    if not abs(r) <= 1.0 or math.isnan(h) or math.isnan(k):
+        return np.nan
+    if h == np.inf or k == np.inf:
+        return 0.0
+    if h == -np.inf:
+        return _cdfnorm(-k)
+    if k == -np.inf:
+        return _cdfnorm(-h)
+    if abs(r) < 0.3:
+        return _bvnu_gauss(h, k, r, _BVN_X6, _BVN_W6)
+    if abs(r) < 0.75:
+        return _bvnu_gauss(h, k, r, _BVN_X12, _BVN_W12)
+    if abs(r) < 0.925:
+        return _bvnu_gauss(h, k, r, _BVN_X20, _BVN_W20)
+    if r < 0:
+        k = -k
+    hk = h * k
+    bvn = 0.0
+    if abs(r) < 1:
+        a2 = (1.0 - r) * (1.0 + r)
+        a = math.sqrt(a2)
+        bs = (h - k) ** 2
+        c = (4.0 - hk) / 8.0
+        d = (12.0 - hk) / 16.0
+        asr = -0.5 * (bs / a2 + hk)
+        if asr > -100.0:
+            bvn = a * math.exp(asr) * (1.0 - c * (bs - a2) *
+                                       (1.0 - d * bs / 5.0) / 3.0 +
+                                       c * d * a2 * a2 / 5.0)
+        if -hk < 100.0:
+            b = math.sqrt(bs)
+            bvn -= (math.exp(-0.5 * hk) * math.sqrt(_TWOPI) *
+                    _cdfnorm(-b / a) * b *
+                    (1.0 - c * bs * (1.0 - d * bs / 5.0) / 3.0))
+        a *= 0.5
+        for i in range(_BVN_X20.size):
+            for sign in (-1.0, 1.0):
+                xs = (a * (sign * _BVN_X20[i] + 1.0)) ** 2
+                rs = math.sqrt(1.0 - xs)
+                asr = -0.5 * (bs / xs + hk)
+                if asr > -100.0:
+                    bvn += a * _BVN_W20[i] * math.exp(asr) * (
+                        math.exp(-hk * (1.0 - rs) / (2.0 * (1.0 + rs))) / rs -
+                        (1.0 + c * xs * (1.0 + d * xs)))
+        bvn = -bvn / _TWOPI
+    if r > 0:
+        return bvn + _cdfnorm(-max(h, k))
+    return -bvn + max(0.0, _cdfnorm(-h) - _cdfnorm(-k))
+
+
+_BVN_INFINITY = 37.0  # limits beyond this magnitude are treated as infinite
+
+
+@jit(nopython=True, nogil=True)
+def _prbnorm2d(a1, a2, b1, b2, r):
+    """Return P(a1 < X1 < b1, a2 < X2 < b2) as differences of upper
+    orthant probabilities chosen to avoid cancellation.
+    """
+    if (math.isnan(a1) or math.isnan(a2) or math.isnan(b1) or
+            math.isnan(b2) or not abs(r) <= 1.0):
+        return np.nan
+    if a1 >= b1 or a2 >= b2:
+        return 0.0
+    lo1, up1 = a1 > -_BVN_INFINITY, b1 < _BVN_INFINITY
+    lo2, up2 = a2 > -_BVN_INFINITY, b2 < _BVN_INFINITY
+    if not (lo1 or up1):
+        return _cdfnorm_diff(a2, b2)
+    if not (lo2 or up2):
+        return _cdfnorm_diff(a1, b1)
+    if lo1 and up1 and lo2 and up2:
+        return (_bvnu(a1, a2, r) - _bvnu(b1, a2, r) - _bvnu(a1, b2, r) +
+                _bvnu(b1, b2, r))
+    if lo1 and up1:
+        if lo2:
+            return _bvnu(a1, a2, r) - _bvnu(b1, a2, r)
+        return _bvnu(-b1, -b2, r) - _bvnu(-a1, -b2, r)
+    if lo2 and up2:
+        if lo1:
+            return _bvnu(a1, a2, r) - _bvnu(a1, b2, r)
+        return _bvnu(-b1, -b2, r) - _bvnu(-b1, -a2, r)
+    if lo1 and lo2:
+        return _bvnu(a1, a2, r)
+    if lo1:
+        return _bvnu(a1, -b2, -r)
+    if lo2:
+        return _bvnu(-b1, a2, -r)
+    return _bvnu(-b1, -b2, r)
+
+
+def _cdfnorm2d_kernel(b1, b2, r):
+    return _bvnu(-b1, -b2, r)
+
+
+def _prbnorm2d_kernel(a1, a2, b1, b2, r):
+    return _prbnorm2d(a1, a2, b1, b2, r)
+
+
+_CDFNORM2D_SIGNATURE = float64(float64, float64, float64)
+_PRBNORM2D_SIGNATURE = float64(float64, float64, float64, float64, float64)
+_UFUNCS = {}
+
+
+def _ufunc(kernel, signature, target='cpu'):
+    """Return ufunc of kernel for target, which is compiled on first use.
+
+    The ufuncs are slow to compile and the parallel target starts the numba
+    threading layer, so they are not made at import.
+    """
+    key = (kernel, target)
+    ufunc = _UFUNCS.get(key)
+    if ufunc is None:
+        ufunc = vectorize([signature], nopython=True, target=target)(kernel)
+        _UFUNCS[key] = ufunc
+    return ufunc
+
+
+def _cdfnorm2d(b1, b2, r):
+    return _ufunc(_cdfnorm2d_kernel, _CDFNORM2D_SIGNATURE)(b1, b2, r)
+
+
+def _cdfnorm2d_parallel(b1, b2, r):
+    ufunc = _ufunc(_cdfnorm2d_kernel, _CDFNORM2D_SIGNATURE, 'parallel')
+    return ufunc(b1, b2, r)
+
+
+def _prbnorm2d_ufunc(a1, a2, b1, b2, r):
+    ufunc = _ufunc(_prbnorm2d_kernel, _PRBNORM2D_SIGNATURE)
+    return ufunc(a1, a2, b1, b2, r)
+
+
+def _prbnorm2d_parallel(a1, a2, b1, b2, r):
+    ufunc = _ufunc(_prbnorm2d_kernel, _PRBNORM2D_SIGNATURE, 'parallel')
+    return ufunc(a1, a2, b1, b2, r)
+
+
 if __name__ == '__main__':
     pass
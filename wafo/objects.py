@@ -1540,6 +1540,8 @@ class TimeSeries(PlotData):
         method : string defining transform based on:
             'nonlinear' : smoothed crossing intensity (default)
             'mnonlinear': smoothed marginal distribution
+            'binned'    : smoothed crossing intensity from binned upcrossing
+                          counts (fast for long time series)
             'hermite'   : cubic Hermite polynomial
             'ochi'      : exponential function
             'linear'    : identity.
@@ -1176,7 +1176,8 @@ class SpecData1D(PlotData):
             T=5 and using 51 equidistant points in the interval [0,5].
         options : optional parameters
             controlling the performance of the integration.
-            See Rind for details.
+            See Rind for details. The periods are evaluated in num_workers
+            parallel threads by Rind.batch.
 
         Notes
         -----
@@ -1287,8 +1288,7 @@ class SpecData1D(PlotData):
         err = zeros(Ntime, dtype=float)
 
         rind = Rind(**opts)
-        # h11 = fwaitbar(0,[],sprintf('Please wait ...(start at: %s)',
-        #        datestr(now)))
+        problems = []
         for pt in range(Nstart, Ntime):
             Nt = pt - Nd + 1
             Ntd = Nt + Nd
@@ -1299,13 +1299,10 @@ class SpecData1D(PlotData):
 
             #  positive wave period
             BIG = self._covinput_t_pdf(pt, R)
+            problems.append((BIG, ex[:Ntdc], B_lo, B_up, indI.copy(), xc, Nt))
 
-            tmp = rind(BIG, ex[:Ntdc], B_lo, B_up, indI, xc, Nt)
+        for pt, tmp in zip(range(Nstart, Ntime), rind.batch(problems)):
             f[pt], err[pt] = tmp[:2]
-            # fwaitbar(pt/Ntime,h11,sprintf('%s Ready: %d of %d',
-            #                        datestr(now),pt,Ntime))
-        # end
-        # close(h11)
 
         titledict = dict(
             tc='Density of Tc', tt='Density of Tt', lc='Density of Lc',
@@ -1908,9 +1905,7 @@ class SpecData1D(PlotData):
                 xc[3, IJ:J] = hg[Nx1 + 2: 2 * Nx1].T  # Min < u
                 IJ = J
         if (def_nr <= 3):
-            # h11 = fwaitbar(0,[],sprintf('Please wait ...(start at:
-            # %s)',datestr(now)))
-
+            problems = []
             for Ntd in range(Nstart, Ntime):
                 # Ntd=tn
                 Ntdc = Ntd + Nc
@@ -1921,8 +1916,12 @@ class SpecData1D(PlotData):
                 # positive wave period
                 # self._covinput_mmt_pdf(BIG, R, tn, ts, tnold)
                 BIG[:Ntdc, :Ntdc] = covinput(BIG[:Ntdc, :Ntdc], R, Ntd, 0)
-                fxind, err0, terr0 = rind(BIG[:Ntdc, :Ntdc], ex[:Ntdc],
-                                          a_lo, a_up, indI, xc, Nt)
+                problems.append((BIG[:Ntdc, :Ntdc].copy(), ex[:Ntdc], a_lo,
+                                 a_up, indI.copy(), xc, Nt))
+
+            results = rind.batch(problems)
+            for Ntd, (fxind, err0, terr0) in zip(range(Nstart, Ntime),
+                                                 results):
                 err0 = err0 ** 2
                 # fxind  = CC*rind(BIG(1:Ntdc,1:Ntdc),ex(1:Ntdc),xc,Nt,NIT1,
                 # speed1,indI,a_lo,a_up)
@@ -163,6 +163,20 @@ class norm_gen(rv_continuous):
     def _entropy(self):
         return 0.5*(log(2*pi)+1)
 
+    def _nnlf_grad(self, theta, x):
+        loc, scale = theta
+        z = (np.asarray(x) - loc) / scale
+        n = z.size
+        return np.array([-np.sum(z), n - np.sum(z**2)]) / scale
+
+    def _nnlf_hessian(self, theta, x):
+        loc, scale = theta
+        z = (np.asarray(x) - loc) / scale
+        n = z.size
+        h01 = 2 * np.sum(z)
+        return np.array([[n, h01],
+                         [h01, 3 * np.sum(z**2) - n]]) / scale**2
+
     @inherit_docstring_from(rv_continuous)
     def fit(self, data, **kwds):
         """%(super)s
@@ -1612,6 +1626,10 @@ class frechet_r_gen(rv_continuous):
     def _ppf(self, q, c):
         return pow(-special.log1p(-q), 1.0/c)
 
+    def _cdf_shape_grad(self, x, c):
+        xc = pow(x, c)
+        return [exp(-xc) * special.xlogy(xc, x)]
+
     def _munp(self, n, c):
         return special.gamma(1.0+n*1.0/c)
 
@@ -1728,6 +1746,17 @@ class genlogistic_gen(rv_continuous):
 genlogistic = genlogistic_gen(name='genlogistic')
 
 
+def _dlog1pxc_dc(x, c):
+    """Return derivative of log1p(c*x)/c with respect to c."""
+    def _dlog1pxc_dc(x, c, cx):
+        return (x / (1 + cx) - special.log1p(cx) / c) / c
+
+    def _taylor(x, c, cx):
+        return -x**2 * (0.5 - cx * (2. / 3 - 0.75 * cx))
+    cx = c * x
+    return _lazywhere(np.abs(cx) > 1e-4, (x, c, cx), _dlog1pxc_dc, f2=_taylor)
+
+
 class genpareto_gen(rv_continuous):
     """A generalized Pareto continuous random variable.
 
@@ -1789,6 +1818,9 @@ class genpareto_gen(rv_continuous):
     def _isf(self, q, c):
         return -boxcox(q, -c)
 
+    def _cdf_shape_grad(self, x, c):
+        return [self._sf(x, c) * _dlog1pxc_dc(x, c)]
+
     def _fitstart(self, data):
         d = asarray(data)
         loc = d.min() - 0.01 * d.std()
@@ -1953,6 +1985,10 @@ class genextreme_gen(rv_continuous):
         return _lazywhere((x == x) & (c != 0), (x, c),
                           lambda x, c: -expm1(-c * x) / c, x)
 
+    def _cdf_shape_grad(self, x, c):
+        log_cdf = self._logcdf(x, c)
+        return [exp(log_cdf) * log_cdf * _dlog1pxc_dc(x, -c)]
+
     def _stats(self, c):
         g = lambda n: gam(n*c+1)
         g1 = g(1)
@@ -2426,6 +2462,22 @@ class gumbel_r_gen(rv_continuous):
     def _entropy(self):
         # http://en.wikipedia.org/wiki/Gumbel_distribution
         return _EULER + 1.
+
+    def _nnlf_grad(self, theta, x):
+        loc, scale = theta
+        z = (np.asarray(x) - loc) / scale
+        g = -expm1(-z)
+        return np.array([-np.sum(g), z.size - np.sum(z * g)]) / scale
+
+    def _nnlf_hessian(self, theta, x):
+        loc, scale = theta
+        z = (np.asarray(x) - loc) / scale
+        g = -expm1(-z)
+        ez = exp(-z)
+        h01 = np.sum(g + z * ez)
+        h11 = np.sum(z * (2 * g + z * ez)) - z.size
+        return np.array([[np.sum(ez), h01],
+                         [h01, h11]]) / scale**2
 gumbel_r = gumbel_r_gen(name='gumbel_r')
 
 
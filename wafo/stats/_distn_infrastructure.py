@@ -3,11 +3,15 @@ from scipy.stats._distn_infrastructure import *  # @UnusedWildImport
 from scipy.stats._distn_infrastructure import (_skew,  # @UnusedImport
     _kurtosis,  _ncx2_log_pdf,  # @IgnorePep8 @UnusedImport
     _ncx2_pdf,  _ncx2_cdf)  # @UnusedImport @IgnorePep8
-from .estimation import FitDistribution, rv_frozen  # @Reimport
-from ._constants import _XMAX, _XMIN
+from .estimation import (FitDistribution, rv_frozen, fit_many,  # @Reimport
+                         _SpacingData)
+from ._constants import _XMAX, _XMIN, _EPS
 from wafo.misc import lazyselect as _lazyselect  # @UnusedImport
 from wafo.misc import lazywhere as _lazywhere  # @UnusedImport
 
+_LOG2 = np.log(2)
+_LOG_XMIN = np.log(_XMIN)
+
 _doc_default_example = """\
 Examples
 --------
@@ -88,46 +92,58 @@ def freeze(self, *args, **kwds):
     return rv_frozen(self, *args, **kwds)
 
 
-def _resolve_ties(self, log_dprb, x, args, scale):
-    dx = np.diff(x, axis=0)
-    tie = dx == 0
-    if any(tie):  # TODO : implement this method for treating ties in data:
-        # Assume measuring error is delta. Then compute
-        # yL = F(xi-delta,theta)
-        # yU = F(xi+delta,theta)
-        # and replace
-        # logDj = log((yU-yL)/(r-1)) for j = i+1,i+2,...i+r-1
-        # The following is OK when only minimization of T is wanted
-        i_tie, = np.nonzero(tie)
-        log_dprb[i_tie + 1] = log(self._pdf(x[i_tie], *args)) - log(scale)
-    return log_dprb
+def _log_diff_exp(log_a, log_b):
+    """Return log(exp(log_b) - exp(log_a)) for log_a <= log_b."""
+    log_d = log_b + log(-np.expm1(log_a - log_b))
+    return np.where(log_a == log_b, -inf, log_d)
 
 
-def _log_dprb(self, x, args, scale, lowertail=True):
+def _log_spacings(self, z, scale, args, i_tie):
+    """Return log of the spacings F(z[i]) - F(z[i-1]), i=0,1,..., n
 
-    if lowertail:
-        prb = np.hstack((0.0, self.cdf(x, *args), 1.0))
-        dprb = np.diff(prb)
-    else:
-        prb = np.hstack((1.0, self.sf(x, *args), 0.0))
-        dprb = -np.diff(prb)
-    log_dprb = log(dprb + _XMIN)
-    log_dprb = _resolve_ties(self, log_dprb, x, args, scale)
+    where F(z[-1]) = 0, F(z[n]) = 1 and z is sorted data inside the support
+    stored along the first axis. The spacings are computed from differences
+    of logcdf in the lower half of the distribution and of logsf in the upper
+    half in order to avoid loss of precision in the tails.
+    """
+    with np.errstate(all='ignore'):
+        if np.ndim(z) == 1:
+            # Only the lower/upper half needs logcdf/logsf, respectively.
+            k = np.searchsorted(z, self._ppf(0.5, *args), side='right')
+            log_cdf = np.hstack((-inf, self._logcdf(z[:k], *args)))
+            if k > 0:
+                log_sf = np.hstack((self._logsf(z[k - 1:], *args), -inf))
+            else:
+                log_sf = np.hstack((0, self._logsf(z, *args), -inf))
+            log_dprb = np.hstack((_log_diff_exp(log_cdf[:-1], log_cdf[1:]),
+                                  _log_diff_exp(log_sf[1:], log_sf[:-1])))
+        else:
+            pad = np.zeros((1,) + z.shape[1:])
+            log_cdf = np.concatenate((pad - inf, self._logcdf(z, *args), pad))
+            log_sf = np.concatenate((pad, self._logsf(z, *args), pad - inf))
+            log_dprb = np.where(log_cdf[1:] <= -_LOG2,
+                                _log_diff_exp(log_cdf[:-1], log_cdf[1:]),
+                                _log_diff_exp(log_sf[1:], log_sf[:-1]))
+        # Spacings smaller than _XMIN are set to _XMIN.
+        log_dprb = np.maximum(log_dprb, _LOG_XMIN)
+        if len(i_tie):
+            # TODO : implement this method for treating ties in data:
+            # Assume measuring error is delta. Then compute
+            # yL = F(xi-delta,theta)
+            # yU = F(xi+delta,theta)
+            # and replace
+            # logDj = log((yU-yL)/(r-1)) for j = i+1,i+2,...i+r-1
+            # The following is OK when only minimization of T is wanted
+            log_dprb[i_tie + 1] = self._logpdf(z[i_tie], *args) - log(scale)
     return log_dprb
 
 
-def _nlogps_and_penalty(self, x, scale, args):
-    cond0 = ~self._support_mask(x)
-    n_bad = np.sum(cond0)
-    if n_bad > 0:
-        x = argsreduce(~cond0, x)[0]
-    log_dprb = _log_dprb(self, x, args, scale)
+def _nlogps_and_penalty(self, z, scale, args, i_tie):
+    log_dprb = _log_spacings(self, z, scale, args, i_tie)
     finite_log_dprb = np.isfinite(log_dprb)
-    n_bad += np.sum(~finite_log_dprb, axis=0)
-    if n_bad > 0:
-        penalty = 100.0 * np.log(_XMAX) * n_bad
-        return -np.sum(log_dprb[finite_log_dprb], axis=0) + penalty
-    return -np.sum(log_dprb, axis=0)
+    n_bad = np.sum(~finite_log_dprb, axis=0)
+    penalty = 100.0 * np.log(_XMAX) * n_bad
+    return -np.sum(np.where(finite_log_dprb, log_dprb, 0), axis=0) + penalty
 
 
 def _penalized_nlogps(self, theta, x):
@@ -135,7 +151,9 @@ def _penalized_nlogps(self, theta, x):
 
         where theta are the parameters (including loc and scale)
 
-        Note the data in x must be sorted
+        x is the data or a _SpacingData object holding the sorted data and
+        the location of the ties, which saves the bookkeeping when the
+        statistic is evaluated repeatedly for the same data.
 
     References
     -----------
@@ -155,11 +173,154 @@ def _penalized_nlogps(self, theta, x):
     product of spacings.",
     IMS Lecture Notes Monograph Series 2006, Vol. 52, pp. 272-283
     """
+    data = _SpacingData.asdata(x)
     loc, scale, args = _unpack_loc_scale(theta)
     if not self._argcheck(*args) or scale <= 0:
         return inf
-    x = asarray((x - loc) / scale)
-    return _nlogps_and_penalty(self, x, scale, args)
+    z = (data.x - loc) / scale
+    inside = self._support_mask(z)
+    if np.all(inside):
+        return _nlogps_and_penalty(self, z, scale, args, data.i_tie)
+    z = z[inside]
+    n_bad = data.n - z.size
+    i_tie = np.flatnonzero(z[1:] == z[:-1])
+    return (_nlogps_and_penalty(self, z, scale, args, i_tie) +
+            100.0 * np.log(_XMAX) * n_bad)
+
+
+def _valid_columns(self, scale, args):
+    with np.errstate(all='ignore'):
+        valid = self._argcheck(*args) & (scale > 0)
+    return np.ravel(np.broadcast_to(valid, scale.shape)).astype(bool)
+
+
+def _penalized_nlogps_vec(self, thetas, x):
+    """ Moran's negative log Product Spacings statistic for many parameters
+
+    Parameters
+    ----------
+    thetas : array-like, shape (num_par, m)
+        parameter vectors (including loc and scale) stored columnwise.
+    x : array-like, shape (n,) or _SpacingData object
+        data.
+
+    Returns
+    -------
+    nlogps : ndarray, shape (m,)
+        equal to [self._penalized_nlogps(theta, x) for theta in thetas.T]
+
+    Notes
+    -----
+    The statistic is evaluated for all parameter vectors in one vectorized
+    call. Columns with data outside the support are evaluated one by one.
+    """
+    thetas = np.asarray(thetas, dtype=float)
+    data = _SpacingData.asdata(x)
+    loc, scale, args = _unpack_loc_scale(thetas[:, np.newaxis])
+    try:
+        valid = _valid_columns(self, scale, args)
+        with np.errstate(all='ignore'):
+            z = (data.x[:, np.newaxis] - loc) / scale
+        inside = np.all(self._support_mask(z), axis=0) & valid
+        out = np.full(valid.shape, inf)
+        if np.any(inside):
+            z = z[:, inside]
+            args_in = tuple(arg[:, inside] for arg in args)
+            out[inside] = _nlogps_and_penalty(self, z, scale[:, inside],
+                                              args_in, data.i_tie)
+        outside = valid & ~inside
+    except (ValueError, TypeError, IndexError):
+        out = np.zeros(thetas.shape[1])
+        outside = np.ones(thetas.shape[1], dtype=bool)
+    for j in np.flatnonzero(outside):
+        out[j] = self._penalized_nlogps(thetas[:, j], data)
+    return out
+
+
+def _has_nlogps_grad(self):
+    """Return True if the MPS statistic has an analytic gradient."""
+    return self.numargs == 0 or hasattr(self, '_cdf_shape_grad')
+
+
+def _nlogps_tie_grad(self, theta, x_tie):
+    """Return gradient of the tie contribution to the MPS statistic
+
+    by central differences. The tie terms are log(pdf(x_tie, *theta)).
+    """
+    def tie_term(theta):
+        loc, scale, args = _unpack_loc_scale(theta)
+        z = (x_tie - loc) / scale
+        return np.sum(self._logpdf(z, *args)) - z.size * log(scale)
+
+    num_par = len(theta)
+    steps = np.diag(_EPS ** (1. / 3) * np.maximum(np.abs(theta), 1))
+    with np.errstate(all='ignore'):
+        return np.array([(tie_term(theta + step) - tie_term(theta - step)) /
+                         (2 * step[i]) for i, step in enumerate(steps)
+                         ]).reshape(num_par)
+
+
+def _penalized_nlogps_grad(self, theta, x):
+    """ Gradient of Moran's negative log Product Spacings statistic
+
+    Parameters
+    ----------
+    theta : array-like
+        parameters (including loc and scale).
+    x : array-like or _SpacingData object
+        data.
+
+    Returns
+    -------
+    grad : ndarray
+        gradient of self._penalized_nlogps(theta, x) with respect to theta.
+        NaN is returned if theta is not valid. Data outside the support only
+        contribute to the (constant) penalty.
+
+    Notes
+    -----
+    The derivatives of the cdf with respect to loc and scale are given by
+    the pdf, while the derivatives with respect to the shape parameters are
+    given by self._cdf_shape_grad. The contribution from ties in the data
+    is obtained by central differences.
+    """
+    data = _SpacingData.asdata(x)
+    theta = np.asarray(theta, dtype=float)
+    loc, scale, args = _unpack_loc_scale(theta)
+    if not self._argcheck(*args) or scale <= 0:
+        return np.full(theta.shape, nan)
+    z = (data.x - loc) / scale
+    inside = self._support_mask(z)
+    if np.all(inside):
+        i_tie = data.i_tie
+    else:
+        z = z[inside]
+        i_tie = np.flatnonzero(z[1:] == z[:-1])
+    with np.errstate(all='ignore'):
+        log_dprb = _log_spacings(self, z, scale, args, i_tie)
+        pdf = self._pdf(z, *args)
+        dcdf = list(self._cdf_shape_grad(z, *args)) if self.numargs else []
+        dcdf += [-pdf / scale, -pdf * z / scale]
+        pad = np.zeros((len(theta), 1))
+        ddprb = np.diff(np.hstack((pad, np.vstack(dcdf), pad)), axis=1)
+        terms = ddprb * np.exp(-log_dprb)
+    grad = -np.sum(np.delete(terms, i_tie + 1, axis=1), axis=1)
+    if len(i_tie):
+        grad -= _nlogps_tie_grad(self, theta, z[i_tie] * scale + loc)
+    return grad
+
+
+def _nlogps_fprime(self, args, fixedn, restore):
+    """Return analytic gradient of the reduced MPS function or None."""
+    if not self._has_nlogps_grad():
+        return None
+    free = [n for n in range(len(args)) if n not in fixedn]
+
+    def fprime(theta, x):
+        if restore is not None:
+            theta = restore(list(args), theta)
+        return self._penalized_nlogps_grad(theta, x)[free]
+    return fprime
 
 
 def _unpack_loc_scale(theta):
@@ -186,6 +347,53 @@ def _nnlf_and_penalty(self, x, args):
     return -np.sum(logpdf, axis=0)
 
 
+def _nnlf_and_penalty_vec(self, x, args):
+    with np.errstate(all='ignore'):
+        logpdf = self._logpdf(x, *args)
+    finite_logpdf = self._support_mask(x) & np.isfinite(logpdf)
+    n_bad = np.sum(~finite_logpdf, axis=0)
+    penalty = n_bad * log(_XMAX) * 100
+    return -np.sum(np.where(finite_logpdf, logpdf, 0), axis=0) + penalty
+
+
+def _penalized_nnlf_vec(self, thetas, x):
+    """Return negative loglikelihood function for many parameter vectors
+
+    Parameters
+    ----------
+    thetas : array-like, shape (num_par, m)
+        parameter vectors (including loc and scale) stored columnwise.
+    x : array-like, shape (n,)
+        data.
+
+    Returns
+    -------
+    nnlf : ndarray, shape (m,)
+        equal to [self._penalized_nnlf(theta, x) for theta in thetas.T]
+
+    Notes
+    -----
+    The parameters are broadcast along a new trailing axis so that all the
+    parameter vectors are evaluated in one vectorized call to ``_logpdf``.
+    Distributions whose methods do not broadcast are evaluated one by one.
+    """
+    thetas = np.asarray(thetas, dtype=float)
+    x = np.asarray(x)
+    loc, scale, args = _unpack_loc_scale(thetas[:, np.newaxis])
+    try:
+        valid = _valid_columns(self, scale, args)
+        out = np.where(valid, 0.0, inf)
+        if np.any(valid):
+            scale = scale[:, valid]
+            z = (x[:, np.newaxis] - loc[:, valid]) / scale
+            args = tuple(arg[:, valid] for arg in args)
+            n_log_scale = len(x) * log(scale[0])
+            out[valid] = _nnlf_and_penalty_vec(self, z, args) + n_log_scale
+    except (ValueError, TypeError, IndexError):
+        out = np.array([self._penalized_nnlf(theta, x) for theta in thetas.T])
+    return out
+
+
 def _penalized_nnlf(self, theta, x):
     ''' Return negative loglikelihood function,
     i.e., - sum (log pdf(x, theta), axis=0)
@@ -281,6 +489,9 @@ def _get_optimizer(kwds):
     return optimizer
 
 
+_GRADIENT_OPTIMIZERS = (optimize.fmin_bfgs, optimize.fmin_cg)
+
+
 def _warn_if_no_success(warnflag):
     if warnflag == 1:
         warnings.warn("The maximum number of iterations was exceeded.")
@@ -407,6 +618,7 @@ def fit(self, data, *args, **kwargs):
 
 def _fit(self, data, *args, **kwargs):
     args, kwds = _fitstart(self, data, args, kwargs.copy())
+    is_mps = kwds.get('method', 'ml').lower().startswith('mps')
     x0, func, restore, args, fixedn = self._reduce_func(args, kwds)
     if kwds.pop('search', True):
         optimizer = _get_optimizer(kwds)
@@ -415,11 +627,21 @@ def _fit(self, data, *args, **kwargs):
         if kwds:
             raise TypeError("Unknown arguments: {}.".format(kwds))
 
-        output = optimizer(func, x0, args=(ravel(data),), full_output=True,
-                           disp=0)
+        opt_kwds = {}
+        if is_mps:
+            # sort data and locate ties once for all function evaluations
+            data = _SpacingData.asdata(data)
+            if optimizer in _GRADIENT_OPTIMIZERS:
+                fprime = _nlogps_fprime(self, args, fixedn, restore)
+                if fprime is not None:
+                    opt_kwds['fprime'] = fprime
+        else:
+            data = ravel(data)
+        output = optimizer(func, x0, args=(data,), full_output=True,
+                           disp=0, **opt_kwds)
         if output[-1] != 0:
-            output = optimizer(func, output[0], args=(ravel(data),),
-                               full_output=True)
+            output = optimizer(func, output[0], args=(data,),
+                               full_output=True, **opt_kwds)
 
         _warn_if_no_success(output[-1])
         vals = tuple(output[0])
@@ -486,6 +708,22 @@ def fit2(self, data, *args, **kwds):
     return FitDistribution(self, data, args, **kwds)
 
 
+def _fit_many(self, data, *args, **kwds):
+    ''' Return ML or MPS estimators for many samples in parallel
+
+    See wafo.stats.estimation.fit_many for a description of the parameters.
+
+    Examples
+    --------
+    >>> import wafo.stats as ws
+    >>> R = ws.weibull_min.rvs(2, size=(3, 50), random_state=2)
+    >>> phats = ws.weibull_min.fit_many(R, floc=0, num_workers=1)
+    >>> phats['par'].shape
+    (3, 3)
+    '''
+    return fit_many(self, data, args, **kwds)
+
+
 def _support_mask(self, x):
     return (self.a <= x) & (x <= self.b)
 
@@ -500,9 +738,14 @@ rv_continuous.freeze = freeze
 
 rv_continuous._penalized_nlogps = _penalized_nlogps
 rv_continuous._penalized_nnlf = _penalized_nnlf
+rv_continuous._penalized_nlogps_vec = _penalized_nlogps_vec
+rv_continuous._penalized_nlogps_grad = _penalized_nlogps_grad
+rv_continuous._has_nlogps_grad = _has_nlogps_grad
+rv_continuous._penalized_nnlf_vec = _penalized_nnlf_vec
 rv_continuous._reduce_func = _reduce_func
 rv_continuous.fit = fit
 rv_continuous._fit = _fit
 rv_continuous.fit2 = fit2
+rv_continuous.fit_many = _fit_many
 rv_continuous._support_mask = _support_mask
 rv_continuous._open_support_mask = _open_support_mask
@@ -1,8 +1,8 @@
 from __future__ import division
 import warnings
 from wafo.containers import PlotData
-from wafo.misc import findextrema
-from scipy import special
+from wafo.numba_misc import _find_ok_peaks
+from scipy import special, sparse, linalg
 import numpy as np
 from numpy import inf
 from numpy import atleast_1d, nan, ndarray, sqrt, vstack, ones, where, zeros
@@ -12,8 +12,9 @@ from time import gmtime, strftime
 
 
 __all__ = [
-    'edf', 'edfcnd', 'reslife', 'dispersion_idx', 'decluster', 'findpot',
-           'declustering_time', 'interexceedance_times', 'extremal_idx']
+    'EmpiricalDistribution', 'edf', 'edfcnd', 'reslife', 'fitgenparrange',
+    'dispersion_idx', 'decluster', 'findpot', 'pot_events',
+    'declustering_time', 'interexceedance_times', 'extremal_idx']
 
 arr = asarray
 
@@ -65,13 +66,165 @@ def _invnorm(q):
     return special.ndtri(q)
 
 
-def edf(x, method=2):
+class EmpiricalDistribution(object):
+    """
+    Empirical distribution of a data sample.
+
+    The data are sorted once and the number of observations less than or
+    equal to each observation (the rank) is stored, so that the empirical
+    cdf, sf and quantile function can be evaluated repeatedly by binary
+    search without re-sorting the data.
+
+    Parameters
+    ----------
+    data : array-like
+        data vector
+    method : integer scalar
+        plotting positions used by plotting_positions and to_plotdata:
+        1. Interpolation so that F(X_(k)) == (k-0.5)/n.
+        2. Interpolation so that F(X_(k)) == k/(n+1).    (default)
+        3. The empirical distribution. F(X_(k)) = k/n
+    copydata : bool
+        If True copy data (default). Otherwise data are sorted in place
+        unless they are already sorted.
+
+    Attributes
+    ----------
+    data : ndarray, shape (n,)
+        sorted data
+    rank : ndarray of int32 (int64 if n >= 2**31)
+        number of observations less than or equal to data[k]
+    n : int
+        sample size
+
+    Example
+    -------
+    >>> import wafo.stats as ws
+    >>> ed = ws.EmpiricalDistribution([3, 1, 2, 2, 5])
+    >>> ed.cdf([0, 2, 2.5, 5])
+    array([0. , 0.6, 0.6, 1. ])
+    >>> ed.sf(2, closed=True)
+    0.8
+    >>> ed.ppf([0.2, 0.5, 1])
+    array([1., 2., 5.])
+    >>> lower, upper = ed.band(alpha=0.05)
+    >>> h = ed.to_plotdata().plot()
+
+    See also
+    --------
+    edf, edfcnd
+    """
+
+    def __init__(self, data, method=2, copydata=True):
+        x = np.asarray(data)
+        if x.ndim != 1:
+            x = x.ravel()
+        if copydata:
+            x = x.copy()
+        if np.any(x[1:] < x[:-1]):
+            x.sort()
+        n = x.size
+        itype = np.int32 if n < 2**31 else np.int64
+        is_last = np.hstack((x[1:] != x[:-1], True))[:n]
+        i_last = np.flatnonzero(is_last)
+        self.data = x
+        self.rank = np.repeat((i_last + 1).astype(itype),
+                              np.diff(np.hstack((-1, i_last))))
+        self.n = n
+        self.method = method
+
+    def _count(self, x, side='right'):
+        if x is self.data and side == 'right':
+            return self.rank
+        return np.searchsorted(self.data, x, side=side)
+
+    def cdf(self, x):
+        """Return empirical cumulative distribution function, P(X <= x)."""
+        return self._count(x) / self.n
+
+    def sf(self, x, closed=False):
+        """Return empirical survival function, P(X > x).
+
+        If closed is True return P(X >= x) instead.
+        """
+        side = 'left' if closed else 'right'
+        return (self.n - self._count(x, side=side)) / self.n
+
+    def ppf(self, q):
+        """Return empirical quantile, i.e., the smallest data value x with
+        P(X <= x) >= q.
+        """
+        q = np.asarray(q, dtype=float)
+        n = self.n
+        k = np.ceil(n * q)
+        k = where((k - 1) / n >= q, k - 1, k)  # correct for round off
+        x = self.data[np.clip(k, 1, n).astype(int) - 1].astype(float)
+        return where((0 <= q) & (q <= 1), x, nan)
+
+    def isf(self, q):
+        """Return inverse of the empirical survival function."""
+        return self.ppf(1 - np.asarray(q, dtype=float))
+
+    def plotting_positions(self, method=None):
+        """Return plotting positions F(X_(k)) of the sorted data
+
+        See the method parameter of the class for the options.
+        """
+        method = self.method if method is None else method
+        n = self.n
+        if method == 1:
+            return arange(0.5, n) / n
+        elif method == 3:
+            return arange(1, n + 1) / n
+        return arange(1, n + 1) / (n + 1)
+
+    def band(self, alpha=0.05, kind='dkw'):
+        """Return (1-alpha) confidence band for the cdf at the sorted data
+
+        Parameters
+        ----------
+        alpha : real scalar
+            confidence coefficient.
+        kind : 'dkw' or 'kolmogorov'
+            'dkw' uses the Dvoretzky-Kiefer-Wolfowitz inequality which is
+            conservative, but valid for all n. 'kolmogorov' uses the
+            asymptotic Kolmogorov distribution.
+
+        Returns
+        -------
+        lower, upper : ndarray
+            confidence band for the cdf evaluated at self.data.
+        """
+        if kind.startswith('dkw'):
+            eps = sqrt(np.log(2.0 / alpha) / (2 * self.n))
+        elif kind.startswith('kol'):
+            eps = special.kolmogi(alpha) / sqrt(self.n)
+        else:
+            raise ValueError('Unknown kind: {}'.format(kind))
+        F = self.cdf(self.data)
+        return np.maximum(F - eps, 0), np.minimum(F + eps, 1)
+
+    def conditional(self, c):
+        """Return empirical distribution conditioned that X >= c."""
+        ix = np.searchsorted(self.data, c, side='left')
+        return EmpiricalDistribution(self.data[ix:], method=self.method,
+                                     copydata=False)
+
+    def to_plotdata(self, method=None):
+        """Return empirical distribution function as a PlotData object."""
+        F = PlotData(self.plotting_positions(method), self.data, xlab='x',
+                     ylab='F(x)')
+        F.setplotter('step')
+        return F
+
+
+def edf(x, method=None):
     """
     Returns Empirical Distribution Function (EDF).
 
     Parameters
     ----------
-    x : array-like
+    x : array-like or EmpiricalDistribution object
         data vector
     method : integer scalar
         1. Interpolation so that F(X_(k)) == (k-0.5)/n.
@@ -86,22 +239,11 @@ def edf(x, method=2):
     >>> F = ws.edf(R)
     >>> h = F.plot()
 
-     See also edf, pdfplot, cumtrapz
+     See also EmpiricalDistribution, edfcnd, pdfplot, cumtrapz
     """
-    z = atleast_1d(x)
-    z.sort()
-
-    N = len(z)
-    if method == 1:
-        Fz1 = arange(0.5, N) / N
-    elif method == 3:
-        Fz1 = arange(1, N + 1) / N
-    else:
-        Fz1 = arange(1, N + 1) / (N + 1)
-
-    F = PlotData(Fz1, z, xlab='x', ylab='F(x)')
-    F.setplotter('step')
-    return F
+    if not isinstance(x, EmpiricalDistribution):
+        x = EmpiricalDistribution(atleast_1d(x), copydata=False)
+    return x.to_plotdata(method)
 
 
 def edfcnd(x, c=None, method=2):
@@ -110,7 +252,7 @@ def edfcnd(x, c=None, method=2):
 
     Parameters
     ----------
-    x : array-like
+    x : array-like or EmpiricalDistribution object
         data vector
     method : integer scalar
         1. Interpolation so that F(X_(k)) == (k-0.5)/n.
@@ -127,16 +269,17 @@ def edfcnd(x, c=None, method=2):
     >>> F = ws.edf(R)
     >>> h = F.plot()
 
-     See also edf, pdfplot, cumtrapz
+     See also EmpiricalDistribution, edf, pdfplot, cumtrapz
     """
-    z = atleast_1d(x)
+    if not isinstance(x, EmpiricalDistribution):
+        x = EmpiricalDistribution(atleast_1d(x), copydata=False)
     if c is None:
-        c = floor(min(z.min(), 0))
+        c = floor(min(x.data[0], 0))
 
-    try:
-        F = edf(z[c <= z], method=method)
-    except:
-        ValueError('No data points above c=%d' % int(c))
+    x_c = x.conditional(c)
+    if x_c.n == 0:
+        raise ValueError('No data points above c=%g' % c)
+    F = edf(x_c, method=method)
 
     if - inf < c:
         F.labels.ylab = 'F(x| X>=%g)' % c
@@ -161,6 +304,47 @@ def _check_nu(nu, nmin, n):
         nu = min(n - nmin, 100)
     return nu
 
+
+def _mean_residual_life(data, u):
+    """Return number, mean and standard deviation of excesses over u.
+
+    The data are sorted once and the exceedances of consecutive thresholds
+    are nested, so the moments of all thresholds are accumulated from the
+    top with the pairwise update of Chan et al. in a single pass.
+    """
+    x = np.sort(np.ravel(data))
+    u = np.ravel(u).astype(float)
+    order = np.argsort(u, kind='mergesort')
+    k = np.searchsorted(x, u[order], side='right')
+    edges = np.hstack((k, x.size))
+    counts = np.diff(edges)
+    x = x[k[0]:]
+    cumsum = np.hstack((0, np.cumsum(x)))
+    sums = cumsum[edges[1:] - k[0]] - cumsum[edges[:-1] - k[0]]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / np.maximum(counts, 1), 0)
+    dev2 = np.hstack((0, np.cumsum((x - np.repeat(means, counts))**2)))
+    m2s = dev2[edges[1:] - k[0]] - dev2[edges[:-1] - k[0]]
+
+    num, mean, m2 = zeros(u.size), zeros(u.size), zeros(u.size)
+    n_a, mean_a, m2_a = 0, 0.0, 0.0
+    for j in range(u.size - 1, -1, -1):
+        n_b = counts[j]
+        if n_b > 0:
+            n_ab = n_a + n_b
+            delta = means[j] - mean_a
+            mean_a += delta * n_b / n_ab
+            m2_a += m2s[j] + delta**2 * n_a * n_b / n_ab
+            n_a = n_ab
+        num[j], mean[j], m2[j] = n_a, mean_a, m2_a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mrl = np.where(num > 0, mean, nan) - u[order]
+        srl = sqrt(np.where(num > 0, m2 / num, nan))
+    out = zeros((3, u.size))
+    out[:, order] = mrl, srl, num
+    return out
+
+
 def reslife(data, u=None, umin=None, umax=None, nu=None, nmin=3, alpha=0.05,
             plotflag=False):
     """
@@ -202,6 +386,9 @@ def reslife(data, u=None, umin=None, umax=None, nu=None, nmin=3, alpha=0.05,
     where k,s is the shape and scale parameter, respectively.
     s0 = scale parameter for threshold u0<u.
 
+    The mean excesses and their confidence intervals are computed for all
+    thresholds in a single pass over the sorted data.
+
     Example
     -------
     >>> import wafo
@@ -227,11 +414,7 @@ def reslife(data, u=None, umin=None, umax=None, nu=None, nmin=3, alpha=0.05,
     # srl = valarray(nu)
     # num = valarray(nu)
 
-    mean_and_std = lambda data1: (data1.mean(), data1.std(), data1.size)
-    dat = arr(data)
-    tmp = arr([mean_and_std(dat[dat > tresh] - tresh) for tresh in u.tolist()])
-
-    mrl, srl, num = tmp.T
+    mrl, srl, num = _mean_residual_life(data, u)
     p = 1 - alpha
     alpha2 = alpha / 2
 
@@ -256,6 +439,169 @@ def reslife(data, u=None, umin=None, umax=None, nu=None, nmin=3, alpha=0.05,
     return res
 
 
+def _fit_genpareto_chunk(args):
+    """Fit genpareto to the exceedances of the thresholds in sequence.
+
+    Each fit is warm started from the fit at the previous threshold moved
+    to the new threshold by the threshold stability of the distribution,
+    i.e., scale_u = scale_u0 + c * (u - u0).
+    """
+    from wafo.stats._continuous_distns import genpareto
+    from wafo.stats.estimation import _fit_one
+    x, u, warm_start, kwds = args
+    start = None
+    results = []
+    for ui in u:
+        data = x[np.searchsorted(x, ui, side='right'):]
+        kwds_i = dict(kwds, floc=ui, copydata=False)
+        result = None
+        if start is not None:
+            c, u0, scale = start
+            start = (c, ui, scale + c * (ui - u0))
+            result = _fit_one(genpareto, data, (), start, kwds_i)
+        if result is None:
+            result = _fit_one(genpareto, data, (), None, kwds_i)
+        if warm_start and result is not None and np.all(np.isfinite(result[0])):
+            start = result[0]
+        results.append(result)
+    return results
+
+
+def fitgenparrange(data, u=None, umin=None, umax=None, nu=None, nmin=10,
+                   alpha=0.05, warm_start=True, num_workers=None,
+                   pool='thread', chunksize=None, plotflag=False, **kwds):
+    """
+    Return Generalized Pareto fits to exceedances for a range of thresholds
+
+    Parameters
+    ----------
+    data : array_like
+        vector of data of length N.
+    u :  array-like
+        threshold values (default linspace(umin, umax, nu))
+    umin, umax : real scalars
+        Minimum and maximum threshold, respectively
+        (default min(data), max(data)).
+    nu : scalar integer
+        number of threshold values (default min(N-nmin,100))
+    nmin : scalar integer
+        Minimum number of extremes to include. (Default 10).
+    alpha : real scalar
+        Confidence coefficient (default 0.05)
+    warm_start : bool
+        If true (default) each fit starts from the fit at the neighbouring
+        threshold.
+    num_workers : int, optional
+        number of worker processes or threads. Default is the number of cpus.
+    pool : 'process' or 'thread'
+        type of worker pool (default 'thread').
+    chunksize : int, optional
+        number of neighbouring thresholds fitted in sequence by a worker.
+    plotflag: bool
+    kwds : method, optimizer
+        passed on to FitDistribution.
+
+    Returns
+    -------
+    shape, mod_scale : PlotData objects
+        shape and modified scale parameter vs threshold with
+        100*(1-alpha)% confidence intervals.
+    phats : structured array
+        parameters, covariances, LLmax, LPSmax and pvalue of the fits, see
+        wafo.stats.estimation.fit_many.
+
+    Notes
+    -----
+    For a threshold u above a threshold u0 where the exceedances follow a
+    generalized Pareto distribution the shape, c, is constant and the
+    modified scale, scale_u - c * u, is independent of u. The threshold
+    should be chosen as the lowest one where the estimates are stable.
+
+    The data are sorted once and the exceedances of each threshold are
+    passed to the fit as views of the sorted data. The confidence
+    intervals are computed with the delta method.
+
+    Example
+    -------
+    >>> import wafo
+    >>> R = wafo.stats.genpareto.rvs(0.1, 2, 2, size=200, random_state=1)
+    >>> shape, mod_scale, phats = fitgenparrange(R, nu=5, num_workers=1)
+    >>> bool(np.all(phats['success']))
+    True
+    >>> h = shape.plot()
+
+    See also
+    --------
+    reslife, dispersion_idx, genpareto
+    """
+    from wafo.stats.estimation import (_num_workers_and_chunksize,
+                                       _map_chunks, _fit_table)
+    x = np.sort(np.ravel(data))
+    if u is None:
+        n = len(x)
+        nmin = _check_nmin(nmin, n)
+        umin, umax = _check_umin_umax(x, umin, umax, nmin)
+        nu = _check_nu(nu, nmin, n)
+        u = linspace(umin, umax, nu)
+    u = np.atleast_1d(u).astype(float)
+    nu = len(u)
+
+    num_workers, chunksize = _num_workers_and_chunksize(num_workers,
+                                                        chunksize, nu)
+    tasks = [(x, u[i:i + chunksize], warm_start, kwds)
+             for i in range(0, nu, chunksize)]
+    results = _map_chunks(_fit_genpareto_chunk, tasks, num_workers, pool)
+    num = x.size - np.searchsorted(x, u, side='right')
+    phats = _fit_table(results, num, 3)
+
+    c, scale = phats['par'][:, 0], phats['par'][:, 2]
+    cov = phats['par_cov']
+    mod_scale = scale - c * u
+    var_c = cov[:, 0, 0]
+    var_scale = cov[:, 2, 2] - 2 * u * cov[:, 0, 2] + u**2 * var_c
+    z_a = -_invnorm(alpha / 2)
+    p = 1 - alpha
+    title_txt = '{0:s} with {1:g}% CI'
+    res = []
+    for val, var, name in [(c, var_c, 'Shape'),
+                           (mod_scale, var_scale, 'Modified scale')]:
+        delta = z_a * sqrt(np.clip(var, 0, inf))
+        title = title_txt.format(name, 100 * p)
+        res_i = PlotData(val, u, xlab='Threshold', ylab=name, title=title)
+        res_i.workspace = dict(numdata=num, umin=umin, umax=umax, nu=nu,
+                               nmin=nmin, alpha=alpha)
+        res_i.children = [PlotData(vstack([val - delta, val + delta]).T, u,
+                                   xlab='Threshold', title=title)]
+        res_i.plot_args_children = [':r']
+        if plotflag:
+            res_i.plot()
+        res.append(res_i)
+    return res[0], res[1], phats
+
+
+def _dispersion_index(data, blocks, u, num_blocks):
+    """Return dispersion index of the number of exceedances per block.
+
+    The data are sorted once in decreasing order. When an exceedance is
+    added to a block with c exceedances the sum of squared block counts
+    grows by 2*c+1, where c is the rank of the exceedance within its block.
+    """
+    data = np.ravel(data)
+    order = np.argsort(-data, kind='mergesort')
+    x = data[order]
+    b = np.ravel(blocks)[order]
+    block_order = np.argsort(b, kind='mergesort')
+    counts = np.bincount(b, minlength=num_blocks)
+    starts = np.cumsum(counts) - counts
+    rank = np.empty(b.size, dtype=np.int64)
+    rank[block_order] = np.arange(b.size) - starts[b[block_order]]
+    sum_squares = np.hstack((0, np.cumsum(2 * rank + 1)))
+    num = np.searchsorted(-x, -np.ravel(u), side='left')
+    lambda_ = num / num_blocks
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sum_squares[num] / num_blocks - lambda_**2) / lambda_
+
+
 def dispersion_idx(
     data, t=None, u=None, umin=None, umax=None, nu=None, nmin=10, tb=1,
         alpha=0.05, plotflag=False):
@@ -300,6 +646,9 @@ def dispersion_idx(
     Thus the threshold should be so high that DI is not significantly
     different from 1.
 
+    The number of exceedances per block is accumulated for all thresholds
+    in a single pass over the data sorted in decreasing order.
+
     The Poisson hypothesis is not rejected if the estimated DI is between:
 
     chi2(alpha/2, M-1)/(M-1)< DI < chi^2(1 - alpha/2, M-1 }/(M - 1)
@@ -365,22 +714,11 @@ def dispersion_idx(
 
     nu = len(u)
 
-    di = np.zeros(nu)
-
-    d = arr(data)
-
     mint = int(min(t1))  # should be 0.
     maxt = int(max(t1))
     M = maxt - mint + 1
-    occ = np.zeros(M)
-
-    for ix, tresh in enumerate(u):
-        excess = (d > tresh)
-        lambda_ = excess.sum() / M
-        for block in range(M):
-            occ[block] = sum(excess[t1 == block])
 
-        di[ix] = occ.var() / lambda_
+    di = _dispersion_index(data, t1 - mint, u, M)
 
     p = 1.0 - alpha
 
@@ -389,7 +727,7 @@ def dispersion_idx(
 
     b_u, ok_u = _find_appropriate_threshold(u, di, di_low, di_up)
 
-    ci_txt = '{0:d}{1} CI'.format(100 * p, '%')
+    ci_txt = '{0:g}{1} CI'.format(100 * p, '%')
     titleTxt = 'Dispersion Index plot'
 
     res = PlotData(di, u, title=titleTxt,
@@ -453,18 +791,16 @@ def _remove_index_to_data_too_close_to_each_other(ix_e, is_too_small, di_e, ti_e
     is_too_close = np.hstack((is_too_small[0], is_too_small[:-1] | is_too_small[1:],
                               is_too_small[-1]))
     # Find opening (no) and closing (nc) index for data beeing to close:
-    iy = findextrema(np.hstack([0, 0, is_too_small, 0]))
-    no = iy[:2] - 1
-    nc = iy[1::2]
-    for start, stop in zip(no, nc):
-        iz = slice(start, stop)
-        i_ok = _find_ok_peaks(di_e[iz], ti_e[iz], tmin)
-        if len(i_ok):
-            is_too_close[start + i_ok] = 0
+    dn = np.diff(np.hstack((0, is_too_small.astype(np.int8), 0)))
+    no, = where(dn == 1)
+    nc, = where(dn == -1)
+    is_ok = np.array(1 - is_too_close, dtype=np.int8)
+    _find_ok_peaks(is_ok, arr(di_e, dtype=float), arr(ti_e, dtype=float),
+                   no.astype(np.int64), nc.astype(np.int64) + 1, float(tmin))
 
 # Remove data which is too close to other data.
-    if is_too_close.any():
-        i_ok, = where(1 - is_too_close)
+    if not is_ok.all():
+        i_ok, = where(is_ok)
         ix_e = ix_e[i_ok]
     return ix_e
 
@@ -540,31 +876,129 @@ def findpot(data, t=None, thresh=None, tmin=1):
     return ix_e
 
 
-def _find_ok_peaks(y, t, t_min):
+def _pot_clusters(channel, index, values, times, tmin):
+    """Return start of clusters and position of cluster maxima.
+
+    A new cluster starts when the channel changes or the time to the
+    previous exceedance is larger than tmin.
     """
-    Return indices to the largest maxima that are at least t_min distance apart.
+    is_new = np.hstack((True, (channel[1:] != channel[:-1]) |
+                        (np.diff(times) > tmin)))
+    starts, = where(is_new)
+    sizes = np.diff(np.hstack((starts, values.size)))
+    peaks = np.maximum.reduceat(values, starts)
+    cluster = np.repeat(np.arange(starts.size), sizes)
+    i_peak, = where(values == np.repeat(peaks, sizes))
+    _, first = np.unique(cluster[i_peak], return_index=True)
+    return starts, sizes, i_peak[first]
+
+
+def pot_events(data, t=None, thresh=None, tmin=1, chunksize=2**24):
     """
-    num_y = len(y)
+    Return table of declustered peaks over thresholds for many time series
 
-    i = np.argsort(-y)  # sort in descending order
+    Parameters
+    ----------
+    data : array-like, shape (n,) or (num_channels, n)
+        data-values, one channel in each row.
+    t : array-like, shape (n,)
+        sampling-times common to all channels (default arange(n)).
+    thresh : real scalar or array-like, shape (num_thresh,) or
+        (num_channels, num_thresh)
+        thresholds for levels in data.
+    tmin : real scalar
+        exceedances less than or equal to tmin apart belong to the same
+        cluster [same unit as t] (default 1)
+    chunksize : int
+        maximum number of data-values compared with the thresholds at once.
 
-    tis = t[i]
-    o_order = zeros(num_y, dtype=int)
-    o_order[i] = range(num_y)  # indices to the variables original location
+    Returns
+    -------
+    events : structured array
+        one row per cluster sorted by channel, threshold and time with fields
+        channel : channel number.
+        ithresh : threshold number.
+        thresh : threshold.
+        index : index to the cluster maximum in data.
+        t : time of the cluster maximum.
+        value : cluster maximum.
+        size : number of exceedances in the cluster.
+        duration : time between the first and last exceedance in the cluster.
 
-    is_too_close = zeros(num_y, dtype=bool)
+    Notes
+    -----
+    The clusters are found by run-length declustering, i.e., each run of
+    exceedances with gaps less than or equal to tmin is one event
+    represented by its maximum. The exceedances of the lowest threshold
+    are extracted once for all channels of a chunk and reused for the
+    higher thresholds, and the cluster maxima are found with
+    np.maximum.reduceat. This differs from findpot which may keep several
+    peaks in a cluster as long as they are more than tmin apart.
 
-    pool = zeros((num_y, 2))
-    t_range = np.hstack([-t_min, t_min])
-    k = 0
-    for i, ti in enumerate(tis):
-        is_too_close[i] = np.any((pool[:k, 0] <= ti) & (ti <= pool[:k, 1]))
-        if not is_too_close[i]:
-            pool[k] = ti + t_range
-            k += 1
+    Example
+    -------
+    >>> import wafo.data
+    >>> t, data = wafo.data.sea().T
+    >>> events = pot_events(data, t, thresh=[0.5, 1, 1.5], tmin=5)
+    >>> [int(np.sum(events['ithresh'] == i)) for i in range(3)]
+    [171, 79, 13]
+    >>> events.dtype.names
+    ('channel', 'ithresh', 'thresh', 'index', 't', 'value', 'size', 'duration')
 
-    i_ok, = where(1 - is_too_close[o_order])
-    return i_ok
+    See also
+    --------
+    findpot, decluster
+    """
+    data = np.atleast_2d(data)
+    num_channels, n = data.shape
+    if t is None:
+        t = np.arange(n)
+    t = arr(t, dtype=float)
+    order = np.argsort(t, kind='mergesort')
+    if np.any(order != np.arange(n)):
+        t, data = t[order], data[:, order]
+    else:
+        order = None
+    thresh = np.atleast_1d(arr(thresh, dtype=float))
+    if thresh.ndim == 1:
+        thresh = np.broadcast_to(thresh, (num_channels, thresh.size))
+    num_thresh = thresh.shape[1]
+
+    dtype = [('channel', np.int32), ('ithresh', np.int32), ('thresh', float),
+             ('index', np.int64), ('t', float), ('value', float),
+             ('size', np.int64), ('duration', float)]
+    step = max(chunksize // max(n, 1), 1)
+    tables = []
+    for first_channel in range(0, num_channels, step):
+        rows = slice(first_channel, first_channel + step)
+        lowest = thresh[rows].min(axis=1)
+        channel, index = where(data[rows] > lowest[:, None])
+        values = data[rows][channel, index]
+        channel = channel + first_channel
+        for k in range(num_thresh):
+            ok = values > thresh[channel, k]
+            ch, ix, val, ti = channel[ok], index[ok], values[ok], t[index[ok]]
+            if val.size == 0:
+                continue
+            starts, sizes, i_peak = _pot_clusters(ch, ix, val, ti, tmin)
+            table = np.zeros(starts.size, dtype=dtype)
+            table['channel'] = ch[starts]
+            table['ithresh'] = k
+            table['thresh'] = thresh[ch[starts], k]
+            table['index'] = ix[i_peak]
+            table['t'] = ti[i_peak]
+            table['value'] = val[i_peak]
+            table['size'] = sizes
+            table['duration'] = ti[starts + sizes - 1] - ti[starts]
+            tables.append(table)
+    if not tables:
+        return np.zeros(0, dtype=dtype)
+    events = np.concatenate(tables)
+    events = events[np.lexsort((events['t'], events['ithresh'],
+                                events['channel']))]
+    if order is not None:
+        events['index'] = order[events['index']]
+    return events
 
 
 def declustering_time(t):
@@ -692,6 +1126,91 @@ def _logitinv(x):
     return 1.0 / (np.exp(-x) + 1)
 
 
+def _dot(x, b):
+    """Return x * b for dense or sparse x as a 1D array."""
+    if sparse.issparse(x):
+        return x.dot(b)
+    return np.dot(x, b)
+
+
+def _newton_step(d2l, dl):
+    """Return solution of d2l * step = dl by Cholesky factorization of -d2l.
+
+    Falls back to least squares if -d2l is not positive definite.
+    """
+    try:
+        return -linalg.cho_solve(linalg.cho_factor(-d2l), dl)
+    except (linalg.LinAlgError, ValueError):
+        return np.linalg.lstsq(d2l, dl, rcond=-1)[0]
+
+
+class _SparseGram(object):
+    """Weighted Gram matrix X' * diag(d) * X of a sparse matrix X
+
+    The symbolic structure, i.e., the products of all pairs of nonzero
+    entries in each row of X and their position in the Gram matrix, is
+    computed once and reused for every new weight vector d. If the number
+    of pairs exceeds max_pairs sparse matrix products are used instead.
+    """
+
+    def __init__(self, X, max_pairs=2**26):
+        X = sparse.csr_matrix(X)
+        X.sum_duplicates()
+        X.sort_indices()
+        self.X = X
+        self.shape = (X.shape[1], X.shape[1])
+        nnz_row = np.diff(X.indptr)
+        self.row = None
+        if np.sum(nnz_row * (nnz_row + 1) // 2) > max_pairs:
+            return
+        rows, flat, prods = [], [], []
+        num_col = X.shape[1]
+        for m in np.unique(nnz_row[nnz_row > 0]):
+            rows_m = np.flatnonzero(nnz_row == m)
+            ix = X.indptr[rows_m][:, None] + np.arange(m)
+            cols, vals = X.indices[ix], X.data[ix]
+            iu, ju = np.triu_indices(m)
+            rows.append(np.repeat(rows_m, iu.size))
+            flat.append((cols[:, iu] * num_col + cols[:, ju]).ravel())
+            prods.append((vals[:, iu] * vals[:, ju]).ravel())
+        self.row = np.hstack(rows + [np.zeros(0, dtype=int)])
+        self.flat = np.hstack(flat + [np.zeros(0, dtype=int)])
+        self.prod = np.hstack(prods + [np.zeros(0)])
+
+    def __call__(self, d):
+        if self.row is None:
+            X = self.X
+            return X.T.dot(sparse.diags(d).dot(X)).toarray()
+        h = np.bincount(self.flat, weights=d[self.row] * self.prod,
+                        minlength=self.shape[0] * self.shape[1])
+        h = h.reshape(self.shape)
+        return h + h.T - np.diag(np.diag(h))
+
+
+def _aggregate_rows(y, X, weights):
+    """Collapse repeated rows of [y, X] into unique rows with summed weights.
+    """
+    if sparse.issparse(X):
+        raise ValueError('Aggregation requires a dense covariate matrix. ' +
+                         'Pass aggregated counts as weights instead.')
+    yx, inverse = np.unique(np.hstack((y, X)), axis=0, return_inverse=True)
+    weights = np.bincount(inverse.ravel(), weights=weights)
+    return yx[:, :1].astype(y.dtype), yx[:, 1:], weights
+
+
+def _fit_reglogit_chunk(args):
+    """Return numvar, df and deviance of the models with the first k
+    covariates for each k in the chunk.
+    """
+    options, y, X, weights, ks = args
+    results = []
+    for k in ks:
+        model = RegLogit(**options)
+        model.fit(y, X[:, :k] if k else None, weights=weights)
+        results.append((model.numvar, model.df, model.deviance))
+    return results
+
+
 class RegLogit(object):
 
     """
@@ -701,11 +1220,13 @@ class RegLogit(object):
 
         model = fitted model object with methods
           .compare() : Compare small LOGIT object versus large one
+          .anova()   : Sequential analysis of deviance of the covariates
           .predict() : Predict from a fitted LOGIT object
           .summary() : Display summary of fitted LOGIT object.
 
            y = vector of K ordered categories
-           x = column vectors of covariates
+           x = column vectors of covariates (dense or scipy.sparse matrix)
+     weights = observation weights or counts of repeated observations
      options = struct defining performance of REGLOGIT
           .maxiter    : maximum number of iterations.
           .accuracy   : accuracy in convergence.
@@ -721,6 +1242,7 @@ class RegLogit(object):
       .predict   : Predict from a fitted LOGIT object
       .summary   : Display summary of fitted LOGIT object.
       .compare   : Compare small LOGIT versus large one
+      .anova     : Sequential analysis of deviance (nested fits in parallel)
 
      Suppose Y takes values in K ordered categories, and let
      gamma_i (x) be the cumulative probability that Y
@@ -734,6 +1256,14 @@ class RegLogit(object):
      Y is binary and the model is ordinary logistic regression.  The
      matrix X is assumed to have full column rank.
 
+     The model is fitted by a Levenberg modified Newton's method where the
+     Newton steps are solved by Cholesky factorization. X may be a
+     scipy.sparse matrix, in which case the structure of X'*W*X is computed
+     once and reused in every iteration. Observations with identical
+     covariates and response can be collapsed into one row with a weight
+     equal to the number of repetitions, either by the user or by
+     fit(..., aggregate=True).
+
      Given Y only, theta = REGLOGIT(Y) fits the model with baseline logit odds
      only.
 
@@ -779,7 +1309,7 @@ class RegLogit(object):
         self.accuracy = accuracy
         self.alpha = alpha
         self.deletecolinear = deletecolinear
-        self.verbose = False
+        self.verbose = verbose
         self.family = None
         self.link = None
         self.numvar = None
@@ -820,10 +1350,12 @@ class RegLogit(object):
         my = y.shape[0]
         if X is None:
             X = np.zeros((my, 0))
+        elif sparse.issparse(X):
+            X = sparse.csr_matrix(X, dtype=float)
         elif self.deletecolinear:
             X = np.atleast_2d(X)
             # Make sure X is full rank
-            s = np.linalg.svd(X)[1]
+            s = np.linalg.svd(X, compute_uv=False)
             tol = max(X.shape) * np.finfo(s.max()).eps
             ix = np.flatnonzero(s > tol)
             iy = np.flatnonzero(s <= tol)
@@ -840,8 +1372,24 @@ class RegLogit(object):
                 'x and y must have the same number of observations')
         return y, X
 
-    def fit(self, y, X=None, theta0=None, beta0=None):
+    def fit(self, y, X=None, theta0=None, beta0=None, weights=None,
+            aggregate=False):
         """
+        Parameters
+        ----------
+        y : array-like, shape (n, 1)
+            ordered categories
+        X : array-like or scipy.sparse matrix, shape (n, nx)
+            covariates
+        theta0, beta0 : array-like
+            start values for theta and beta
+        weights : array-like, shape (n,)
+            observation weights, e.g., the number of times each row of
+            [y, X] is observed.
+        aggregate : bool
+            If True collapse repeated rows of [y, X] into one row weighted
+            by the number of repetitions before fitting (dense X only).
+
         Member variables
       .df           : degrees of freedom for error.
       .params       : estimated model parameters
@@ -862,7 +1410,25 @@ class RegLogit(object):
         """
         self.family = 'multinomial'
         self.link = 'logit'
+        y = np.round(np.atleast_2d(y))
+        if weights is None:
+            weights = np.ones(y.shape[0])
+        weights = np.asarray(weights, dtype=float).ravel()
+        if weights.size != y.shape[0]:
+            raise ValueError(
+                'weights and y must have the same number of observations')
+        if aggregate:
+            # Collapse the rows before the rank check of X in check_xy
+            if X is None:
+                X = np.zeros((y.shape[0], 0))
+            elif not sparse.issparse(X):
+                X = np.atleast_2d(X)
+            if X.shape[0] != y.shape[0]:
+                raise ValueError(
+                    'x and y must have the same number of observations')
+            y, X, weights = _aggregate_rows(y, X, weights)
         y, X = self.check_xy(y, X)
+        gram = _SparseGram(X) if sparse.issparse(X) else None
 
         # initial calculations
         tol = self.accuracy
@@ -878,9 +1444,9 @@ class RegLogit(object):
         z1 = z1[:, np.flatnonzero(z1.any(axis=0))]
         _mz, nz = z.shape
         _mx, nx = X.shape
-        my, _ny = y.shape
+        my = weights.sum()
 
-        g = (z.sum(axis=0).cumsum() / my).reshape(-1, 1)
+        g = (np.dot(weights, z).cumsum() / my).reshape(-1, 1)
         theta00 = np.log(g / (1 - g)).ravel()
         beta00 = np.zeros((nx,))
         # starting values
@@ -892,35 +1458,46 @@ class RegLogit(object):
 
         tb = np.hstack((theta0, beta0))
 
+        def loglike(tb):
+            return self.loglike(tb, y, X, z, z1, weights=weights, gram=gram)
+
         # likelihood and derivatives at starting values
-        [dev, dl, d2l] = self.loglike(tb, y, X, z, z1)
+        [dev, dl, d2l] = loglike(tb)
 
         epsilon = np.std(d2l) / 1000
         if np.any(beta0) or np.any(theta00 != theta0):
-            tb0 = np.vstack((theta00, beta00))
-            nulldev = self.loglike(tb0, y, X, z, z1)[0]
+            tb0 = np.hstack((theta00, beta00))
+            nulldev = loglike(tb0)[0]
         else:
             nulldev = dev
 
         # maximize likelihood using Levenberg modified Newton's method
+        step = _newton_step(d2l, dl)
+        stop = np.abs(np.dot(dl, step) / len(dl)) <= tol
         for i in range(self.maxiter + 1):
+            if stop:  # start values are already optimal
+                break
 
             tbold = tb
             devold = dev
-            tb = tbold - np.linalg.lstsq(d2l, dl)[0]
-            [dev, dl, d2l] = self.loglike(tb, y, X, z, z1)
-            if ((dev - devold) / np.dot(dl, tb - tbold) < 0):
+            dlold = dl
+            d2lold = d2l
+            tb = tbold - step
+            [dev, dl, d2l] = loglike(tb)
+            # The step is judged by the derivatives at tbold
+            if ((dev - devold) / np.dot(dlold, tb - tbold) < 0):
                 epsilon = epsilon / decr
             else:
-                while ((dev - devold) / np.dot(dl, tb - tbold) > 0):
+                while ((dev - devold) / np.dot(dlold, tb - tbold) > 0):
                     epsilon = epsilon * incr
                     if (epsilon > 1e+15):
                         raise ValueError('epsilon too large')
 
-                    tb = tbold - \
-                        np.linalg.lstsq(d2l - epsilon * np.eye(d2l.shape), dl)
-                    [dev, dl, d2l] = self.loglike(tb, y, X, z, z1)
-                    print('epsilon %g' % epsilon)
+                    tb = tbold - _newton_step(
+                        d2lold - epsilon * np.eye(len(dl)), dlold)
+                    [dev, dl, d2l] = loglike(tb)
+                    if self.verbose > 1:
+                        print('epsilon %g' % epsilon)
                     # end %while
                     # end else
             #[dl, d2l] = logistic_regression_derivatives (X, z, z1, g, g1, p);
@@ -933,8 +1510,8 @@ class RegLogit(object):
                 print(np.linalg.eig(d2l)[0].T)
                 # end
                 # end
-            stop = np.abs(
-                np.dot(dl, np.linalg.lstsq(d2l, dl)[0]) / len(dl)) <= tol
+            step = _newton_step(d2l, dl)
+            stop = np.abs(np.dot(dl, step) / len(dl)) <= tol
             if stop:
                 break
             # end %while
@@ -947,7 +1524,7 @@ class RegLogit(object):
         se = sqrt(np.diag(pcov))
 
         if (nx > 0):
-            eta = ((X * beta) * ones((1, nz))) + ((y * 0 + 1) * theta)
+            eta = _dot(X, beta).reshape(-1, 1) + theta
         else:
             eta = (y * 0 + 1) * theta
             # end
@@ -955,8 +1532,8 @@ class RegLogit(object):
             np.hstack(((y * 0), _logitinv(eta), (y * 0 + 1))), n=1, axis=1)
         k0 = min(y)
         mu = (k0 - 1) + np.dot(gammai, np.arange(1, nz + 2)).reshape(-1, 1)
-        r = np.corrcoef(np.hstack((y, mu)).T)
-        R2 = r[0, 1] ** 2
+        c = np.cov(np.hstack((y, mu)).T, aweights=weights)
+        R2 = c[0, 1] ** 2 / (c[0, 0] * c[1, 1])
         # coefficient of determination
         # adjusted coefficient of determination
         R2adj = max(1 - (1 - R2) * (my - 1) / (my - nx - nz - 1), 0)
@@ -994,12 +1571,15 @@ class RegLogit(object):
         self.mu = gammai
         self.eta = _logit(gammai)
         self.X = X
-        [dev, dl, d2l, p] = self.loglike(tb, y, X, z, z1, numout=4)
+        self.Y = y
+        self.weights = weights
+        [dev, dl, d2l, p] = self.loglike(tb, y, X, z, z1, numout=4,
+                                         weights=weights, gram=gram)
         self.theta = theta
         self.beta = beta
         self.gamma = gammai
         self.residual = res.T
-        self.residualD = np.sign(self.residual) * sqrt(-2 * np.log(p))
+        self.residualD = np.sign(res.ravel()) * sqrt(-2 * np.log(p.ravel()))
         self.deviance = dev
         self.deviance_null = nulldev
         self.d2L = d2l
@@ -1052,8 +1632,14 @@ class RegLogit(object):
                 As = self.X
             # end
 
-            if (((As - np.dot(Al * np.linalg.lstsq(Al, As))) > 500 * np.finfo(float).eps).any() or
-                    object2.family != self.family or object2.link != self.link):
+            if sparse.issparse(Al) or sparse.issparse(As):
+                # The inclusion test is too expensive for sparse designs
+                not_included = False
+            else:
+                not_included = (np.abs(As - np.dot(Al, np.linalg.lstsq(
+                    Al, As, rcond=-1)[0])) > 500 * np.finfo(float).eps).any()
+            if (not_included or object2.family != self.family or
+                    object2.link != self.link):
                 warnings.warn('Small model not included in large model,' +
                     ' result is rubbish!')
 
@@ -1081,6 +1667,71 @@ class RegLogit(object):
 
         return localpvalue
 
+    def anova(self, num_workers=None, pool='thread'):
+        """ Sequential analysis of deviance for the covariates
+
+        CALL  table = anova(num_workers, pool)
+
+        The models with the first k covariates, k = 0, 1, ..., nx-1, are
+        fitted to the data of the fitted model in parallel and compared with
+        the next larger model by the standard Chi2-test.
+
+        Parameters
+        ----------
+        num_workers : int, optional
+            number of worker processes or threads. Default is the number of
+            CPUs.
+        pool : 'process' or 'thread'
+            Type of worker pool (default 'thread').
+
+        Returns
+        -------
+        table : structured ndarray with fields
+            numvar, df, deviance : of the models with the first k covariates.
+            chi2, pvalue : test statistic and p-value against the previous
+                model (nan for the null model).
+
+        The table is printed if verbose is set.
+        """
+        from wafo.stats.estimation import (_num_workers_and_chunksize,
+                                           _map_chunks)
+        nx = self.X.shape[1]
+        options = dict(maxiter=self.maxiter, accuracy=self.accuracy,
+                       alpha=self.alpha, deletecolinear=self.deletecolinear)
+        num_workers, _ = _num_workers_and_chunksize(num_workers, 1, nx)
+        # Cyclic chunks balance the cost, which increases with k.
+        tasks = [(options, self.Y, self.X, self.weights,
+                  range(i, nx, num_workers)) for i in range(num_workers)]
+        results = sorted(_map_chunks(_fit_reglogit_chunk, tasks, num_workers,
+                                     pool))
+        results.append((self.numvar, self.df, self.deviance))
+
+        table = np.zeros(nx + 1, dtype=[('numvar', int), ('df', float),
+                                        ('deviance', float), ('chi2', float),
+                                        ('pvalue', float)])
+        table['numvar'], table['df'], table['deviance'] = zip(*results)
+        table['chi2'][0] = table['pvalue'][0] = nan
+        table['chi2'][1:] = np.abs(np.diff(table['deviance']))
+        table['pvalue'][1:] = 1 - _cdfchi2(table['chi2'][1:],
+                                           np.diff(table['numvar']))
+        if self.verbose:
+            self._print_anova(table)
+        return table
+
+    @staticmethod
+    def _print_anova(table):
+        print(' ')
+        print('                       Analysis of Deviance')
+        print('Model    DF      Residual deviance      Chi2-stat  ' +
+              '      Pr(>Chi2)')
+        print('Null     %d       %12.4f' % (table['df'][0],
+                                            table['deviance'][0]))
+        for k, row in enumerate(table[1:]):
+            print('+x%-5d  %d       %12.4f       %12.4f    %12.4f' %
+                  (k, row['df'], row['deviance'], row['chi2'],
+                   row['pvalue']))
+        print(' ')
+
     def anode(self):
         print(' ')
         print('                       Analysis of Deviance')
@@ -1131,15 +1782,16 @@ class RegLogit(object):
         # end
         e, s, z, p = (self.params, self.params_std, self.params_tstat,
                       self.params_pvalue)
-        for i in range(self.numk):
+        nz = self.numk - 1
+        for i in range(nz):
             print(
                 'theta_%d         %2.4f        %2.4f        %2.4f        %2.4f' %
                 (i, e[i], s[i], z[i], p[i]))
 
-        for i in range(self.numk, self.numvar):
+        for i in range(nz, self.numvar):
             print(
                 ' beta_%d         %2.4f        %2.4f        %2.4f        %2.4f\n' %
-                (i - self.numk, e[i], s[i], z[i], p[i]))
+                (i - nz, e[i], s[i], z[i], p[i]))
 
         print(' ')
         print('(Dispersion parameter for %s family taken to be %2.2f)' %
@@ -1173,6 +1825,8 @@ class RegLogit(object):
         [_mx, nx] = self.X.shape
         if Xnew is None:
             Xnew = self.X
+        elif sparse.issparse(Xnew):
+            Xnew = sparse.csr_matrix(Xnew)
         else:
             Xnew = np.atleast_2d(Xnew)
             notnans = np.flatnonzero(1 - (1 - np.isfinite(Xnew)).any(axis=1))
@@ -1187,7 +1841,7 @@ class RegLogit(object):
         nz = self.numk - 1
         one = ones((n, 1))
         if (nx > 0):
-            eta = np.dot(Xnew, self.beta).reshape(-1, 1) + self.theta
+            eta = _dot(Xnew, self.beta).reshape(-1, 1) + self.theta
         else:
             eta = one * self.theta
         # end
@@ -1206,11 +1860,14 @@ class RegLogit(object):
 
                 #% Var(eta_i) = var(theta_i+Xnew*b)
                 vareta = zeros((n, nz))
-                u = np.hstack((one, Xnew))
+                if sparse.issparse(Xnew):
+                    u = sparse.hstack((one, Xnew)).tocsr()
+                else:
+                    u = np.hstack((one, Xnew))
                 for i in range(nz):
                     ib[0] = i
                     vareta[:, i] = np.maximum(
-                        ((np.dot(u, R[ib][:, ib])) ** 2).sum(axis=1), eps)
+                        ((u.dot(R[ib][:, ib])) ** 2).sum(axis=1), eps)
                     # end
             else:
                 vareta = np.diag(pcov)
@@ -1233,21 +1890,31 @@ class RegLogit(object):
             return y, ylo, yup
         return y
 
-    def loglike(self, beta, y, x, z, z1, numout=3):
+    def loglike(self, beta, y, x, z, z1, numout=3, weights=None, gram=None):
         """
         [dev, dl, d2l, p] = loglike( y ,x,beta,z,z1)
         Calculates likelihood for the ordinal logistic regression model.
+
+        x may be a dense or scipy.sparse matrix and weights are optional
+        observation weights. gram is an optional _SparseGram object for x
+        which reuses the structure of x'*diag(d)*x between calls.
+        The derivatives are accumulated blockwise for theta and beta so
+        that [z, x] and [z1, x] are never formed.
         """
         # Author: Gordon K. Smyth <gks@maths.uq.oz.au>
-        zx = np.hstack((z, x))
-        z1x = np.hstack((z1, x))
-        g = _logitinv(np.dot(zx, beta)).reshape((-1, 1))
-        g1 = _logitinv(np.dot(z1x, beta)).reshape((-1, 1))
+        nz = z.shape[1]
+        theta = beta[:nz]
+        eta = _dot(x, beta[nz:]).reshape(-1, 1)
+        g = _logitinv(np.dot(z, theta).reshape(-1, 1) + eta)
+        g1 = _logitinv(np.dot(z1, theta).reshape(-1, 1) + eta)
         g = np.maximum(y == y.max(), g)
         g1 = np.minimum(y > y.min(), g1)
+        if weights is None:
+            weights = np.ones(y.shape[0])
+        w = weights.reshape(-1, 1)
 
         p = g - g1
-        dev = -2 * np.log(p).sum()
+        dev = -2 * np.sum(w * np.log(p))
 
         """[dl, d2l] = derivatives of loglike(beta, y, x, z, z1)
         % Called by logistic_regression.  Calculates derivates of the
@@ -1259,14 +1926,28 @@ class RegLogit(object):
         # first derivative
         v = g * (1 - g) / p
         v1 = g1 * (1 - g1) / p
-        dlogp = np.hstack((((v * z) - (v1 * z1)), ((v - v1) * x)))
-        dl = np.sum(dlogp, axis=0)
+        dlogp_theta = (v * z) - (v1 * z1)
+        dlogp_beta = v - v1  # times x
+        xt = x.T
+        dl = np.hstack((np.sum(w * dlogp_theta, axis=0),
+                        _dot(xt, (w * dlogp_beta).ravel())))
 
         # second derivative
-        w = v * (1 - 2 * g)
-        w1 = v1 * (1 - 2 * g1)
-        d2l = np.dot(zx.T, (w * zx)) - np.dot(
-            z1x.T, (w1 * z1x)) - np.dot(dlogp.T, dlogp)
+        ww = w * v * (1 - 2 * g)
+        ww1 = w * v1 * (1 - 2 * g1)
+        wdlogp_theta = w * dlogp_theta
+        d2l_tt = (np.dot(z.T, ww * z) - np.dot(z1.T, ww1 * z1) -
+                  np.dot(dlogp_theta.T, wdlogp_theta))
+        d2l_bt = _dot(xt, ww * z - ww1 * z1 - dlogp_beta * wdlogp_theta)
+        d = (ww - ww1 - w * dlogp_beta ** 2).ravel()
+        if gram is not None:
+            d2l_bb = gram(d)
+        elif sparse.issparse(x):
+            d2l_bb = _SparseGram(x)(d)
+        else:
+            d2l_bb = np.dot(xt, d.reshape(-1, 1) * x)
+        d2l = np.vstack((np.hstack((d2l_tt, d2l_bt.T)),
+                         np.hstack((d2l_bt, d2l_bb))))
 
         if numout == 4:
             return dev, dl, d2l,  p
@@ -13,6 +13,7 @@ from scipy.stats import rv_continuous
 from scipy.stats._distn_infrastructure import check_random_state
 from wafo.plotbackend import plotbackend as plt
 from wafo.misc import ecross, findcross
+from wafo.stats.core import EmpiricalDistribution
 from wafo.stats._constants import _EPS
 # from scipy._lib.six import string_types
 import numdifftools as nd  # @UnresolvedImport
@@ -22,12 +23,13 @@ from scipy import optimize
 
 import numpy as np
 from scipy.special import expm1, log1p
-from numpy import (arange, zeros, log, sqrt, exp,
+from numpy import (zeros, log, sqrt, exp,
                    asarray, nan, pi, isfinite)
 from numpy import flatnonzero as nonzero
 
 
-__all__ = ['Profile', 'FitDistribution']
+__all__ = ['Profile', 'FitDistribution', 'fit_many', 'compute_profiles',
+           'Bootstrap']
 
 
 floatinfo = np.finfo(float)
@@ -222,6 +224,10 @@ class Profile(object):
         Max number of points used in Lp (default 100)
     alpha : real scalar
         confidence coefficent (default 0.05)
+    mode : 'grid' or 'root'
+        'grid' evaluates the profile function on n points (default).
+        'root' only locates the two crossings of the confidence level by
+        bracketing and root finding, i.e., with about 15 optimizations.
 
     Returns
     -------
@@ -260,15 +266,24 @@ class Profile(object):
     >>> profile_phat_i.plot()
     >>> phat_ci = profile_phat_i.get_bounds(alpha=0.1)
 
+    # Same CI with far fewer optimizations
+    >>> profile_phat_i2 = Profile(phat, i=0, alpha=0.1, mode='root')
+    >>> phat_ci2 = profile_phat_i2.get_bounds(alpha=0.1)
+    >>> bool(np.allclose(phat_ci, phat_ci2, rtol=1e-2))
+    True
+
     """
     def __init__(self, fit_dist, i=None, pmin=None, pmax=None, n=100,
-                 alpha=0.05):
+                 alpha=0.05, mode='grid'):
 
         self.fit_dist = fit_dist
         self.pmin = pmin
         self.pmax = pmax
         self.n = n
         self.alpha = alpha
+        _assert(mode in ('grid', 'root'),
+                "mode must be 'grid' or 'root' (got {})".format(mode))
+        self.mode = mode
 
         self.data = None
         self.args = None
@@ -282,7 +297,10 @@ class Profile(object):
         self.alpha_Lrange = 0.5 * chi2isf(self.alpha, 1)
         self.alpha_cross_level = Lmax - self.alpha_Lrange
 
-        self._set_profile()
+        if mode == 'root':
+            self._set_profile_roots()
+        else:
+            self._set_profile()
 
     def _set_plot_labels(self, method, title='', xlabel=''):
         if not title:
@@ -399,6 +417,76 @@ class Profile(object):
 
         self._prettify_profile()
 
+    def _set_profile_roots(self):
+        self._par = self.fit_dist.par.copy()
+        p_opt = np.ravel(self._get_p_opt())[0]
+        phatfree = self._par[self.i_free].copy()
+        self._points = [(p_opt, self.Lmax, phatfree)]
+        self._bounds = {}
+        self.get_bounds(self.alpha)
+
+    def _profile_point(self, p):
+        """Return profile function at p warm started from nearest point."""
+        points = self._points
+        j = np.argmin([abs(p - p_j) for p_j, _, _ in points])
+        Lmax, phatfree = self._profile_optimum(points[j][2], p)
+        points.append((p, Lmax, phatfree))
+        return Lmax
+
+    def _find_crossing(self, p_opt, dp, p_limit, alpha):
+        """Return crossing of the profile function with the alpha level
+        in the direction dp from p_opt.
+        """
+        L_range = 0.5 * chi2isf(alpha, 1)
+        values = {}
+
+        def fun(p):
+            if p not in values:
+                values[p] = self._profile_point(p)
+            dL = values[p] - (self.Lmax - L_range)
+            return dL if np.isfinite(dL) else -L_range
+
+        p_in, p_out = p_opt, p_opt + dp
+        for _j in range(30):
+            if p_limit is not None and (p_out - p_limit) * dp >= 0:
+                p_out = p_limit
+                if fun(p_out) >= 0:
+                    warnings.warn('No crossing found within the limit '
+                                  '{}'.format(p_limit))
+                    return p_limit
+                break
+            if fun(p_out) < 0:
+                break
+            p_in, p_out = p_out, p_out + 2 * (p_out - p_in)
+        else:
+            warnings.warn('Exceeded max iterations searching for a crossing. '
+                          '(p={}, p_out={})'.format(p_opt, p_out))
+            return nan
+        try:
+            return optimize.brentq(fun, p_in, p_out, xtol=abs(dp) * 1e-4)
+        except ValueError as err:  # The optimum moved during the search
+            warnings.warn(str(err))
+        return nan
+
+    def _find_bounds(self, alpha):
+        p_opt = np.ravel(self._get_p_opt())[0]
+        pvar = np.ravel(self._get_variance())[0]
+        if pvar > 0:  # Step slightly beyond the delta method bound
+            dp = -1.5 * norm_ppf(alpha / 2.0) * sqrt(pvar)
+        else:
+            p_low, p_up = np.ravel(self._approx_p_min_max(p_opt))
+            dp = (p_up - p_low) / 15
+        bounds = np.array([self._find_crossing(p_opt, -dp, self.pmin, alpha),
+                           self._find_crossing(p_opt, dp, self.pmax, alpha)])
+        self._update_points()
+        return bounds
+
+    def _update_points(self):
+        p, data = np.array([point[:2] for point in self._points]).T
+        ix = np.argsort(p)
+        self.args = p[ix]
+        self.data = data[ix]
+
     def _prettify_profile(self):
         pvec = self.args
         ix = nonzero(np.isfinite(pvec))
@@ -451,12 +539,13 @@ class Profile(object):
     def _adaptive_pvec(self, p_opt, pmin, pmax):
         p_crit_low = (p_opt - pmin) / 5
         p_crit_up = (pmax - p_opt) / 5
-        n4 = np.floor(self.n / 4.0)
+        n4 = int(np.floor(self.n / 4.0))
         a, b = p_opt - p_crit_low, p_opt + p_crit_up
         pvec1 = np.linspace(pmin, a, n4 + 1)
         pvec2 = np.linspace(a, b, self.n - 2 * n4)
         pvec3 = np.linspace(b, pmax, n4 + 1)
-        pvec = np.unique(np.hstack((pvec1, p_opt, pvec2, pvec3)))
+        pvec = np.unique(np.hstack([np.ravel(pvec_i) for pvec_i in
+                                    (pvec1, p_opt, pvec2, pvec3)]))
         return pvec
 
     def _get_pvec(self, phatfree0, p_opt):
@@ -540,6 +629,10 @@ class Profile(object):
     def get_bounds(self, alpha=0.05):
         """Return confidence interval for profiled parameter
         """
+        if self.mode == 'root':
+            if alpha not in self._bounds:
+                self._bounds[alpha] = self._find_bounds(alpha)
+            return self._bounds[alpha]
         _assert_warn(self.alpha <= alpha, 'Might not be able to return bounds '
                      'with alpha less than {}'.format(self.alpha))
 
@@ -635,6 +728,10 @@ class ProfileQuantile(Profile):
         Max number of points used in Lp (default 100)
     alpha : real scalar
         confidence coefficent (default 0.05)
+    mode : 'grid' or 'root'
+        'grid' evaluates the profile function on n points (default).
+        'root' only locates the two crossings of the confidence level by
+        bracketing and root finding, i.e., with about 15 optimizations.
     link : function connecting the x-quantile and the survival probability
         (sf) with the fixed distribution parameter, i.e.:
         self.par[i] = link(x, logsf, self.par, i), where
@@ -682,14 +779,15 @@ class ProfileQuantile(Profile):
     >>> x_ci = profile_x.get_bounds(alpha=0.2)
     """
     def __init__(self, fit_dist, x, i=None, pmin=None, pmax=None, n=100,
-                 alpha=0.05, link=None):
+                 alpha=0.05, link=None, mode='grid'):
         self.x = x
         self.log_sf = fit_dist.logsf(x)
         if link is None:
             link = LINKS.get(fit_dist.dist.name)
         self.link = link
         super(ProfileQuantile, self).__init__(fit_dist, i=i, pmin=pmin,
-                                              pmax=pmax, n=100, alpha=alpha)
+                                              pmax=pmax, n=100, alpha=alpha,
+                                              mode=mode)
 
     def _get_p_opt(self):
         return self.x
@@ -732,6 +830,10 @@ class ProfileProbability(Profile):
         Max number of points used in Lp (default 100)
     alpha : real scalar
         confidence coefficent (default 0.05)
+    mode : 'grid' or 'root'
+        'grid' evaluates the profile function on n points (default).
+        'root' only locates the two crossings of the confidence level by
+        bracketing and root finding, i.e., with about 15 optimizations.
     link : function connecting the x-quantile and the survival probability
         (sf) with the fixed distribution parameter, i.e.:
         self.par[i] = link(x, logsf, self.par, i), where
@@ -778,14 +880,15 @@ class ProfileProbability(Profile):
     >>> logsf_ci = profile_logsf.get_bounds(alpha=0.2)
     """
     def __init__(self, fit_dist, logsf, i=None, pmin=None, pmax=None, n=100,
-                 alpha=0.05, link=None):
+                 alpha=0.05, link=None, mode='grid'):
         self.x = fit_dist.isf(np.exp(logsf))
         self.log_sf = logsf
         if link is None:
             link = LINKS.get(fit_dist.dist.name)
         self.link = link
         super(ProfileProbability, self).__init__(fit_dist, i=i, pmin=pmin,
-                                                 pmax=pmax, n=100, alpha=alpha)
+                                                 pmax=pmax, n=100, alpha=alpha,
+                                                 mode=mode)
 
     def _get_p_opt(self):
         return self.log_sf
@@ -810,6 +913,123 @@ class ProfileProbability(Profile):
         super(ProfileProbability, self)._set_plot_labels(method, title, xlabel)
 
 
+def _profile_task(args):
+    fit_dist, kind, value, i_link, kwds = args
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if kind == 'i':
+            return Profile(fit_dist, i=value, **kwds)
+        if kind == 'x':
+            return ProfileQuantile(fit_dist, value, i=i_link, **kwds)
+        return ProfileProbability(fit_dist, value, i=i_link, **kwds)
+
+
+def compute_profiles(fit_dist, i=(), x=(), log_sf=(), i_link=None,
+                     num_workers=None, pool='thread', **kwds):
+    """
+    Return independent profile functions computed in parallel
+
+    Parameters
+    ----------
+    fit_dist : FitDistribution object
+        with ML or MPS estimated distribution parameters.
+    i : sequence of integers
+        distribution parameters to profile.
+    x : sequence of real scalars
+        quantiles (return values) to profile.
+    log_sf : sequence of real scalars
+        logarithm of survival probabilities to profile.
+    i_link : scalar integer
+        distribution parameter to keep fixed when profiling x and log_sf
+        (default first non-fixed parameter)
+    num_workers : int, optional
+        number of worker processes or threads. Default is the number of cpus.
+    pool : 'process' or 'thread'
+        type of worker pool (default 'thread').
+    kwds : alpha, mode, pmin, pmax, n
+        passed on to Profile, ProfileQuantile and ProfileProbability.
+
+    Returns
+    -------
+    profiles : list
+        Profile objects for i followed by ProfileQuantile objects for x and
+        ProfileProbability objects for log_sf.
+
+    Examples
+    --------
+    >>> import wafo.stats as ws
+    >>> R = ws.weibull_min.rvs(1, size=100, random_state=1)
+    >>> phat = FitDistribution(ws.weibull_min, R, 1, scale=1, floc=0.0)
+    >>> profiles = compute_profiles(phat, i=[0, 2], x=[phat.isf(0.01)],
+    ...                             i_link=2, mode='root', num_workers=2)
+    >>> [type(profile).__name__ for profile in profiles]
+    ['Profile', 'Profile', 'ProfileQuantile']
+    >>> cis = [profile.get_bounds() for profile in profiles]
+
+    See also
+    --------
+    Profile, ProfileQuantile, ProfileProbability
+    """
+    tasks = [(fit_dist, kind, value, i_link, kwds)
+             for kind, values in [('i', i), ('x', x), ('log_sf', log_sf)]
+             for value in np.atleast_1d(values)]
+    if num_workers is None:
+        import multiprocessing
+        num_workers = multiprocessing.cpu_count()
+    num_workers = min(num_workers, len(tasks))
+    if num_workers <= 1:
+        return [_profile_task(task) for task in tasks]
+    workers = _get_pool(pool, num_workers)
+    try:
+        profiles = workers.map(_profile_task, tasks, chunksize=1)
+    finally:
+        workers.close()
+        workers.join()
+    for profile in profiles:
+        profile.fit_dist = fit_dist
+    return profiles
+
+
+class _SpacingData(object):
+    """Sorted data with cached tie bookkeeping for the MPS method
+
+    The data are sorted and the ties located once so that Moran's log
+    product spacings statistic and its gradient can be evaluated repeatedly
+    for different parameters without redoing the bookkeeping.
+
+    Parameters
+    ----------
+    data : array-like
+        data sample. No copy is made if data is already a sorted 1D float
+        array.
+
+    Attributes
+    ----------
+    x : ndarray, shape (n,)
+        sorted data.
+    i_tie : ndarray
+        indices i where x[i] == x[i+1].
+    has_ties : bool
+        True if there are ties in the data.
+    """
+    def __init__(self, data):
+        x = np.asarray(data, dtype=float)
+        if x.ndim != 1:
+            x = x.ravel()
+        if np.any(x[1:] < x[:-1]):
+            x = np.sort(x)
+        self.x = x
+        self.n = x.size
+        self.i_tie = nonzero(x[1:] == x[:-1])
+        self.has_ties = self.i_tie.size > 0
+
+    @classmethod
+    def asdata(cls, data):
+        if isinstance(data, cls):
+            return data
+        return cls(data)
+
+
 # Frozen RV class
 class rv_frozen(object):
     """ Frozen continous or discrete 1D Random Variable object (RV)
@@ -1101,6 +1321,7 @@ class FitDistribution(rv_frozen):
         self.data.sort()
         if isinstance(args, (float, int)):
             args = (args, )
+        self._fit_args, self._fit_kwds = args, kwds.copy()
         self.fit(*args, **kwds)
 
     def _set_fixed_par(self, fixedn):
@@ -1151,10 +1372,32 @@ class FitDistribution(rv_frozen):
             t.append('%s = %s\n' % (par, str(getattr(self, par))))
         return ''.join(t)
 
+    @staticmethod
+    def _hessian_steps(theta, delta):
+        """Return parameter vectors needed for a central difference Hessian
+
+        Returns
+        -------
+        thetas : ndarray, shape (num_par, 1 + 2 * num_par**2)
+            theta followed by theta +/- delta * e_i for all i and
+            theta + delta * (+/-e_i +/- e_j) for all i < j, stored columnwise.
+        """
+        num_par = len(theta)
+        eye = np.eye(num_par) * delta
+        iu, ju = np.triu_indices(num_par, 1)
+        steps = [zeros((num_par, 1)), eye, -eye]
+        for si, sj in [(1, 1), (1, -1), (-1, -1), (-1, 1)]:
+            steps.append((si * eye[:, iu] + sj * eye[:, ju]))
+        return np.asarray(theta, dtype=float)[:, None] + np.hstack(steps)
+
     @staticmethod
     def _hessian(nnlf, theta, data, eps=None):
         """ approximate hessian of nnlf where theta are the parameters
         (including loc and scale)
+
+        nnlf must accept a 2-D array of parameter vectors stored columnwise
+        and return the function value for each column. All the perturbed
+        parameter vectors are evaluated in one call.
         """
         if eps is None:
             eps = (_EPS) ** 0.25
@@ -1168,39 +1411,37 @@ class FitDistribution(rv_frozen):
         # Approximate 1/(nE( (d L(x|theta)/dtheta)^2)) with
         #              1/(d^2 L(theta|x)/dtheta^2)
         # using central differences
-
-        LL = nnlf(theta, data)
-        H = zeros((num_par, num_par))   # Hessian matrix
-        theta = tuple(theta)
-        for ix in range(num_par):
-            sparam = list(theta)
-            sparam[ix] = theta[ix] + delta
-            fp = nnlf(sparam, data)
-
-            sparam[ix] = theta[ix] - delta
-            fm = nnlf(sparam, data)
-
-            H[ix, ix] = (fp - 2 * LL + fm) / delta2
-            for iy in range(ix + 1, num_par):
-                sparam[ix] = theta[ix] + delta
-                sparam[iy] = theta[iy] + delta
-                fpp = nnlf(sparam, data)
-
-                sparam[iy] = theta[iy] - delta
-                fpm = nnlf(sparam, data)
-
-                sparam[ix] = theta[ix] - delta
-                fmm = nnlf(sparam, data)
-
-                sparam[iy] = theta[iy] + delta
-                fmp = nnlf(sparam, data)
-
-                H[ix, iy] = ((fpp + fmm) - (fmp + fpm)) / (4. * delta2)
-                H[iy, ix] = H[ix, iy]
-                sparam[iy] = theta[iy]
+        thetas = FitDistribution._hessian_steps(theta, delta)
+        f = np.asarray(nnlf(thetas, data), dtype=float)
+        LL, fp, fm = f[0], f[1:num_par + 1], f[num_par + 1:2 * num_par + 1]
+        fpp, fpm, fmm, fmp = f[2 * num_par + 1:].reshape(4, -1)
+
+        H = np.diag((fp - 2 * LL + fm) / delta2)  # Hessian matrix
+        iu, ju = np.triu_indices(num_par, 1)
+        H[iu, ju] = ((fpp + fmm) - (fmp + fpm)) / (4. * delta2)
+        H[ju, iu] = H[iu, ju]
         return -H
 
+    @staticmethod
+    def _hessian_from_gradient(grad, theta, data, eps=None):
+        """ approximate hessian of nnlf by central differences of its
+        analytic gradient, grad(theta, data).
+        """
+        if eps is None:
+            eps = (_EPS) ** (1. / 3)
+        num_par = len(theta)
+        delta = (eps + 2.0) - 2.0
+        thetas = FitDistribution._hessian_steps(theta, delta)
+        gp = np.array([grad(thetas[:, i], data)
+                       for i in range(1, num_par + 1)])
+        gm = np.array([grad(thetas[:, i], data)
+                       for i in range(num_par + 1, 2 * num_par + 1)])
+        H = (gp - gm) / (2 * delta)
+        return -(H + H.T) / 2
+
     def _nnlf(self, theta, x):
+        if np.ndim(theta) > 1:
+            return self.dist._penalized_nnlf_vec(theta, x)
         return self.dist._penalized_nnlf(theta, x)
 
     def _nlogps(self, theta, x):
@@ -1228,8 +1469,20 @@ class FitDistribution(rv_frozen):
         product of spacings.",
         IMS Lecture Notes Monograph Series 2006, Vol. 52, pp. 272-283
         """
+        if x is self.data:
+            x = self._spacing
+        if np.ndim(theta) > 1:
+            return self.dist._penalized_nlogps_vec(theta, x)
         return self.dist._penalized_nlogps(theta, x)
 
+    @property
+    def _spacing(self):
+        """Sorted data with ties located, cached for the MPS method."""
+        spacing = getattr(self, '_spacing_data', None)
+        if spacing is None or spacing.x is not self.data:
+            spacing = self._spacing_data = _SpacingData(self.data)
+        return spacing
+
     def _invert_hessian(self, H):
         par_cov = zeros(H.shape)
         somefixed = ((self.par_fix is not None) and
@@ -1244,11 +1497,31 @@ class FitDistribution(rv_frozen):
             par_cov = -pinv2(H)
         return par_cov
 
+    def _compute_hessian(self):
+        """Return hessian of the log-likelihood or log product spacing
+        function evaluated at the estimated parameters.
+
+        Analytic derivatives are used if the distribution provides them
+        through the _nnlf_hessian or _nnlf_grad methods (ML) or the
+        _cdf_shape_grad method (MPS).
+        """
+        if self._fitfun == self._nnlf:
+            hessian = getattr(self.dist, '_nnlf_hessian', None)
+            if hessian is not None:
+                return -np.asarray(hessian(self.par, self.data))
+            grad = getattr(self.dist, '_nnlf_grad', None)
+            if grad is not None:
+                return self._hessian_from_gradient(grad, self.par, self.data)
+        elif self.dist._has_nlogps_grad():
+            return self._hessian_from_gradient(
+                self.dist._penalized_nlogps_grad, self.par, self._spacing)
+        return self._hessian(self._fitfun, self.par, self.data)
+
     def _compute_cov(self):
         """Compute covariance
         """
 
-        H = np.asmatrix(self._hessian(self._fitfun, self.par, self.data))
+        H = np.asmatrix(self._compute_hessian())
         # H = -nd.Hessian(lambda par: self._fitfun(par, self.data),
         #                 method='forward')(self.par)
         self.H = H
@@ -1325,21 +1598,42 @@ class FitDistribution(rv_frozen):
         """
         return ProfileProbability(self, log_sf, **kwds)
 
-    def ci_sf(self, sf, alpha=0.05, i=2):
+    def bootstrap(self, **kwds):
+        """
+        Parametric or nonparametric bootstrap of parameters and return levels
+
+        Examples
+        --------
+        >>> import wafo.stats as ws
+        >>> R = ws.genpareto.rvs(0.1, size=50, random_state=1)
+        >>> phat = FitDistribution(ws.genpareto, R, floc=0)
+
+        # 90% BCa CI for the parameters and the quantile isf(0.01)
+        >>> boot = phat.bootstrap(num_samples=100, sf=0.01, seed=1,
+        ...                       num_workers=1)
+        >>> lower, upper = boot.get_bounds(alpha=0.1)
+
+        See also
+        --------
+        Bootstrap
+        """
+        return Bootstrap(self, **kwds)
+
+    def ci_sf(self, sf, alpha=0.05, i=2, **kwds):
         ci = []
         for log_sfi in np.atleast_1d(np.log(sf)).ravel():
             try:
-                Lp = self.profile_probability(log_sfi, i=i)
+                Lp = self.profile_probability(log_sfi, i=i, **kwds)
                 ci.append(np.exp(Lp.get_bounds(alpha=alpha)))
             except Exception:
                 ci.append((np.nan, np.nan))
         return np.array(ci)
 
-    def ci_quantile(self, x, alpha=0.05, i=2):
+    def ci_quantile(self, x, alpha=0.05, i=2, **kwds):
         ci = []
         for xi in np.atleast_1d(x).ravel():
             try:
-                Lx = self.profile_quantile(xi, i=2)
+                Lx = self.profile_quantile(xi, i=2, **kwds)
                 ci.append(Lx.get_bounds(alpha=alpha))
             except Exception:
                 ci.append((np.nan, np.nan))
@@ -1397,44 +1691,63 @@ class FitDistribution(rv_frozen):
         except AttributeError:
             pass
 
-    def plotesf(self, symb1='r-', symb2='b.', axis=None, plot_ci=False):
+    @property
+    def edf(self):
+        """Empirical distribution of the data, cached for the plots."""
+        edf = getattr(self, '_edf', None)
+        if edf is None or edf.data is not self.data:
+            edf = self._edf = EmpiricalDistribution(self.data, copydata=False)
+        return edf
+
+    def plotesf(self, symb1='r-', symb2='b.', axis=None, plot_ci=False,
+                plot_band=False):
         """  Plot Empirical and fitted Survival Function
 
         The purpose of the plot is to graphically assess whether
         the data could come from the fitted distribution.
         If so the empirical CDF should resemble the model CDF.
         Other distribution types will introduce deviations in the plot.
+        If plot_band is True the 95% DKW confidence band of the empirical
+        survival function is also plotted.
         """
         if axis is None:
             axis = plt.gca()
-        n = len(self.data)
-        sf = (arange(n, 0, -1)) / n
+        edf = self.edf
+        sf = edf.sf(self.data, closed=True)
         axis.semilogy(self.data, sf, symb2,
                       self.data, self.sf(self.data), symb1)
 
         if plot_ci:
-            low = int(np.log10(1.0/n)-0.7) - 1
+            low = int(np.log10(1.0 / edf.n) - 0.7) - 1
             sf1 = np.logspace(low, -0.5, 7)[::-1]
-            ci1 = self.ci_sf(sf, alpha=0.05, i=2)
+            ci1 = self.ci_sf(sf1, alpha=0.05, i=2)
             axis.semilogy(self.isf(sf1), ci1, 'r--')
+        if plot_band:
+            lower, upper = edf.band(alpha=0.05)
+            axis.semilogy(self.data, 1 - upper, 'b:', self.data, 1 - lower,
+                          'b:')
         axis.set_xlabel('x')
         axis.set_ylabel('F(x) (%s)' % self.dist.name)
         axis.set_title('Empirical SF plot')
 
-    def plotecdf(self, symb1='r-', symb2='b.', axis=None):
+    def plotecdf(self, symb1='r-', symb2='b.', axis=None, plot_band=False):
         """  Plot Empirical and fitted Cumulative Distribution Function
 
         The purpose of the plot is to graphically assess whether
         the data could come from the fitted distribution.
         If so the empirical CDF should resemble the model CDF.
         Other distribution types will introduce deviations in the plot.
+        If plot_band is True the 95% DKW confidence band of the empirical
+        CDF is also plotted.
         """
         if axis is None:
             axis = plt.gca()
-        n = len(self.data)
-        F = (arange(1, n + 1)) / n
-        axis.plot(self.data, F, symb2,
+        edf = self.edf
+        axis.plot(self.data, edf.cdf(self.data), symb2,
                   self.data, self.cdf(self.data), symb1)
+        if plot_band:
+            lower, upper = edf.band(alpha=0.05)
+            axis.plot(self.data, lower, 'b:', self.data, upper, 'b:')
         axis.set_xlabel('x')
         axis.set_ylabel('F(x) ({})'.format(self.dist.name))
         axis.set_title('Empirical CDF plot')
@@ -1504,8 +1817,7 @@ class FitDistribution(rv_frozen):
         """
         if axis is None:
             axis = plt.gca()
-        n = len(self.data)
-        eprob = (arange(1, n + 1) - 0.5) / n
+        eprob = self.edf.plotting_positions(method=1)
         y = self.ppf(eprob)
         y1 = self.data[[0, -1]]
         axis.plot(self.data, y, symb2, y1, y1, symb1)
@@ -1525,9 +1837,8 @@ class FitDistribution(rv_frozen):
         """
         if axis is None:
             axis = plt.gca()
-        n = len(self.data)
         # ecdf = (0.5:n-0.5)/n;
-        ecdf = arange(1, n + 1) / (n + 1)
+        ecdf = self.edf.plotting_positions(method=2)
         mcdf = self.cdf(self.data)
         p1 = [0, 1]
         axis.plot(ecdf, mcdf, symb2, p1, p1, symb1)
@@ -1545,16 +1856,17 @@ class FitDistribution(rv_frozen):
 
             Note: the data in x must be sorted
         """
-        dx = np.diff(x, axis=0)
-        tie = (dx == 0)
-        if np.any(tie):
+        if x is self.data:
+            x = self._spacing
+        x = _SpacingData.asdata(x)
+        if x.has_ties:
             warnings.warn(
                 'P-value is on the conservative side (i.e. too large) due to' +
                 ' ties in the data!')
 
         T = self._nlogps(theta, x)
 
-        n = len(x)
+        n = x.n
         np1 = n + 1
         if unknown_numpar is None:
             k = len(theta)
@@ -1572,6 +1884,425 @@ class FitDistribution(rv_frozen):
         return pvalue
 
 
+def _warm_start(args, start, kwds):
+    kwds = dict(kwds)
+    if start is not None:
+        kwds.update(loc=start[-2], scale=start[-1])
+        args = tuple(start[:-2])
+    return args, kwds
+
+
+def _fit_one(dist, data, args, start, kwds):
+    args, kwds = _warm_start(args, start, kwds)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            with np.errstate(all='ignore'):
+                phat = FitDistribution(dist, data, args, **kwds)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    return phat.par, phat.par_cov, phat.LLmax, phat.LPSmax, phat.pvalue
+
+
+def _fit_chunk(args):
+    """Fit the samples in sequence, each one starting from the previous fit.
+    """
+    dist, samples, args, warm_start, kwds = args
+    start = None
+    results = []
+    for data in samples:
+        result = _fit_one(dist, data, args, start, kwds)
+        if result is None and start is not None:
+            result = _fit_one(dist, data, args, None, kwds)
+        if warm_start and result is not None and np.all(isfinite(result[0])):
+            start = result[0]
+        results.append(result)
+    return results
+
+
+def _split_samples(data, mask):
+    if (isinstance(data, np.ndarray) and data.ndim == 2) or mask is not None:
+        data = np.ma.masked_array(data, mask=mask)
+        data = np.ma.masked_invalid(np.ma.atleast_2d(data))
+        return [row.compressed() for row in data]
+    if isinstance(data, np.ndarray) and data.ndim == 1:
+        return [data]
+    return [np.ravel(sample) for sample in data]
+
+
+def _get_pool(pool, num_workers):
+    if pool == 'thread':
+        from multiprocessing.pool import ThreadPool
+        return ThreadPool(num_workers)
+    _assert(pool == 'process',
+            "pool must be 'process' or 'thread' (got {})".format(pool))
+    import multiprocessing
+    return multiprocessing.Pool(num_workers)
+
+
+def fit_many(dist, data, args=(), mask=None, warm_start=True,
+             num_workers=None, pool='thread', chunksize=None, **kwds):
+    """
+    Return ML or MPS estimators for many samples of the same distribution
+
+    Parameters
+    ----------
+    dist : scipy distribution object
+        distribution to fit to data
+    data : list of array-likes or 2-D array
+        samples to fit. A 2-D array holds one sample in each row where
+        masked or non-finite values are ignored.
+    args : optional
+        Starting values for the shape arguments (those not specified
+        will be determined by dist._fitstart(data)). With warm_start only
+        the first fit of each chunk starts from these values.
+    mask : array-like, optional
+        boolean array with the same shape as data. True values are ignored.
+    warm_start : bool
+        If true (default) each fit starts from the parameters of the
+        previous (neighbouring) sample.
+    num_workers : int, optional
+        number of worker processes or threads. Default is the number of cpus.
+    pool : 'process' or 'thread'
+        type of worker pool (default 'thread').
+    chunksize : int, optional
+        number of neighbouring samples fitted in sequence by a worker.
+    kwds : loc, scale, f0..fn, floc, fscale, method, alpha, optimizer
+        passed on to FitDistribution.
+
+    Returns
+    -------
+    phats : structured array, shape (num_samples,)
+        with fields:
+        par : distribution parameters (fixed and fitted)
+        par_cov : covariance of distribution parameters
+        LLmax : loglikelihood function evaluated using par
+        LPSmax : log product spacing function evaluated using par
+        pvalue : p-value for the fit
+        n : number of data in the sample
+        success : True if the fit succeeded, otherwise the fields are nan.
+
+    Examples
+    --------
+    >>> import wafo.stats as ws
+    >>> R = ws.genpareto.rvs(0.1, size=(6, 100), random_state=1)
+    >>> phats = fit_many(ws.genpareto, R, floc=0, num_workers=2)
+    >>> phats['par'].shape, phats['par_cov'].shape
+    ((6, 3), (6, 3, 3))
+    >>> bool(np.all(phats['success'])), bool(np.all(phats['par'][:, 1] == 0))
+    (True, True)
+    >>> phat = FitDistribution(ws.genpareto, R[0], floc=0)
+    >>> np.allclose(phats['par'][0], phat.par, rtol=1e-2)
+    True
+
+    See also
+    --------
+    FitDistribution
+    """
+    samples = _split_samples(data, mask)
+    num_samples = len(samples)
+    if isinstance(args, (float, int)):
+        args = (args, )
+    num_workers, chunksize = _num_workers_and_chunksize(num_workers,
+                                                        chunksize, num_samples)
+    tasks = [(dist, samples[i:i + chunksize], args, warm_start, kwds)
+             for i in range(0, num_samples, chunksize)]
+    results = _map_chunks(_fit_chunk, tasks, num_workers, pool)
+    return _fit_table(results, [len(sample) for sample in samples],
+                      dist.numargs + 2)
+
+
+def _num_workers_and_chunksize(num_workers, chunksize, num_tasks):
+    if num_workers is None:
+        import multiprocessing
+        num_workers = multiprocessing.cpu_count()
+    num_workers = max(min(num_workers, num_tasks), 1)
+    if chunksize is None:
+        chunksize = int(np.ceil(num_tasks / (4.0 * num_workers)))
+    return num_workers, max(chunksize, 1)
+
+
+def _map_chunks(fun, tasks, num_workers, pool):
+    """Return the concatenated results of fun applied to the chunks."""
+    if num_workers == 1:
+        chunks = [fun(task) for task in tasks]
+    else:
+        workers = _get_pool(pool, num_workers)
+        try:
+            chunks = workers.map(fun, tasks)
+        finally:
+            workers.close()
+            workers.join()
+    return [result for chunk in chunks for result in chunk]
+
+
+def _fit_table(results, sizes, num_par):
+    """Return structured array of results from _fit_one."""
+    dtype = [('par', float, (num_par,)),
+             ('par_cov', float, (num_par, num_par)),
+             ('LLmax', float), ('LPSmax', float), ('pvalue', float),
+             ('n', int), ('success', bool)]
+    phats = np.zeros(len(results), dtype=dtype)
+    for phat, result, size in zip(phats, results, sizes):
+        phat['n'] = size
+        if result is None:
+            phat['par'] = phat['par_cov'] = nan
+            phat['LLmax'] = phat['LPSmax'] = phat['pvalue'] = nan
+        else:
+            phat['par'], phat['par_cov'] = result[:2]
+            phat['LLmax'], phat['LPSmax'], phat['pvalue'] = result[2:]
+            phat['success'] = True
+    return phats
+
+
+def _imap_chunks(fun, tasks, num_workers, pool):
+    """Yield the results of fun applied to the chunks as they complete."""
+    if num_workers == 1:
+        for task in tasks:
+            yield fun(task)
+        return
+    workers = _get_pool(pool, num_workers)
+    try:
+        for chunk in workers.imap_unordered(fun, tasks):
+            yield chunk
+    finally:
+        workers.close()
+        workers.join()
+
+
+def _spawn_generators(seed, num):
+    """Return num independent random generators derived from seed.
+
+    numpy.random.SeedSequence is used when available (numpy >= 1.17),
+    otherwise RandomState objects seeded from check_random_state(seed).
+    """
+    try:
+        from numpy.random import SeedSequence, default_rng
+    except ImportError:
+        seeds = check_random_state(seed).randint(0, 2**31 - 1, size=num)
+        return [np.random.RandomState(s) for s in seeds]
+    if isinstance(seed, np.random.RandomState):
+        seed = seed.randint(0, 2**31 - 1, size=4)
+    elif hasattr(seed, 'integers'):  # numpy.random.Generator
+        seed = seed.integers(0, 2**31 - 1, size=4)
+    if not isinstance(seed, SeedSequence):
+        seed = SeedSequence(seed)
+    return [default_rng(s) for s in seed.spawn(num)]
+
+
+def _resample(dist, data, par, kind, rng, rows):
+    """Return the sorted resamples of sorted data as rows of a matrix."""
+    n = data.size
+    if kind == 'jackknife':
+        j = np.arange(n - 1)
+        return data[j + (j >= rows[:, None])]
+    if kind == 'parametric':
+        random = getattr(rng, 'random_sample', None) or rng.random
+        return dist.ppf(np.sort(random((rows.size, n)), axis=1), *par)
+    integers = getattr(rng, 'integers', None) or rng.randint
+    return data[np.sort(integers(0, n, size=(rows.size, n)), axis=1)]
+
+
+def _fit_par(dist, data, args, start, kwds):
+    args, kwds = _warm_start(args, start, kwds)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            with np.errstate(all='ignore'):
+                par = np.asarray(dist._fit(data, *args, **kwds)[0])
+    except Exception:  # pylint: disable=broad-except
+        return None
+    return par if np.all(isfinite(par)) else None
+
+
+def _bootstrap_chunk(args):
+    """Return estimates of the resamples in each block of the chunk."""
+    dist, data, par, sf, kind, fit_args, warm_start, kwds, blocks = args
+    start = par if warm_start else None
+    results = []
+    for rows, rng in blocks:
+        values = np.full((rows.size, par.size + sf.size), nan)
+        samples = _resample(dist, data, par, kind, rng, rows)
+        for sample, value in zip(samples, values):
+            phat = _fit_par(dist, sample, fit_args, start, kwds)
+            if phat is None and start is not None:
+                phat = _fit_par(dist, sample, fit_args, None, kwds)
+            if phat is not None:
+                value[:par.size] = phat
+                value[par.size:] = dist.isf(sf, *phat)
+        results.append((rows, values))
+    return results
+
+
+class Bootstrap(object):
+    """
+    Parametric or nonparametric bootstrap of parameters and return levels
+
+    Parameters
+    ----------
+    fit_dist : FitDistribution object
+        with ML or MPS estimated distribution parameters.
+    num_samples : scalar integer
+        number of bootstrap replicates (default 999)
+    kind : 'nonparametric' or 'parametric'
+        'nonparametric' resamples the data with replacement (default).
+        'parametric' draws the samples from the fitted distribution.
+    sf : sequence of real scalars
+        survival probabilities of the return levels to bootstrap, i.e.,
+        the quantiles fit_dist.isf(sf).
+    seed : None, int, sequence of ints, SeedSequence or RandomState
+        entropy for numpy.random.SeedSequence. The replicates are drawn in
+        blocks of `blocksize` samples, each from its own spawned generator,
+        so the result does not depend on num_workers, pool or chunksize.
+    warm_start : bool
+        If true (default) all fits start from fit_dist.par.
+    num_workers : int, optional
+        number of worker processes or threads. Default is the number of cpus.
+    pool : 'process' or 'thread'
+        type of worker pool (default 'thread').
+    chunksize : int, optional
+        number of blocks fitted by a worker in each task.
+
+    Member methods
+    -------------
+    get_bounds() : Return 100(1-alpha)% confidence intervals
+    jackknife() : Return leave-one-out estimates
+
+    Member variables
+    ----------------
+    fit_dist : FitDistribution data object.
+    theta : parameters followed by the return levels of fit_dist.
+    replicates : bootstrap estimates of theta, one row per resample. The rows
+        of the fits that failed are nan.
+    success : True for the resamples where the fit succeeded.
+
+    Each resample is drawn as a row of an index matrix (or of a matrix of
+    uniform variates for the parametric bootstrap) and its estimates are
+    written into the preallocated replicates array as the workers complete.
+    The BCa intervals use the jackknife estimates to compute the
+    acceleration, i.e., one additional fit for each observation.
+
+    Examples
+    --------
+    >>> import wafo.stats as ws
+    >>> R = ws.genextreme.rvs(-0.1, size=50, random_state=1)
+    >>> phat = FitDistribution(ws.genextreme, R)
+    >>> boot = Bootstrap(phat, num_samples=60, sf=[0.1, 0.01], seed=1,
+    ...                  num_workers=2)
+    >>> boot.replicates.shape
+    (60, 5)
+    >>> boot2 = Bootstrap(phat, num_samples=60, sf=[0.1, 0.01], seed=1,
+    ...                   num_workers=1)
+    >>> bool(np.array_equal(boot.replicates, boot2.replicates))
+    True
+    >>> lower, upper = boot.get_bounds(alpha=0.1)
+    >>> bool(np.all((lower <= boot.theta) & (boot.theta <= upper)))
+    True
+
+    See also
+    --------
+    Profile, FitDistribution.par_lower, FitDistribution.par_upper
+    """
+    blocksize = 32
+
+    def __init__(self, fit_dist, num_samples=999, kind='nonparametric',
+                 sf=(), seed=None, warm_start=True, num_workers=None,
+                 pool='thread', chunksize=None):
+        _assert(kind in ('nonparametric', 'parametric'),
+                "kind must be 'nonparametric' or 'parametric' "
+                "(got {})".format(kind))
+        self.fit_dist = fit_dist
+        self.kind = kind
+        self.sf = np.atleast_1d(np.asarray(sf, dtype=float)).ravel()
+        self.warm_start = warm_start
+        self.num_workers = num_workers
+        self.pool = pool
+        self.chunksize = chunksize
+        par = np.asarray(fit_dist.par, dtype=float)
+        self.theta = np.hstack((par, fit_dist.dist.isf(self.sf, *par)))
+        num_blocks = -(-num_samples // self.blocksize)
+        self.replicates = self._estimate(
+            kind, num_samples, _spawn_generators(seed, num_blocks))
+        self.success = np.all(isfinite(self.replicates), axis=1)
+        self._jackknife = None
+
+    def _estimate(self, kind, num_samples, generators):
+        fit_dist = self.fit_dist
+        blocksize = self.blocksize
+        rows = np.arange(num_samples)
+        blocks = [(rows[i:i + blocksize], rng)
+                  for i, rng in zip(range(0, num_samples, blocksize),
+                                    generators)]
+        num_workers, chunksize = _num_workers_and_chunksize(
+            self.num_workers, self.chunksize, len(blocks))
+        par = np.asarray(fit_dist.par, dtype=float)
+        tasks = [(fit_dist.dist, fit_dist.data, par, self.sf, kind,
+                  fit_dist._fit_args, self.warm_start, fit_dist._fit_kwds,
+                  blocks[i:i + chunksize])
+                 for i in range(0, len(blocks), chunksize)]
+        values = np.full((num_samples, self.theta.size), nan)
+        for chunk in _imap_chunks(_bootstrap_chunk, tasks, num_workers,
+                                  self.pool):
+            for rows, block_values in chunk:
+                values[rows] = block_values
+        return values
+
+    def jackknife(self):
+        """Return the leave-one-out estimates of theta, one row per datum."""
+        if self._jackknife is None:
+            n = self.fit_dist.data.size
+            num_blocks = -(-n // self.blocksize)
+            self._jackknife = self._estimate('jackknife', n,
+                                             [None] * num_blocks)
+        return self._jackknife
+
+    def _acceleration(self):
+        values = self.jackknife()
+        values = values[np.all(isfinite(values), axis=1)]
+        dev = values.mean(axis=0) - values
+        num = (dev ** 3).sum(axis=0)
+        den = 6.0 * (dev ** 2).sum(axis=0) ** 1.5
+        return np.where(den > 0, num / np.where(den > 0, den, 1), 0)
+
+    def get_bounds(self, alpha=0.05, method='bca'):
+        """Return 100(1-alpha)% confidence intervals for theta
+
+        Parameters
+        ----------
+        alpha : real scalar
+            confidence coefficent (default 0.05)
+        method : 'bca', 'percentile' or 'basic'
+            'bca' bias corrected and accelerated percentile interval
+            (default), 'percentile' interval or 'basic' (reverse percentile)
+            interval.
+
+        Returns
+        -------
+        bounds : array, shape (2, len(theta))
+            lower and upper bounds.
+        """
+        _assert(method in ('bca', 'percentile', 'basic'),
+                "method must be 'bca', 'percentile' or 'basic' "
+                "(got {})".format(method))
+        values = self.replicates[self.success]
+        _assert(len(values) > 0, 'All bootstrap fits failed!')
+        levels = np.array([[alpha / 2], [1 - alpha / 2]]) * np.ones(
+            self.theta.size)
+        if method == 'bca':
+            num = len(values)
+            prb = ((values < self.theta).sum(axis=0) +
+                   0.5 * (values == self.theta).sum(axis=0)) / num
+            z0 = norm_ppf(np.clip(prb, 0.5 / num, 1 - 0.5 / num))
+            acc = self._acceleration()
+            z = z0 + norm_ppf(levels)
+            levels = special.ndtr(z0 + z / (1 - acc * z))
+        bounds = np.array([np.percentile(values[:, j], 100 * levels[:, j])
+                           for j in range(self.theta.size)]).T
+        if method == 'basic':
+            bounds = 2 * self.theta - bounds[::-1]
+        return bounds
+
+
 def test_doctstrings():
     import doctest
     doctest.testmod()
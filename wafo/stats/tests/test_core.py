@@ -0,0 +1,233 @@
+from __future__ import division
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from wafo.stats.core import (reslife, dispersion_idx, _mean_residual_life,
+                             _dispersion_index, findpot, pot_events,
+                             fitgenparrange, EmpiricalDistribution, edf,
+                             edfcnd, RegLogit)
+from wafo.stats import genpareto
+from wafo.stats.tests.test_estimation import _check_exits
+from scipy import sparse
+
+
+def test_empirical_distribution():
+    rng = np.random.RandomState(0)
+    data = np.round(rng.gamma(2, size=300), 1)
+    ed = EmpiricalDistribution(data)
+    assert ed.n == data.size and ed.rank.dtype == np.int32
+    assert_array_equal(ed.data, np.sort(data))
+    x = np.hstack((data, np.linspace(-1, 20, 101)))
+    assert_allclose(ed.cdf(x), [np.mean(data <= xi) for xi in x])
+    assert_allclose(ed.sf(x), [np.mean(data > xi) for xi in x])
+    assert_allclose(ed.sf(x, closed=True), [np.mean(data >= xi) for xi in x])
+    assert_allclose(ed.cdf(ed.data), ed.rank / ed.n)
+
+    q = np.hstack((np.arange(301) / 300, np.linspace(0, 1, 97)))
+    desired = [ed.data[ed.cdf(ed.data) >= qi][0] for qi in q]
+    assert_array_equal(ed.ppf(q), desired)
+    assert np.all(np.isnan(ed.ppf([-0.1, 1.1])))
+
+    lower, upper = ed.band(alpha=0.05)
+    eps = np.sqrt(np.log(2 / 0.05) / (2 * ed.n))
+    assert_allclose(upper - lower, np.minimum(ed.rank / ed.n + eps, 1) -
+                    np.maximum(ed.rank / ed.n - eps, 0))
+    lower_k, upper_k = ed.band(alpha=0.05, kind='kolmogorov')
+    assert np.all(upper_k - lower_k <= upper - lower)
+
+    for method, positions in [(1, (np.arange(1, 301) - 0.5) / 300),
+                              (2, np.arange(1, 301) / 301),
+                              (3, np.arange(1, 301) / 300)]:
+        F = edf(data, method=method)
+        assert_allclose(F.data, positions)
+        assert_array_equal(F.args, ed.data)
+        assert_array_equal(edf(ed, method=method).data, positions)
+    Fc = edfcnd(ed, 2)
+    assert_array_equal(Fc.args, ed.data[ed.data >= 2])
+    assert_allclose(Fc.data, np.arange(1, Fc.args.size + 1) /
+                    (Fc.args.size + 1))
+
+
+def test_reglogit_sparse_weights(capsys):
+    rng = np.random.RandomState(1)
+    n = 300
+    x1 = rng.randint(0, 4, n)
+    x2 = rng.randint(0, 3, n)
+    X = np.zeros((n, 5))
+    X[x1 > 0, x1[x1 > 0] - 1] = 1
+    X[x2 > 0, 2 + x2[x2 > 0]] = 1
+    eta = 0.5 * x1 - 0.7 * x2 + 0.3
+    y = ((rng.rand(n) < 1 / (1 + np.exp(-eta))).astype(int) +
+         (rng.rand(n) < 0.3)).reshape(-1, 1)
+
+    b = RegLogit(verbose=0)
+    b.fit(y, X)
+    bs = RegLogit(verbose=0)
+    bs.fit(y, sparse.csr_matrix(X))
+    assert_allclose(bs.params, b.params, atol=1e-10)
+    assert_allclose(bs.deviance, b.deviance)
+    assert_allclose(bs.predict(sparse.csr_matrix(X[:7])), b.predict(X[:7]))
+
+    ba = RegLogit(verbose=0)
+    ba.fit(y, X, aggregate=True)
+    assert ba.Y.shape[0] < n and ba.numobs == n
+    assert_allclose(ba.params, b.params, atol=1e-8)
+    assert_allclose(ba.deviance, b.deviance)
+
+    bw = RegLogit(verbose=0)
+    bw.fit(y[:100], X[:100], weights=np.full(100, 2))
+    bd = RegLogit(verbose=0)
+    bd.fit(np.vstack((y[:100], y[:100])), np.vstack((X[:100], X[:100])))
+    assert_allclose(bw.params, bd.params, atol=1e-8)
+    assert_allclose(bw.deviance, bd.deviance)
+
+    table = b.anova(num_workers=1)
+    assert capsys.readouterr().out == ''
+    assert_allclose(b.anova(num_workers=2)['deviance'], table['deviance'])
+    assert_array_equal(table['numvar'], b.numvar - np.arange(5, -1, -1))
+    for k in [0, 3]:
+        bk = RegLogit(verbose=0)
+        bk.fit(y, X[:, :k] if k else None)
+        assert_allclose(table['deviance'][k], bk.deviance)
+    assert_allclose(table['deviance'][-1], b.deviance)
+    b3 = RegLogit(verbose=0)
+    b3.fit(y, X[:, :3])
+    pvalue = b3.compare(b)
+    assert 0 <= pvalue <= 1
+
+
+def test_reglogit_anova_process_pool():
+    _check_exits("""
+import numpy as np
+from wafo.stats.core import RegLogit
+rng = np.random.RandomState(1)
+X = rng.randn(200, 3)
+y = (rng.rand(200) < 1 / (1 + np.exp(-X.dot([1, -1, 0])))).astype(int)
+b = RegLogit(verbose=0)
+b.fit(y.reshape(-1, 1), X)
+table = b.anova(num_workers=2, pool='process')
+assert np.allclose(table['deviance'], b.anova(num_workers=1)['deviance'])
+""")
+
+
+def test_mean_residual_life():
+    rng = np.random.RandomState(0)
+    data = np.round(rng.gamma(2, size=1000), 2) + 100
+    u = np.hstack((np.linspace(99, data.max() + 1, 50), 103, 103))
+    rng.shuffle(u)
+    mrl, srl, num = _mean_residual_life(data, u)
+    for ui, mrl_i, srl_i, num_i in zip(u, mrl, srl, num):
+        excess = data[data > ui] - ui
+        assert num_i == excess.size
+        if excess.size:
+            assert_allclose(mrl_i, excess.mean(), rtol=1e-10, atol=1e-10)
+            assert_allclose(srl_i, excess.std(), rtol=1e-8, atol=1e-10)
+        else:
+            assert np.isnan(mrl_i) and np.isnan(srl_i)
+
+    res = reslife(data, nu=20)
+    assert_array_equal(res.workspace['numdata'],
+                       [(data > ui).sum() for ui in res.args])
+
+
+def test_dispersion_index():
+    rng = np.random.RandomState(1)
+    data = np.round(rng.exponential(size=2000), 1)
+    t = np.sort(rng.uniform(0, 100, size=data.size))
+    u = np.linspace(0, 4, 30)
+    blocks = np.floor((t - t.min()) / 10).astype(int)
+    di = _dispersion_index(data, blocks, u, 10)
+    for ui, di_i in zip(u, di):
+        excess = data > ui
+        occ = np.bincount(blocks[excess], minlength=10)
+        assert_allclose(di_i, occ.var() / (excess.sum() / 10))
+
+    res, _b_u, _ok_u = dispersion_idx(data, t, u=u, tb=10)
+    assert_allclose(res.data, di)
+
+
+def _findpot_loop(data, t, thresh, tmin):
+    ix = np.flatnonzero(data > thresh)
+    y, ti = data[ix], t[ix]
+    keep = np.ones(ix.size, dtype=bool)
+    is_close = np.diff(ti) <= tmin
+    start = 0
+    while start < ix.size:
+        stop = start
+        while stop < ix.size - 1 and is_close[stop]:
+            stop += 1
+        accepted = []
+        for i in sorted(range(start, stop + 1), key=lambda i: -y[i]):
+            if any(tj - tmin <= ti[i] <= tj + tmin for tj in accepted):
+                keep[i] = False
+            else:
+                accepted.append(ti[i])
+        start = stop + 1
+    return ix[keep]
+
+
+def test_findpot():
+    rng = np.random.RandomState(2)
+    data = np.cumsum(rng.standard_normal(3000)) / 10
+    data = data - data.mean()
+    t = np.arange(3000) * 0.5
+    for thresh, tmin in [(0, 5), (0.5, 10), (1, 1)]:
+        assert_array_equal(findpot(data, t, thresh, tmin),
+                           _findpot_loop(data, t, thresh, tmin))
+
+
+def test_pot_events():
+    rng = np.random.RandomState(3)
+    data = rng.standard_normal((3, 2000))
+    thresh = [1.5, 2., 2.5]
+    events = pot_events(data, thresh=thresh, tmin=4)
+    for channel in range(3):
+        for k, thresh_k in enumerate(thresh):
+            ix = np.flatnonzero(data[channel] > thresh_k)
+            edges = np.hstack((0, np.flatnonzero(np.diff(ix) > 4) + 1,
+                               ix.size))
+            peaks = [ix[a + np.argmax(data[channel, ix[a:b]])]
+                     for a, b in zip(edges[:-1], edges[1:])]
+            mask = (events['channel'] == channel) & (events['ithresh'] == k)
+            assert_array_equal(events['index'][mask], peaks)
+            assert_array_equal(events['size'][mask], np.diff(edges))
+            assert_allclose(events['value'][mask], data[channel, peaks])
+
+    # Unsorted times and a single channel
+    t = rng.permutation(2000) * 1.0
+    events1 = pot_events(data[0], t, thresh=2., tmin=4)
+    i = np.argsort(t)
+    events2 = pot_events(data[0][i], t[i], thresh=2., tmin=4)
+    assert_array_equal(events1['index'], i[events2['index']])
+    assert_allclose(events1['value'], events2['value'])
+
+
+def test_fitgenparrange():
+    data = genpareto.rvs(0.1, 2, 2, size=500, random_state=1)
+    u = np.linspace(2, 5, 4)
+    shape, mod_scale, phats = fitgenparrange(data, u=u, num_workers=2,
+                                             chunksize=2)
+    assert np.all(phats['success'])
+    assert_array_equal(phats['n'], [(data > ui).sum() for ui in u])
+    for ui, phat in zip(u, phats):
+        fit = genpareto.fit2(data[data > ui], floc=ui)
+        assert_allclose(phat['par'], fit.par, rtol=1e-3, atol=1e-3)
+    c, scale = phats['par'][:, 0], phats['par'][:, 2]
+    assert_allclose(shape.data, c)
+    assert_allclose(mod_scale.data, scale - c * u)
+    lower, upper = mod_scale.children[0].data.T
+    assert np.all((lower < mod_scale.data) & (mod_scale.data < upper))
+
+
+def test_fitgenparrange_process_pool():
+    _check_exits("""
+import numpy as np
+from wafo.stats import genpareto
+from wafo.stats.core import fitgenparrange
+data = genpareto.rvs(0.1, 2, 2, size=500, random_state=1)
+u = np.linspace(2, 5, 4)
+phats = fitgenparrange(data, u=u, num_workers=2, pool='process')[-1]
+phats1 = fitgenparrange(data, u=u, num_workers=1)[-1]
+assert np.all(phats['success'])
+assert np.allclose(phats['par'], phats1['par'])
+""")
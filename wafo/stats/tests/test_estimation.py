@@ -0,0 +1,210 @@
+from __future__ import division
+import subprocess
+import sys
+import time
+import numpy as np
+from numpy.testing import assert_allclose
+
+from wafo import stats
+from wafo.stats._constants import _EPS
+
+
+def _check_exits(code, timeout=300):
+    """Run code in a new interpreter and check that it exits cleanly."""
+    proc = subprocess.Popen([sys.executable, '-c', code])
+    deadline = time.time() + timeout
+    while proc.poll() is None:
+        if time.time() > deadline:
+            proc.kill()
+            raise AssertionError('The interpreter did not exit within '
+                                 '{} s'.format(timeout))
+        time.sleep(0.1)
+    assert proc.returncode == 0
+
+
+def _loop_hessian(fun, theta, data, delta):
+    num_par = len(theta)
+    H = np.zeros((num_par, num_par))
+    eye = np.eye(num_par) * delta
+    f0 = fun(theta, data)
+    for i in range(num_par):
+        H[i, i] = (fun(theta + eye[i], data) - 2 * f0 +
+                   fun(theta - eye[i], data)) / delta**2
+        for j in range(i + 1, num_par):
+            d2f = (fun(theta + eye[i] + eye[j], data) -
+                   fun(theta + eye[i] - eye[j], data) -
+                   fun(theta - eye[i] + eye[j], data) +
+                   fun(theta - eye[i] - eye[j], data))
+            H[i, j] = H[j, i] = d2f / (4 * delta**2)
+    return -H
+
+
+def test_vectorized_fitfun():
+    np.random.seed(1234)
+    for distname, arg in [('weibull_min', (1.5,)), ('genpareto', (0.1,)),
+                          ('beta', (2., 3.))]:
+        distfn = getattr(stats, distname)
+        data = np.sort(distfn.rvs(size=100, *arg))
+        num_par = len(arg) + 2
+        thetas = (np.array(list(arg) + [0., 1.])[:, None] +
+                  np.random.uniform(-0.2, 0.2, size=(num_par, 20)))
+        thetas[-1, 0] = -1  # invalid scale
+        thetas[-2, 1] = data[50]  # data outside support
+        for name in ['_penalized_nnlf', '_penalized_nlogps']:
+            fun = getattr(distfn, name)
+            desired = [fun(theta, data) for theta in thetas.T]
+            actual = getattr(distfn, name + '_vec')(thetas, data)
+            assert_allclose(actual, desired, rtol=1e-12)
+
+
+def test_hessian():
+    np.random.seed(1234)
+    for distname, arg in [('weibull_min', (1.5,)), ('genextreme', (-0.1,)),
+                          ('norm', ()), ('gumbel_r', ())]:
+        distfn = getattr(stats, distname)
+        data = distfn.rvs(size=500, *arg)
+        for method in ['ml', 'mps']:
+            phat = distfn.fit2(data, method=method)
+            delta = (_EPS ** 0.25 + 2.) - 2.
+            desired = _loop_hessian(phat._fitfun, phat.par, phat.data, delta)
+            actual = phat._hessian(phat._fitfun, phat.par, phat.data)
+            atol = 1e-5 * np.abs(desired).max()
+            assert_allclose(actual, desired, rtol=1e-5, atol=atol)
+            assert_allclose(phat.H, desired, rtol=1e-5, atol=atol)
+
+
+def test_nlogps_tails():
+    # The upper tail spacings are lost if computed from differences in cdf
+    c = 0.1
+    sf = np.array([1e-10, 1e-20, 1e-30])
+    x = stats.genpareto.isf(sf, c)
+    dprb = [-np.expm1(np.log(sf[0])), sf[0] - sf[1], sf[1] - sf[2], sf[2]]
+    assert_allclose(stats.genpareto._penalized_nlogps([c, 0, 1], x),
+                    -np.sum(np.log(dprb)), rtol=1e-10)
+
+
+def test_nlogps_grad():
+    np.random.seed(1234)
+    for distname, arg in [('genpareto', (0.2,)), ('genpareto', (1e-7,)),
+                          ('genextreme', (-0.1,)), ('genextreme', (0.2,)),
+                          ('weibull_min', (1.5,)), ('gumbel_r', ())]:
+        distfn = getattr(stats, distname)
+        assert distfn._has_nlogps_grad()
+        data = distfn.rvs(size=200, *arg)
+        for x in [data, np.round(data, 1)]:  # without and with ties
+            theta = np.hstack((arg, -0.01, 1.1))
+            actual = distfn._penalized_nlogps_grad(theta, x)
+            delta = _EPS ** (1. / 3)
+            steps = delta * np.eye(len(theta))
+            desired = [(distfn._penalized_nlogps(theta + step, x) -
+                        distfn._penalized_nlogps(theta - step, x)) /
+                       (2 * delta) for step in steps]
+            assert_allclose(actual, desired, rtol=1e-6, atol=1e-6)
+    assert not stats.gamma._has_nlogps_grad()
+
+
+def test_fit_many():
+    data = stats.genextreme.rvs(-0.1, size=(5, 100), random_state=3)
+    mask = np.zeros(data.shape, dtype=bool)
+    mask[1, 60:] = True
+    data[3, 80:] = np.nan
+    phats = stats.genextreme.fit_many(data, mask=mask, num_workers=2,
+                                      chunksize=2)
+    assert_allclose(phats['n'], [100, 60, 100, 80, 100])
+    assert np.all(phats['success'])
+    samples = [data[0], data[1, :60], data[3, :80]]
+    for phat, sample in zip(phats[[0, 1, 3]], samples):
+        fit = stats.genextreme.fit2(sample)
+        assert_allclose(phat['par'], fit.par, rtol=0.05, atol=1e-3)
+        assert_allclose(phat['LLmax'], fit.LLmax, rtol=1e-4)
+
+    phats = stats.norm.fit_many([data[0], []], num_workers=1)
+    assert_allclose(phats['success'], [True, False])
+    assert np.all(np.isnan(phats['par'][1]))
+
+
+def test_fit_many_process_pool():
+    _check_exits("""
+import numpy as np
+from wafo import stats
+data = stats.genpareto.rvs(0.1, size=(4, 100), random_state=1)
+phats = stats.genpareto.fit_many(data, floc=0, num_workers=2, pool='process')
+assert np.all(phats['success'])
+phats1 = stats.genpareto.fit_many(data, floc=0, num_workers=1)
+assert np.allclose(phats['par'], phats1['par'])
+""")
+
+
+def test_profile_root_mode():
+    data = stats.genpareto.rvs(0.1, size=200, random_state=1)
+    phat = stats.genpareto.fit2(data, floc=0)
+    x = phat.isf(1e-3)
+    for profile, kwds in [(phat.profile, dict(i=0)),
+                          (phat.profile, dict(i=2)),
+                          (phat.profile_quantile, dict(x=x, i=2))]:
+        desired = profile(**kwds).get_bounds()
+        lp = profile(mode='root', **kwds)
+        assert_allclose(lp.get_bounds(), desired, rtol=1e-3, atol=1e-3)
+        assert len(lp.args) < 20
+        assert_allclose(lp.get_bounds(0.1), profile(**kwds).get_bounds(0.1),
+                        rtol=1e-3, atol=1e-3)
+
+    profiles = stats.estimation.compute_profiles(phat, i=[0, 2], x=x,
+                                                 i_link=2, mode='root',
+                                                 num_workers=2)
+    assert_allclose(profiles[2].get_bounds(),
+                    phat.profile_quantile(x, i=2).get_bounds(), rtol=1e-3)
+
+
+def test_compute_profiles_process_pool():
+    _check_exits("""
+import numpy as np
+from wafo import stats
+from wafo.stats.estimation import compute_profiles
+data = stats.genpareto.rvs(0.1, size=200, random_state=1)
+phat = stats.genpareto.fit2(data, floc=0)
+profiles = compute_profiles(phat, i=[0, 2], i_link=2, mode='root',
+                            num_workers=2, pool='process')
+assert all(profile.fit_dist is phat for profile in profiles)
+assert np.allclose(profiles[0].get_bounds(),
+                   phat.profile(i=0, mode='root').get_bounds())
+""")
+
+
+def test_bootstrap():
+    data = stats.genpareto.rvs(0.1, size=40, random_state=2)
+    phat = stats.genpareto.fit2(data, floc=0)
+    boot = phat.bootstrap(num_samples=40, sf=0.01, seed=3, num_workers=1)
+    assert boot.replicates.shape == (40, 4) and np.all(boot.success)
+    assert_allclose(boot.theta, np.hstack((phat.par, phat.isf(0.01))))
+    assert np.all(boot.replicates[:, 1] == 0)
+    boot2 = stats.estimation.Bootstrap(phat, num_samples=40, sf=0.01,
+                                       seed=3, num_workers=2, chunksize=1)
+    assert_allclose(boot2.replicates, boot.replicates)
+
+    jack = boot.jackknife()
+    assert jack.shape == (40, 4)
+    fit = stats.genpareto.fit2(phat.data[1:], floc=0)
+    assert_allclose(jack[0, :3], fit.par, rtol=1e-3, atol=1e-3)
+    for method in ['bca', 'percentile', 'basic']:
+        lower, upper = boot.get_bounds(alpha=0.1, method=method)
+        assert lower[1] == upper[1] == 0
+        assert np.all(lower <= boot.theta) and np.all(boot.theta <= upper)
+
+    boot3 = phat.bootstrap(num_samples=10, kind='parametric', seed=3,
+                           num_workers=1)
+    assert np.all(boot3.success)
+    assert not np.allclose(boot3.replicates, boot.replicates[:10, :3])
+
+
+def test_bootstrap_process_pool():
+    _check_exits("""
+import numpy as np
+from wafo import stats
+data = stats.genpareto.rvs(0.1, size=40, random_state=2)
+phat = stats.genpareto.fit2(data, floc=0)
+boot = phat.bootstrap(num_samples=40, sf=0.01, seed=3, num_workers=2,
+                      pool='process', chunksize=1)
+boot1 = phat.bootstrap(num_samples=40, sf=0.01, seed=3, num_workers=1)
+assert np.allclose(boot.replicates, boot1.replicates)
+""")
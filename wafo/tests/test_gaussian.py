@@ -4,13 +4,16 @@ Created on 17. juli 2010
 @author: pab
 '''
 import unittest
+import pytest
 import numpy as np
 from numpy import pi, inf
-from numpy.testing import assert_array_almost_equal
+from numpy.testing import assert_array_almost_equal, assert_allclose
+from scipy.special import stdtr, ndtr
 from wafo.gaussian import (Rind, prbnormtndpc, prbnormndpc, prbnormnd,
-                           cdfnorm2d, prbnorm2d)
+                           cdfnorm2d, prbnorm2d, mvn, rindmod)
 
 
+@pytest.mark.skipif(rindmod is None, reason='rindmod is not compiled')
 def test_rind():
 
     Et = 0.001946  # exact prob.
@@ -21,7 +24,7 @@ def test_rind():
     m = np.zeros(n)
     rho = 0.3
     Sc = (np.ones((n, n)) - np.eye(n)) * rho + np.eye(n)
-    rind = Rind()
+    rind = Rind(engine='fortran')
     E0, err0, terr0 = rind(Sc, m, Blo, Bup, indI)
 
     assert(np.abs(E0 - Et) < 2*(err0 + terr0))
@@ -59,7 +62,7 @@ def test_rind():
     Blo2 = 0
     Bup2 = np.inf
     indI2 = [-1, 1]
-    rind2 = Rind(method=1)
+    rind2 = Rind(method=1, engine='fortran')
 
     def g2(x):
         return (x * (np.pi / 2 + np.arcsin(x)) +
@@ -82,6 +85,40 @@ def test_rind():
 #     array([  1.00000000e-10])
 
 
+def test_rind_numba():
+    n = 5
+    indI = np.array([-1, n - 1], dtype=int)
+    m = np.zeros(n)
+    Sc = (np.ones((n, n)) - np.eye(n)) * 0.3 + np.eye(n)
+    rind = Rind(engine='numba', seed=1)
+    E0, err0, terr0 = rind(Sc, m, -inf, -1.2, indI)
+    assert_allclose(E0, 0.001946, atol=1e-5)
+    assert(err0 < 1e-5)
+    assert_array_almost_equal(terr0, 0)
+
+    # E( abs(X1*X2*...*X5) * I{X < -1.2} )
+    Blo = np.array([[-37.]])
+    val, err, _terr = rind(Sc, m, Blo, -1.2, indI, np.zeros((0, 1)), nt=0)
+    assert_allclose(val, 0.0553, rtol=3e-2)
+
+    # E( X2^{+} | X1 = x) * f_X1(x) with mean and correlation
+    rho, mu, sig = 0.6, np.array([0.2, 0.1]), np.sqrt(1.3 - 0.6 ** 2)
+    xc = np.array([[0.8, -0.4]])
+    val, err, _terr = rind([[1.3, rho], [rho, 1]], mu, 0, inf, [-1, 0], xc,
+                           nt=0)
+    mc = (mu[0] + rho * (xc[0] - mu[1])) / sig
+    true_val = (mc * ndtr(mc) + np.exp(-mc ** 2 / 2) / np.sqrt(2 * pi)
+                ) * sig * np.exp(-(xc[0] - mu[1]) ** 2 / 2) / np.sqrt(2 * pi)
+    assert_allclose(val, true_val, atol=3 * err.max())
+
+    # results of batch are the same as separate calls
+    problems = [(Sc, m, -inf, -1.2, indI),
+                ([[1.3, rho], [rho, 1]], mu, 0, inf, [-1, 0], xc, 0)]
+    results = rind.batch(problems, num_workers=2)
+    for problem, result in zip(problems, results):
+        assert_allclose(result, rind(*problem))
+
+
 def test_prbnormtndpc():
 
     rho2 = np.random.rand(2)
@@ -130,6 +167,7 @@ def test_prbnormndpc():
     assert(np.abs(E3 - val3) < err3)
 
 
+@pytest.mark.skipif(mvn is None, reason='mvn is not compiled')
 def test_prbnormnd():
 
     Et = 0.001946  # exact prob.
@@ -148,6 +186,67 @@ def test_prbnormnd():
     assert(t == 'val = 0.00195')
 
 
+def test_prbnormnd_qmc():
+    Et = 0.001946  # exact prob.
+    n = 5
+    Sc = (np.ones((n, n)) - np.eye(n)) * 0.3 + np.eye(n)
+    A = np.repeat(-np.inf, n)
+    B = np.repeat(-1.2, n)
+    # 2-D limits use the lattice rules also when mvn is available
+    val, err, inform = prbnormnd(Sc, A, B[None], random_state=1)
+    assert inform[0] == 0
+    assert err[0] <= 1e-4
+    assert np.abs(val[0] - Et) < 1e-4
+
+
+def test_prbnormnd_batch():
+    Et = 0.001946  # exact prob.
+    n = 5
+    Sc = (np.ones((n, n)) - np.eye(n)) * 0.3 + np.eye(n)
+    A = np.repeat(-np.inf, n)
+    B = np.vstack((np.repeat(-1.2, n), np.repeat(0, n), np.repeat(np.inf, n)))
+    val, err, inform = prbnormnd(Sc, A, B, abseps=1e-5, maxpts=10**6,
+                                 random_state=1)
+    assert val.shape == err.shape == inform.shape == (3,)
+    assert np.all(inform == 0)
+    assert np.abs(val[0] - Et) < err[0]
+    assert_allclose(val[2], 1)
+    val1, err1, _inform1 = prbnormnd(Sc, A, B[1], abseps=1e-5, maxpts=10**6)
+    assert np.abs(val1 - val[1]) < err1 + err[1]
+    val2, _err2, _inform2 = prbnormnd(Sc, A, B, abseps=1e-5, maxpts=10**6,
+                                      random_state=1, num_workers=2)
+    assert_allclose(val2, val)
+
+
+def test_prbnormndpc_batch():
+    rng = np.random.RandomState(0)
+    rho = rng.rand(3)
+    b = rng.randn(20, 3)
+    a = b - 2 * rng.rand(20, 3)
+    val, err, ier = prbnormndpc(rho, a, b, abserr=1e-10, relerr=0)
+    assert val.shape == (20,) and np.all(ier == 0) and np.all(err < 1e-9)
+    correl = np.outer(rho, rho) + np.diag(1 - rho**2)
+    val2, err2, _inform2 = prbnormnd(correl, a, b, abseps=1e-5, releps=0,
+                                     maxpts=10**6, random_state=2)
+    assert np.all(err2 < 1e-5)
+    assert_allclose(val2, val, atol=2e-5)
+
+    val3, _err3, _ift3 = prbnormtndpc(rho, a, b, num_workers=2)
+    assert_allclose(val3, val, atol=1e-4)
+
+    # orthant probability is the same for the normal and T distributions
+    E3 = 0.5 - sum(np.sort(np.arccos([rho[0] * rho[1], rho[0] * rho[2],
+                                      rho[1] * rho[2]]))) / (4 * pi)
+    val4, err4, _ift4 = prbnormtndpc(rho, np.zeros((2, 3)),
+                                     np.full((2, 3), inf), df=4)
+    assert_allclose(val4, E3, atol=1e-6)
+    assert np.all(err4 < 1e-4)
+    val5, _err5, _ift5 = prbnormtndpc([0.5], [[-inf], [-1]], [[1.3], [2]],
+                                      df=3)
+    assert_allclose(val5, [stdtr(3, 1.3), stdtr(3, 2) - stdtr(3, -1)],
+                    atol=1e-6)
+
+
 def test_cdfnorm2d():
     x = np.linspace(-3, 3, 3)
     [b1, b2] = np.meshgrid(x, x)
@@ -157,6 +256,20 @@ def test_cdfnorm2d():
              [1.34987703e-03, 4.99795143e-01, 9.97324055e-01]]
     assert_array_almost_equal(cdfnorm2d(b1, b2, r), truth)
 
+    r = np.array([-1, -0.95, -0.8, -0.5, -0.1, 0, 0.2, 0.6, 0.9, 0.99, 1])
+    F = cdfnorm2d(b1[..., None], b2[..., None], r)
+    assert F.shape == (3, 3, 11)
+    assert_allclose(cdfnorm2d(b1[..., None], b2[..., None], r, parallel=True),
+                    F)
+    for j in [1, 2, 3, 7]:  # compare with the product correlation integral
+        rho = np.sqrt(np.abs(r[j])) * np.array([1, np.sign(r[j])])
+        for x1, x2, Fj in zip(b1.ravel(), b2.ravel(), F[..., j].ravel()):
+            val, _err, _ier = prbnormndpc(rho, [-inf, -inf], [x1, x2],
+                                          abserr=1e-13, relerr=0)
+            assert_allclose(Fj, val, atol=1e-13)
+    assert_allclose(F[..., -1], np.minimum(*ndtr([b1, b2])), atol=1e-15)
+    assert_allclose(cdfnorm2d([inf, 0], [0, -inf], 0.5), [0.5, 0])
+
 
 def test_prbnorm2d():
 
@@ -165,6 +278,21 @@ def test_prbnorm2d():
     r = 0.3
     assert_array_almost_equal(prbnorm2d(a, b, r), 0.56659121)
 
+    rng = np.random.RandomState(0)
+    a = rng.randn(50, 2)
+    b = a + 3 * rng.rand(50, 2)
+    a[::3, 0] = -inf
+    b[::4, 1] = inf
+    a[::5, 1] = -inf
+    r = 2 * rng.rand(50) - 1
+    prb = prbnorm2d(a, b, r)
+    assert prb.shape == (50,)
+    assert_allclose(prbnorm2d(a, b, r, parallel=True), prb)
+    for ai, bi, ri, prbi in zip(a, b, r, prb):
+        rho = np.sqrt(np.abs(ri)) * np.array([1, np.sign(ri)])
+        val, _err, _ier = prbnormndpc(rho, ai, bi, abserr=1e-13, relerr=0)
+        assert_allclose(prbi, val, atol=1e-13)
+
 if __name__ == '__main__':
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
@@ -13,7 +13,7 @@ from wafo.misc import (JITImport, Bunch, detrendma, DotDict, findcross, ecross,
                        findoutliers, common_shape, argsreduce, stirlerr,
                        getshipchar, betaloge,
                        gravity, nextpow2, discretize, polar2cart,
-                       cart2polar, tranproc,
+                       cart2polar, tranproc, TranTable,
                        rotation_matrix, rotate_2d, spaceline,
                        args_flat, sub2index, index2sub, piecewise,
                        parse_kwargs)
@@ -449,6 +449,22 @@ def test_tranproc():
                   0.86643821, 0.83096482]))
 
 
+def test_trantable():
+    import wafo.transform.models as wtm
+    tr = wtm.TrHermite()
+    x = linspace(-5, 5, 501)
+    g = tr(x)
+    table = TranTable(x, g)
+    x0 = linspace(-4.5, 4.5, 12).reshape(3, 4)
+    x1, x2, x3 = np.cos(x0), np.sin(x0), -np.cos(x0)
+    y = table(x0, x1, x2, x3)
+    for i in range(3):
+        true_y = tranproc(x, g, x0[i], x1[i], x2[i], x3[i])
+        for yk, true_yk in zip(y, true_y):
+            assert_array_almost_equal(yk[i], true_yk)
+    assert_array_almost_equal(table(x0), y[0])
+
+
 class TestPiecewise(TestCase):
 
     def test_condition_is_single_bool_list(self):
@@ -1,34 +1,67 @@
-from wafo.transform import TrData
-import numpy as np
-
-
-def test_trdata():
-    '''
-    Construct a linear transformation model
-    '''
-    sigma = 5
-    mean = 1
-    u = np.linspace(-5, 5)
-    x = sigma * u + mean
-    y = u
-    g = TrData(y, x)
-    assert(g.mean == 1.0)
-    print(g.sigma)
-    # assert(g.sigma==5.0)
-
-    g = TrData(y, x, mean=1, sigma=5)
-    assert(g.mean == 1)
-    assert(g.sigma == 5.)
-    # vals = g.dat2gauss(1, 2, 3)
-    # true_vals = [np.array([0.]), np.array([0.4]), np.array([0.6])]
-
-    vals = g.dat2gauss([0, 1, 2, 3])
-    true_vals = np.array([-0.2, 0., 0.2, 0.4])
-    assert((np.abs(vals - true_vals) < 1e-7).all())
-    # Check that the departure from a Gaussian model is zero
-    assert(g.dist2gauss() < 1e-16)
-
-
-if __name__ == '__main__':
-    import nose
-    nose.run()
+from wafo.transform import TrData
+from wafo.transform.estimation import CrossingCounter, TransformEstimator
+import numpy as np
+
+
+def test_trdata():
+    '''
+    Construct a linear transformation model
+    '''
+    sigma = 5
+    mean = 1
+    u = np.linspace(-5, 5)
+    x = sigma * u + mean
+    y = u
+    g = TrData(y, x)
+    assert(g.mean == 1.0)
+    print(g.sigma)
+    # assert(g.sigma==5.0)
+
+    g = TrData(y, x, mean=1, sigma=5)
+    assert(g.mean == 1)
+    assert(g.sigma == 5.)
+    # vals = g.dat2gauss(1, 2, 3)
+    # true_vals = [np.array([0.]), np.array([0.4]), np.array([0.6])]
+
+    vals = g.dat2gauss([0, 1, 2, 3])
+    true_vals = np.array([-0.2, 0., 0.2, 0.4])
+    assert((np.abs(vals - true_vals) < 1e-7).all())
+    # Check that the departure from a Gaussian model is zero
+    assert(g.dist2gauss() < 1e-16)
+
+
+def test_crossing_counter():
+    x = np.sin(np.linspace(0, 20 * np.pi, 2001)) + np.linspace(0, 1, 2001)
+    levels = np.linspace(-1, 2, 31)
+    counter = CrossingCounter(levels)
+    for chunk in np.array_split(x, 7):
+        counter.update(chunk)
+    true_counts = [np.sum((x[:-1] < u) & (x[1:] >= u)) for u in levels]
+    assert((counter.counts == true_counts).all())
+    assert(np.abs(counter.mean - x.mean()) < 1e-12)
+    assert(np.abs(counter.sigma - x.std()) < 1e-12)
+
+    # the columns are separate records
+    X = np.column_stack((x, x[::-1]))
+    counter = CrossingCounter(levels)
+    for chunk in np.array_split(X, 7):
+        counter.update(chunk)
+    true_counts2 = [np.sum((x[-1:0:-1] < u) & (x[-2::-1] >= u))
+                    for u in levels]
+    assert((counter.counts == np.add(true_counts, true_counts2)).all())
+    assert(np.abs(counter.sigma - X.std()) < 1e-12)
+
+
+if __name__ == '__main__':
+    import nose
+    nose.run()
+
+
+def test_transform_estimator_ntr():
+    import wafo.data as wd
+    import wafo.objects as wo
+    ts = wo.mat2timeseries(wd.sea()[:2000])
+    g_n = TransformEstimator(method='nonlinear')(ts)[0]
+    for ntr in [np.inf, 0]:
+        g_b = TransformEstimator(method='binned', ntr=ntr)(ts)[0]
+        assert(np.allclose(g_b.data, g_n.data))